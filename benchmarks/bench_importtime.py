@@ -0,0 +1,85 @@
+"""
+  Startup-time budget of the dojo CLI, measured with python -X importtime.
+
+  Fails (exit code 1) if importing dojocli.cli takes longer than the budget,
+  or if the CLI or the dojo api client import the Docker stack at load time.
+
+  Usage: python benchmarks/bench_importtime.py [budget in ms] [repeats]
+"""
+
+from os.path import abspath, dirname
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+# Modules only commands that run containers may load.
+DOCKER_STACK = ("docker", "tqdm", "tarfile")
+
+# Modules that must load without the Docker stack.
+LIGHT_MODULES = ("dojocli.cli", "dojocli.dojo_client")
+
+
+def import_time_us(module: str):
+    """
+    Cumulative import time of module in a fresh interpreter, in microseconds.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1])
+    raise RuntimeError(f"no importtime line for {module}")
+
+
+def loaded_docker_stack(module: str):
+    """
+    The DOCKER_STACK modules loaded by importing module in a fresh interpreter.
+    """
+
+    code = f"import sys, {module}; print(' '.join(m for m in {DOCKER_STACK!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    return result.stdout.split()
+
+
+def main(budget_ms: float = 80.0, repeats: int = 5):
+    failed = False
+
+    for module in LIGHT_MODULES:
+        loaded = loaded_docker_stack(module)
+        if len(loaded) > 0:
+            print(f"FAIL: importing {module} loads {', '.join(loaded)}")
+            failed = True
+
+    # The fastest run is the least disturbed by other load on the machine.
+    timings = [import_time_us("dojocli.cli") / 1000 for _ in range(repeats)]
+    best = min(timings)
+    print(f"import dojocli.cli : {best:7.1f} ms best of {repeats} (budget {budget_ms:.0f} ms)")
+    if best > budget_ms:
+        print(f"FAIL: dojocli.cli import time is over budget")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    sys.exit(
+        main(
+            budget_ms=float(args[0]) if len(args) > 0 else 80.0,
+            repeats=int(args[1]) if len(args) > 1 else 5,
+        )
+    )
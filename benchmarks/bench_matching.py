@@ -0,0 +1,73 @@
+"""
+  Benchmark of OutputMatcher against the per-pattern fnmatch loop it replaced,
+  on a synthetic container diff.
+
+  Usage: python benchmarks/bench_matching.py [diff entries] [patterns]
+"""
+
+from os.path import abspath, dirname
+from time import perf_counter
+import fnmatch
+import sys
+
+sys.path.append(dirname(dirname(abspath(__file__))))
+
+from dojocli.matching import OutputMatcher
+
+
+def match_pattern_output_path(array_of_files, outputs):
+    # The matching previously done by DockerClient.match_pattern_output_path().
+    new_outputs = []
+    for output in outputs:
+        for file_changed in array_of_files:
+            if fnmatch.fnmatch(file_changed.get("Path", ""), output):
+                new_outputs.append(file_changed.get("Path"))
+    return new_outputs
+
+
+def build_diff(entries: int):
+    """
+    Build a container diff of about entries paths: an unpacked dataset and a
+    temp folder, with a few hundred model outputs among them.
+    """
+
+    diff = [{"Path": "/model", "Kind": 0}, {"Path": "/model/output", "Kind": 0}]
+    for idx in range(entries - 400):
+        folder = "/data/unpacked" if idx % 3 else "/tmp/scratch"
+        diff.append({"Path": f"{folder}/{idx // 1000:04d}/chunk_{idx}.bin", "Kind": 1})
+    for idx in range(200):
+        diff.append({"Path": f"/model/output/result_{idx}.nc", "Kind": 1})
+        diff.append({"Path": f"/model/output/result_{idx}.csv", "Kind": 1 if idx % 10 else 2})
+    return diff
+
+
+def build_patterns(count: int):
+    patterns = ["/model/output/*.nc", "/model/output/*.csv", "/model/output/result_1*"]
+    patterns += [f"/model/output/extra_{idx}/*.tif" for idx in range(max(count - len(patterns), 0))]
+    return patterns[:count]
+
+
+def main(entries: int = 500000, pattern_count: int = 5):
+    diff = build_diff(entries)
+    patterns = build_patterns(pattern_count)
+
+    start = perf_counter()
+    old = match_pattern_output_path(diff, patterns)
+    old_seconds = perf_counter() - start
+
+    start = perf_counter()
+    new = OutputMatcher(patterns).match_diff(diff)
+    new_seconds = perf_counter() - start
+
+    deleted = {entry["Path"] for entry in diff if entry["Kind"] == 2}
+    assert set(new) == set(old) - deleted
+    assert len(new) == len(set(new))
+
+    print(f"diff: {len(diff)} entries, {len(patterns)} patterns")
+    print(f"fnmatch loop  : {old_seconds * 1000:9.1f} ms, {len(old)} paths ({len(old) - len(set(old))} duplicates)")
+    print(f"OutputMatcher : {new_seconds * 1000:9.1f} ms, {len(new)} paths")
+    print(f"speedup       : {old_seconds / new_seconds:9.1f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+"""
+  Micro-benchmark of ParameterTemplate against the replace_along_params
+  substitution it replaced.
+
+  Usage: python benchmarks/bench_templating.py [template size in KB] [parameter count] [renders]
+"""
+
+from os.path import abspath, dirname
+from timeit import timeit
+import sys
+
+sys.path.append(dirname(dirname(abspath(__file__))))
+
+from dojocli.templating import ParameterTemplate
+
+
+def replace_along_params(string, new_values, available_parameters):
+    # The substitution previously used by DojoClient.run_model().
+    for param in sorted(available_parameters, key = lambda param: param['start'], reverse=True):
+        name = param["annotation"]["name"]
+        value = new_values[name] if name in new_values else param["annotation"]["default_value"]
+        string = string[:param["start"]] + str(value) + string[param["end"]:]
+    return string
+
+
+def build_template(size_kb: int, parameter_count: int):
+    """
+    Build a namelist-like template of about size_kb KB with parameter_count
+    evenly spaced parameter spans.
+    """
+
+    line = "variable_name = 0.000000\n"
+    content = line * (size_kb * 1024 // len(line))
+    step = len(content) // parameter_count
+    parameters = []
+    for idx in range(parameter_count):
+        start = idx * step + line.index("0.000000")
+        parameters.append(
+            {
+                "start": start,
+                "end": start + len("0.000000"),
+                "annotation": {"name": f"param_{idx}", "default_value": "0.000000"},
+            }
+        )
+    return content, parameters
+
+
+def main(size_kb: int = 2048, parameter_count: int = 200, renders: int = 20):
+    content, parameters = build_template(size_kb, parameter_count)
+    values = {f"param_{idx}": idx * 1.5 for idx in range(parameter_count)}
+
+    template = ParameterTemplate(content, parameters)
+    assert template.render(values) == replace_along_params(content, values, parameters)
+
+    old = timeit(lambda: replace_along_params(content, values, parameters), number=renders)
+    compile_time = timeit(lambda: ParameterTemplate(content, parameters), number=1)
+    new = timeit(lambda: template.render(values), number=renders)
+
+    print(f"template: {len(content) / 1024:.0f} KB, {parameter_count} parameters, {renders} renders")
+    print(f"replace_along_params : {old / renders * 1000:9.3f} ms/render")
+    print(f"ParameterTemplate    : {new / renders * 1000:9.3f} ms/render (+ {compile_time * 1000:.3f} ms to compile once)")
+    print(f"speedup              : {old / new:9.1f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
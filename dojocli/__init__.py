@@ -1,5 +1,44 @@
-"""Top-level package for dojo-cli."""
+"""Top-level package for dojo-cli.
+
+The library API, e.g. for services that run models from Python:
+
+    from dojocli import DojoClient, DojoConfig
+
+    client = DojoClient(DojoConfig.from_file(".config"), verbose=False)
+    result = client.run("CHIRPS-Monthly", params={"year": 2021})
+
+The names below are imported on first use, so that importing the package
+stays cheap for the CLI.
+"""
 
 __author__ = """Robnet Kerns"""
 __email__ = "robnet@jataware.com"
 __version__ = "0.1.7"
+
+# Public names of the library API and the modules they live in.
+API = {
+    "DojoClient": "dojocli.dojo_client",
+    "shared_docker_client": "dojocli.dojo_client",
+    "shared_session": "dojocli.dojo_client",
+    "DojoConfig": "dojocli.config",
+    "DojoError": "dojocli.exceptions",
+    "DojoApiError": "dojocli.exceptions",
+    "ConfigError": "dojocli.exceptions",
+    "ModelNotFoundError": "dojocli.exceptions",
+    "ModelImageError": "dojocli.exceptions",
+    "DockerImageError": "dojocli.exceptions",
+    "ContainerNotFoundError": "dojocli.exceptions",
+    "DockerUnavailableError": "dojocli.exceptions",
+    "TemplateError": "dojocli.exceptions",
+    "ConfigTemplateError": "dojocli.exceptions",
+}
+
+__all__ = list(API)
+
+
+def __getattr__(name: str):
+    if name in API:
+        from importlib import import_module
+
+        return getattr(import_module(API[name]), name)
+    raise AttributeError(f"module 'dojocli' has no attribute {name!r}")
@@ -0,0 +1,196 @@
+"""
+  Content-addressed store of model output files, shared by run folders through
+  reflinks or hardlinks.
+"""
+
+from hashlib import sha256
+from threading import get_ident
+import os
+import shutil
+
+# Size of the reads used to hash and store files.
+BLOB_BUFFER_SIZE = 1024 * 1024
+
+# ioctl request cloning a whole file (Linux FICLONE), used for reflinks on
+# copy-on-write filesystems such as btrfs and XFS.
+FICLONE = 0x40049409
+
+
+def reflink(source: str, destination: str):
+    """
+    Description
+    -----------
+        Make destination a copy-on-write clone of source. Raises OSError where
+        the platform or filesystem does not support it.
+    """
+
+    import fcntl
+
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+
+
+class BlobStore(object):
+    """
+    Description
+    -----------
+        Stores each distinct file content once, as {root}/{aa}/{sha256} where
+        aa is the first two hex digits of the digest. Run folders get their
+        files from the store as reflinks where the filesystem supports them,
+        else as hardlinks, else as plain copies, so duplicate outputs across
+        runs cost no extra disk space or copy time.
+
+        Stored blobs are read-only. A hardlinked run file is the blob itself,
+        so it is read-only too; a reflinked run file is an independent
+        copy-on-write clone.
+
+    Parameters
+    ----------
+        root: str
+            Store directory. It should be on the same filesystem as the run
+            folders, or every file falls back to a copy.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @classmethod
+    def from_config(cls, config: dict):
+        root = config.get("BLOB_STORE_DIR") or os.path.join(os.getcwd(), "runs", ".blobs")
+        return cls(os.path.expanduser(root))
+
+    def blob_path(self, digest: str):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, fileobj, mode: int = 0o644, on_chunk=None):
+        """
+        Description
+        -----------
+            Store the contents of a file object, hashing it as it streams to a
+            temporary file in the store. Content already in the store is
+            discarded.
+
+        Parameters
+        ----------
+            fileobj:
+                Binary file object to read until exhausted.
+            mode: int = 0o644
+                Mode of the source file; the blob keeps its execute bits.
+            on_chunk: callable = None
+                Called with the size of every chunk read e.g. to update a
+                progress bar.
+
+        Returns
+        -------
+            (sha256 hex digest, True if the content was new to the store).
+        """
+
+        os.makedirs(os.path.join(self.root, "tmp"), exist_ok=True)
+        tmp_path = os.path.join(self.root, "tmp", f"{os.getpid()}.{get_ident()}")
+        digest = sha256()
+        with open(tmp_path, "wb") as fh:
+            while True:
+                chunk = fileobj.read(BLOB_BUFFER_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                fh.write(chunk)
+                if on_chunk is not None:
+                    on_chunk(len(chunk))
+        digest = digest.hexdigest()
+        os.chmod(tmp_path, mode & 0o111 | 0o444)
+
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            # os.link fails if the blob exists, so concurrent writers of the
+            # same content cannot replace each other's blob.
+            os.link(tmp_path, blob_path)
+            new = True
+        except FileExistsError:
+            new = False
+        finally:
+            os.remove(tmp_path)
+        return digest, new
+
+    def materialize(self, digest: str, destination: str):
+        """
+        Description
+        -----------
+            Place the blob of a digest at destination.
+
+        Returns
+        -------
+            "reflink", "hardlink" or "copy", the method used.
+        """
+
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.lexists(destination):
+            os.remove(destination)
+
+        try:
+            reflink(blob_path, destination)
+            return "reflink"
+        except (OSError, ImportError):
+            pass
+        try:
+            os.link(blob_path, destination)
+            return "hardlink"
+        except OSError:
+            shutil.copy2(blob_path, destination)
+            return "copy"
+
+    def blobs(self):
+        """
+        Description
+        -----------
+            List (path, size, link count) of every blob.
+        """
+
+        if not os.path.isdir(self.root):
+            return []
+
+        blobs = []
+        for prefix in os.scandir(self.root):
+            if not prefix.is_dir() or len(prefix.name) != 2:
+                continue
+            for item in os.scandir(prefix.path):
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                blobs.append((item.path, stat.st_size, stat.st_nlink))
+        return blobs
+
+    def size(self):
+        return sum(size for _, size, _ in self.blobs())
+
+    def prune(self):
+        """
+        Description
+        -----------
+            Remove the blobs no run folder hardlinks to. Reflinked and copied
+            run files do not hold a link, so their blobs are removed too; the
+            run files keep their data.
+
+        Returns
+        -------
+            (blobs removed, bytes freed).
+        """
+
+        removed = freed = 0
+        for path, size, links in self.blobs():
+            if links <= 1:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += size
+        return removed, freed
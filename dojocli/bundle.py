@@ -0,0 +1,370 @@
+"""
+  Compressed bundles of model output files, written in one streaming pass from
+  the container with a manifest of per-file sizes and checksums.
+"""
+
+from datetime import datetime
+from hashlib import sha256
+from threading import Lock
+import io
+import json
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+
+# Bundle formats, which are also their file extensions.
+BUNDLE_FORMATS = ("tar.gz", "tar.zst", "zip")
+
+# Name of the manifest, inside the bundle and next to it in the run folder.
+BUNDLE_MANIFEST_FILENAME = "bundle-manifest.json"
+
+# Size of the reads used to stream files into a bundle.
+BUNDLE_BUFFER_SIZE = 1024 * 1024
+
+# Compression levels used unless BUNDLE_LEVEL is set.
+BUNDLE_LEVEL_DEFAULTS = {"tar.gz": 6, "tar.zst": 3, "zip": 6}
+
+# Bytes of a compressed tar.gz member kept in memory by the worker that
+# compresses it before it spills to a temporary file next to the bundle.
+BUNDLE_SPOOL_SIZE = 16 * 1024 * 1024
+
+# Generator polynomial of CRC-32, bit-reversed.
+CRC32_POLYNOMIAL = 0xEDB88320
+
+
+def check_bundle_format(bundle_format: str):
+    """
+    Description
+    -----------
+        Raise ValueError if bundle_format is unknown or its compression
+        library is not installed, so a run fails before the model runs rather
+        than when its outputs are harvested.
+    """
+
+    if bundle_format not in BUNDLE_FORMATS:
+        raise ValueError(
+            f"unknown bundle format {bundle_format}; use one of {', '.join(BUNDLE_FORMATS)}."
+        )
+    if bundle_format == "tar.zst":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError(
+                "tar.zst bundles need the zstandard package: pip install dojo-cli[zstd]"
+            )
+
+
+def gf2_matrix_times(matrix: list, vector: int):
+    total = 0
+    row = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[row]
+        vector >>= 1
+        row += 1
+    return total
+
+
+def gf2_matrix_square(matrix: list):
+    return [gf2_matrix_times(matrix, matrix[row]) for row in range(32)]
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int):
+    """
+    Description
+    -----------
+        The CRC-32 of two byte strings joined, from the CRC-32 of each and the
+        length of the second, as zlib's crc32_combine(), which the zlib module
+        does not expose. Lets tar.gz members compressed in parallel share one
+        gzip trailer.
+    """
+
+    if length2 == 0:
+        return crc1
+
+    # Operators appending one zero bit, then two and four zero bits, to a crc.
+    odd = [CRC32_POLYNOMIAL] + [1 << row for row in range(31)]
+    even = gf2_matrix_square(odd)
+    odd = gf2_matrix_square(even)
+
+    # Append length2 zero bytes to crc1, squaring the operator per bit of
+    # length2, starting from one zero byte.
+    while True:
+        even = gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if length2 == 0:
+            break
+        odd = gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if length2 == 0:
+            break
+    return crc1 ^ crc2
+
+
+class HashingReader(object):
+    """
+    Description
+    -----------
+        File object wrapper computing the sha256 of what is read through it.
+    """
+
+    def __init__(self, fileobj, on_chunk=None):
+        self.fileobj = fileobj
+        self.on_chunk = on_chunk
+        self.digest = sha256()
+
+    def read(self, size=-1):
+        chunk = self.fileobj.read(size)
+        self.digest.update(chunk)
+        if self.on_chunk is not None and chunk:
+            self.on_chunk(len(chunk))
+        return chunk
+
+
+class OutputBundle(object):
+    """
+    Description
+    -----------
+        A compressed archive the harvested files are streamed into, instead of
+        being written to the run folder one by one:
+
+            tar.gz  : gzip compressed tar. Each file is compressed by the copy
+                      worker that streams it, so files compress in parallel,
+                      and is then appended to the one gzip stream.
+            tar.zst : zstandard compressed tar, compressed on every cpu core
+                      by zstd itself (needs the zstandard package). Files are
+                      appended one at a time.
+            zip     : deflate compressed zip, with zip64 records for files and
+                      archives over 4 GB. Files are compressed and appended
+                      one at a time.
+
+        Each file is hashed (sha256) as it streams through. close() adds a
+        manifest of every file's size and checksum to the bundle and writes
+        it next to the bundle.
+
+    Parameters
+    ----------
+        path: str
+            The bundle file e.g. {run folder}/outputs.tar.zst
+        bundle_format: str
+            One of BUNDLE_FORMATS.
+        root: str
+            Folder the archive names are relative to, e.g. the run folder, so
+            {root}/output/result.csv is archived as output/result.csv.
+        level: int = None
+            Compression level; defaults to BUNDLE_LEVEL_DEFAULTS. zipfile
+            takes the level of a zip member only on Python 3.13 and later;
+            earlier versions use zlib's default level, 6.
+    """
+
+    def __init__(self, path: str, bundle_format: str, root: str, level: int = None):
+        check_bundle_format(bundle_format)
+        self.path = path
+        self.format = bundle_format
+        self.root = root
+        self.level = level if level is not None else BUNDLE_LEVEL_DEFAULTS[bundle_format]
+        self.files = []
+        self.lock = Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.archive = None
+        self.compressor = None
+        if bundle_format == "zip":
+            self.archive = zipfile.ZipFile(
+                path, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=self.level
+            )
+        elif bundle_format == "tar.gz":
+            # One gzip member: a header, the raw deflate streams of the tar
+            # members, and a trailer with the crc and size of the whole tar.
+            self.fileobj = open(path, "wb")
+            extra_flags = 2 if self.level == 9 else 4 if self.level == 1 else 0
+            self.fileobj.write(struct.pack("<BBBBIBB", 0x1F, 0x8B, 8, 0, int(time.time()), extra_flags, 255))
+            self.crc = 0
+            self.length = 0
+        else:
+            import zstandard
+
+            self.compressor = zstandard.ZstdCompressor(
+                level=self.level, threads=-1
+            ).stream_writer(open(path, "wb"))
+            self.archive = tarfile.open(fileobj=self.compressor, mode="w|")
+
+    def arcname(self, local_path: str):
+        return os.path.relpath(local_path, self.root).replace(os.sep, "/")
+
+    def add_file(self, local_path: str, member: tarfile.TarInfo, fileobj, on_chunk=None):
+        """
+        Description
+        -----------
+            Stream a file of the container tar stream into the bundle, as if
+            it were written to local_path. Safe to call from several threads.
+
+        Returns
+        -------
+            The sha256 hex digest of the file.
+        """
+
+        arcname = self.arcname(local_path)
+        reader = HashingReader(fileobj, on_chunk)
+        if self.format == "zip":
+            # zip timestamps start in 1980; images often date files 1970.
+            date_time = max(time.localtime(member.mtime)[:6], (1980, 1, 1, 0, 0, 0))
+            info = zipfile.ZipInfo(arcname, date_time)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            if hasattr(zipfile.ZipInfo, "compress_level"):
+                info.compress_level = self.level
+            info.external_attr = (member.mode & 0o777 | 0o600) << 16
+            # The size is known up front, so zipfile writes zip64 records
+            # exactly when they are needed.
+            info.file_size = member.size
+            with self.lock:
+                with self.archive.open(info, "w") as dst:
+                    shutil.copyfileobj(reader, dst, BUNDLE_BUFFER_SIZE)
+                self.files.append({"path": arcname, "size": member.size, "sha256": reader.digest.hexdigest()})
+            return reader.digest.hexdigest()
+
+        info = tarfile.TarInfo(arcname)
+        info.size = member.size
+        info.mode = member.mode & 0o777 | 0o600
+        info.mtime = member.mtime
+        if self.format == "tar.gz":
+            self.add_tar_gz_member(info, reader)
+            with self.lock:
+                self.files.append({"path": arcname, "size": member.size, "sha256": reader.digest.hexdigest()})
+        else:
+            with self.lock:
+                self.archive.addfile(info, reader)
+                self.files.append({"path": arcname, "size": member.size, "sha256": reader.digest.hexdigest()})
+        return reader.digest.hexdigest()
+
+    def add_local_file(self, local_path: str):
+        """
+        Description
+        -----------
+            Add a file already in the run folder, e.g. one collected from an
+            output mount, under its path relative to root. Safe to call from
+            several threads.
+
+        Returns
+        -------
+            The sha256 hex digest of the file.
+        """
+
+        stat = os.stat(local_path)
+        member = tarfile.TarInfo(os.path.basename(local_path))
+        member.size = stat.st_size
+        member.mode = stat.st_mode & 0o777
+        member.mtime = stat.st_mtime
+        with open(local_path, "rb") as fh:
+            return self.add_file(local_path, member, fh)
+
+    def add_tar_gz_member(self, info: tarfile.TarInfo, fileobj):
+        """
+        Description
+        -----------
+            Compress a tar member, header and padding included, into a raw
+            deflate stream in the calling thread, then append it to the
+            bundle under the lock. The stream ends with a sync flush, so the
+            streams of consecutive members join into one valid deflate
+            stream, as in pigz.
+        """
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = 0
+        length = 0
+        with tempfile.SpooledTemporaryFile(BUNDLE_SPOOL_SIZE, dir=os.path.dirname(self.path)) as spool:
+
+            def write(data):
+                nonlocal crc, length
+                crc = zlib.crc32(data, crc)
+                length += len(data)
+                spool.write(compressor.compress(data))
+
+            write(info.tobuf(tarfile.DEFAULT_FORMAT, tarfile.ENCODING, "surrogateescape"))
+            remaining = info.size
+            while remaining > 0:
+                chunk = fileobj.read(min(remaining, BUNDLE_BUFFER_SIZE))
+                if not chunk:
+                    raise OSError(f"unexpected end of data of {info.name}")
+                write(chunk)
+                remaining -= len(chunk)
+            if info.size % tarfile.BLOCKSIZE > 0:
+                write(tarfile.NUL * (tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE))
+            spool.write(compressor.flush(zlib.Z_SYNC_FLUSH))
+
+            spool.seek(0)
+            with self.lock:
+                shutil.copyfileobj(spool, self.fileobj, BUNDLE_BUFFER_SIZE)
+                self.crc = crc32_combine(self.crc, crc, length)
+                self.length += length
+
+    def add_json(self, arcname: str, data: dict):
+        content = json.dumps(data, indent=4).encode()
+        if self.format == "zip":
+            self.archive.writestr(arcname, content)
+            return
+
+        info = tarfile.TarInfo(arcname)
+        info.size = len(content)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        if self.format == "tar.gz":
+            self.add_tar_gz_member(info, io.BytesIO(content))
+        else:
+            self.archive.addfile(info, io.BytesIO(content))
+
+    def close_tar_gz(self):
+        # End the tar with two zero blocks, padded to a whole record as
+        # tarfile does, and the deflate stream with its final block.
+        end = 2 * tarfile.BLOCKSIZE
+        end += -(self.length + end) % tarfile.RECORDSIZE
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.fileobj.write(compressor.compress(tarfile.NUL * end) + compressor.flush())
+        self.crc = crc32_combine(self.crc, zlib.crc32(tarfile.NUL * end), end)
+        self.length += end
+        self.fileobj.write(struct.pack("<II", self.crc, self.length & 0xFFFFFFFF))
+        self.fileobj.close()
+
+    def close(self):
+        """
+        Description
+        -----------
+            Add the manifest and finish the bundle.
+
+        Returns
+        -------
+            dict manifest of the bundle: its path, format, compression level,
+            creation time, total uncompressed size, and the path, size and
+            sha256 of every file. After closing, the compressed size of the
+            bundle is added as "bundle_bytes" to the copy next to the bundle.
+        """
+
+        manifest = {
+            "bundle": os.path.basename(self.path),
+            "format": self.format,
+            "level": self.level,
+            "created": datetime.now().isoformat(),
+            "bytes": sum(f["size"] for f in self.files),
+            "files": sorted(self.files, key=lambda f: f["path"]),
+        }
+        self.add_json(BUNDLE_MANIFEST_FILENAME, manifest)
+        if self.format == "tar.gz":
+            self.close_tar_gz()
+        else:
+            self.archive.close()
+        if self.compressor is not None:
+            self.compressor.close()
+
+        manifest["bundle_bytes"] = os.path.getsize(self.path)
+        with open(os.path.join(os.path.dirname(self.path), BUNDLE_MANIFEST_FILENAME), "w") as fh:
+            json.dump(manifest, fh, indent=4)
+        return manifest
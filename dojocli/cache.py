@@ -0,0 +1,592 @@
+"""
+  Persistent on-disk caches of dojo api responses, model config templates,
+  and model run results.
+"""
+
+from hashlib import sha256
+from threading import Lock, get_ident
+from time import time
+import json
+import os
+import re
+import shutil
+
+# Default location of the dojo-cli cache, honoring XDG_CACHE_HOME.
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "dojo-cli",
+)
+
+# Defaults for the optional cache settings in the .config file.
+CACHE_DEFAULTS = {
+    "CACHE_DIR": DEFAULT_CACHE_DIR,
+    "CACHE_TTL": 300,
+    "CACHE_MAX_BYTES": 100 * 1024 * 1024,
+}
+
+# A model_id is a content-addressed version, so the /dojo metadata of a
+# version never changes and can be cached forever.
+IMMUTABLE_URL_PATTERN = re.compile(
+    r"/dojo/(accessories|config|directive|outputfile|parameters)/[^/?]+$"
+)
+
+
+class CachedResponse(object):
+    """
+    Description
+    -----------
+        Minimal stand-in for requests.Response returned for cache hits, so
+        callers can use .status_code, .text and .json() either way.
+    """
+
+    def __init__(self, url: str, status_code: int, text: str, headers: dict = None):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class MetadataCache(object):
+    """
+    Description
+    -----------
+        Stores dojo api GET responses on disk, one JSON file per url.
+
+        Version-specific /dojo/{stuff}/{model_id} entries never expire. All
+        other entries are fresh for ttl seconds, after which they are
+        revalidated with a conditional GET using the stored ETag or
+        Last-Modified header. Least-recently-used entries are evicted once the
+        cache grows past max_bytes.
+
+    Parameters
+    ----------
+        cache_dir: str
+            Root cache directory; responses are stored under {cache_dir}/http.
+        ttl: float
+            Seconds a mutable entry is served without revalidation.
+        max_bytes: int
+            Size limit of the cache directory.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        ttl: float = CACHE_DEFAULTS["CACHE_TTL"],
+        max_bytes: int = CACHE_DEFAULTS["CACHE_MAX_BYTES"],
+    ):
+        self.cache_dir = os.path.join(os.path.expanduser(cache_dir), "http")
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        self._size = None
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+        Description
+        -----------
+            Build a MetadataCache from the CACHE_* fields of a .config dict.
+        """
+
+        settings = {key: config.get(key, default) for key, default in CACHE_DEFAULTS.items()}
+        return cls(
+            cache_dir=settings["CACHE_DIR"],
+            ttl=settings["CACHE_TTL"],
+            max_bytes=settings["CACHE_MAX_BYTES"],
+        )
+
+    @staticmethod
+    def is_immutable(url: str):
+        return IMMUTABLE_URL_PATTERN.search(url) is not None
+
+    def entry_path(self, url: str):
+        return os.path.join(self.cache_dir, sha256(url.encode()).hexdigest() + ".json")
+
+    def get(self, url: str):
+        """
+        Description
+        -----------
+            Return the stored entry for url, or None on a miss. Reading an
+            entry marks it as recently used.
+
+        Returns
+        -------
+            dict with keys url, status_code, text, etag, last_modified,
+            stored_at and immutable.
+        """
+
+        path = self.entry_path(url)
+        try:
+            with open(path, "r") as fh:
+                entry = json.load(fh)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+
+        return entry if entry.get("url") == url else None
+
+    def is_fresh(self, entry: dict):
+        return entry["immutable"] or time() - entry["stored_at"] < self.ttl
+
+    def validation_headers(self, entry: dict):
+        """
+        Description
+        -----------
+            Conditional GET headers used to revalidate a stale entry.
+        """
+
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, response):
+        """
+        Description
+        -----------
+            Store a successful response and evict old entries if the cache is
+            over its size limit.
+
+        Returns
+        -------
+            The stored entry dict.
+        """
+
+        entry = {
+            "url": url,
+            "status_code": response.status_code,
+            "text": response.text,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "stored_at": time(),
+            "immutable": self.is_immutable(url),
+        }
+        self.write(entry)
+        return entry
+
+    def revalidated(self, entry: dict):
+        """
+        Description
+        -----------
+            Restart the ttl of an entry after a 304 Not Modified response.
+        """
+
+        entry["stored_at"] = time()
+        self.write(entry)
+        return entry
+
+    def write(self, entry: dict):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.entry_path(entry["url"])
+
+        # Write to a temporary file first so readers never see a partial entry.
+        tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(entry, fh)
+        size = os.path.getsize(tmp_path)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += size - old_size
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        """
+        Description
+        -----------
+            List (last_used, size, path) for every cache entry.
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for item in os.scandir(self.cache_dir):
+            if item.name.endswith(".json"):
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """
+        Description
+        -----------
+            Remove least-recently-used entries until the cache is below 90% of
+            max_bytes, leaving headroom so every write does not evict.
+        """
+
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
+
+
+class TemplateCache(object):
+    """
+    Description
+    -----------
+        Stores config file templates read from model images, keyed by
+        (image digest, path). The contents of a path in an image never change
+        for a given digest, so entries never expire.
+
+    Parameters
+    ----------
+        cache_dir: str
+            Root cache directory; templates are stored under
+            {cache_dir}/templates/{digest}.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = os.path.join(os.path.expanduser(cache_dir), "templates")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(cache_dir=config.get("CACHE_DIR", CACHE_DEFAULTS["CACHE_DIR"]))
+
+    def entry_path(self, image_digest: str, path: str):
+        digest = image_digest.split(":")[-1]
+        return os.path.join(self.cache_dir, digest, sha256(path.encode()).hexdigest())
+
+    def get(self, image_digest: str, path: str):
+        """
+        Description
+        -----------
+            Return the cached template text, or None on a miss.
+        """
+
+        try:
+            with open(self.entry_path(image_digest, path), "r") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def put(self, image_digest: str, path: str, content: str):
+        entry_path = self.entry_path(image_digest, path)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+        tmp_path = f"{entry_path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(tmp_path, "w") as fh:
+            fh.write(content)
+        os.replace(tmp_path, entry_path)
+
+
+def folder_size(folder: str):
+    """
+    Description
+    -----------
+        Total size of the files below folder, 0 if it does not exist.
+    """
+
+    total = 0
+    for root, _, filenames in os.walk(folder):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+def result_key(
+    model_id: str,
+    image_digest: str,
+    params: dict,
+    command: str,
+    configs: dict,
+    bundle_format: str = None,
+):
+    """
+    Description
+    -----------
+        Content address of a model run: a hash of the model version, the image
+        digest, the parameters as strings (the form they are substituted in),
+        the rendered directive and the hashes of the rendered config files.
+        Two runs with the same key produce the same outputs, barring
+        nondeterminism in the model itself.
+
+    Parameters
+    ----------
+        configs: dict
+            {container path: rendered config file content}.
+        bundle_format: str = None
+            Format of the output bundle of the run, if any, since a bundled
+            run keeps its outputs in the bundle rather than in its output
+            folder.
+    """
+
+    run = {
+        "model_id": model_id,
+        "image_digest": image_digest,
+        "params": {str(name): str(value) for name, value in params.items()},
+        "command": command,
+        "configs": {
+            path: sha256(content.encode()).hexdigest() for path, content in configs.items()
+        },
+    }
+    # Left out of unbundled runs so their keys do not change.
+    if bundle_format is not None:
+        run["bundle_format"] = bundle_format
+    return sha256(json.dumps(run, sort_keys=True).encode()).hexdigest()
+
+
+def link_or_copy(source: str, destination: str):
+    """
+    Description
+    -----------
+        Hardlink source to destination, or copy it where hardlinks are not
+        possible e.g. across filesystems.
+
+    Returns
+    -------
+        True if the file was linked, False if it was copied.
+    """
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+        return True
+    except OSError:
+        shutil.copy2(source, destination)
+        return False
+
+
+class ResultCache(object):
+    """
+    Description
+    -----------
+        Index of finished model runs keyed by result_key(), stored as one
+        JSON entry per key under {cache_dir}/results. Entries point at the
+        run folder of the original run rather than holding copies of its
+        files; an entry whose files were deleted or changed is dropped when
+        it is next read.
+
+    Parameters
+    ----------
+        cache_dir: str
+            Root cache directory.
+    """
+
+    # Run folder sub-directories restored from a cached run.
+    RESULT_FOLDERS = ("output", "accessories")
+
+    # Run folder files restored from a cached run, including the bundles and
+    # manifest of dojocli.bundle, which is not imported here to keep the
+    # startup of the CLI fast.
+    RESULT_FILES = (
+        "logs.txt",
+        "logs.jsonl",
+        "accessories-captions.json",
+        "bundle-manifest.json",
+        "outputs.tar.gz",
+        "outputs.tar.zst",
+        "outputs.zip",
+    )
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.cache_dir = os.path.join(os.path.expanduser(cache_dir), "results")
+
+    @classmethod
+    def from_config(cls, config: dict):
+        return cls(cache_dir=config.get("CACHE_DIR", CACHE_DEFAULTS["CACHE_DIR"]))
+
+    def entry_path(self, key: str):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def result_files(self, run_folder: str):
+        """
+        Description
+        -----------
+            {path relative to run_folder: size} of the files a cached run
+            restores.
+        """
+
+        files = {}
+        for name in self.RESULT_FILES:
+            path = os.path.join(run_folder, name)
+            if os.path.isfile(path):
+                files[name] = os.path.getsize(path)
+        for folder in self.RESULT_FOLDERS:
+            for root, _, filenames in os.walk(os.path.join(run_folder, folder)):
+                for filename in filenames:
+                    path = os.path.join(root, filename)
+                    files[os.path.relpath(path, run_folder)] = os.path.getsize(path)
+        return files
+
+    def is_valid(self, entry: dict):
+        for relative_path, size in entry["files"].items():
+            path = os.path.join(entry["run_folder"], relative_path)
+            try:
+                if os.path.getsize(path) != size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def get(self, key: str):
+        """
+        Description
+        -----------
+            Return the entry of a run key, or None on a miss.
+        """
+
+        try:
+            with open(self.entry_path(key), "r") as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+        if not self.is_valid(entry):
+            self.remove(key)
+            return None
+        return entry
+
+    def put(self, key: str, run_folder: str, details: dict):
+        """
+        Description
+        -----------
+            Record a successful run.
+
+        Parameters
+        ----------
+            key: str
+                The result_key() of the run.
+            run_folder: str
+                The run folder holding the results.
+            details: dict
+                Descriptive fields stored with the entry e.g. model_name,
+                model_id and params.
+        """
+
+        files = self.result_files(run_folder)
+        entry = dict(details)
+        entry.update(
+            {
+                "key": key,
+                "run_folder": os.path.abspath(run_folder),
+                "files": files,
+                "bytes": sum(files.values()),
+                "stored_at": time(),
+            }
+        )
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(entry, fh)
+        os.replace(tmp_path, path)
+        return entry
+
+    def restore(self, entry: dict, run_folder: str):
+        """
+        Description
+        -----------
+            Hardlink (or copy) the results of a cached run into run_folder.
+
+        Returns
+        -------
+            dict of files, bytes, linked and copied counts.
+        """
+
+        restored = {"files": 0, "bytes": 0, "linked": 0, "copied": 0}
+        for relative_path, size in entry["files"].items():
+            destination = os.path.join(run_folder, relative_path)
+            if os.path.exists(destination):
+                continue
+            linked = link_or_copy(os.path.join(entry["run_folder"], relative_path), destination)
+            restored["files"] += 1
+            restored["bytes"] += size
+            restored["linked" if linked else "copied"] += 1
+        return restored
+
+    def remove(self, key: str):
+        try:
+            os.remove(self.entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """
+        Description
+        -----------
+            Every entry, oldest first, with "valid" set to False for entries
+            whose files are gone or changed.
+        """
+
+        if not os.path.isdir(self.cache_dir):
+            return []
+
+        entries = []
+        for item in os.scandir(self.cache_dir):
+            if not item.name.endswith(".json"):
+                continue
+            try:
+                with open(item.path, "r") as fh:
+                    entry = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            entry["valid"] = self.is_valid(entry)
+            entries.append(entry)
+        entries.sort(key=lambda entry: entry["stored_at"])
+        return entries
+
+    def prune(self, older_than_days: float = None, model_name: str = None, everything: bool = False):
+        """
+        Description
+        -----------
+            Remove invalid entries, and entries matching every given
+            condition. The run folders the entries point at are left alone.
+
+        Returns
+        -------
+            The number of entries removed.
+        """
+
+        removed = 0
+        for entry in self.entries():
+            matches = (
+                everything
+                or older_than_days is not None
+                or model_name is not None
+            )
+            if older_than_days is not None:
+                matches = matches and time() - entry["stored_at"] > older_than_days * 86400
+            if model_name is not None:
+                matches = matches and entry.get("model_name") == model_name
+            if matches or not entry["valid"]:
+                self.remove(entry["key"])
+                removed += 1
+        return removed
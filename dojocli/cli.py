@@ -6,9 +6,15 @@ sys.path.append(dirname(dirname(abspath(__file__))))
 
 import click
 from datetime import datetime
-from dojocli.dojo_client import DojoClient
+from functools import update_wrapper
+from dojocli.constants import PULL_POLICIES
+from dojocli.exceptions import DojoError, ModelImageError
 import json
 
+# The dojo api client, the Docker SDK and their dependencies are imported by
+# the commands that use them, so "dojo --help" and the api-only commands start
+# quickly.
+
 
 def print_description(model_dict: dict, param_dicts: dict):
     """
@@ -76,7 +82,7 @@ def print_outputs(model: str, version: str, outputfile_dict: dict, accessories_d
 
     click.echo()
 
-def print_params(model_dict: dict, dc: DojoClient, params_filename: str = 'params_template.json'):
+def print_params(model_dict: dict, dc: "DojoClient", params_filename: str = 'params_template.json'):
     """
     Description
     -----------
@@ -140,57 +146,286 @@ def print_params(model_dict: dict, dc: DojoClient, params_filename: str = 'param
     click.echo(f"\nExample {model_name} version {model_id} template parameters file written to {params_filename}.")
 
         
-def print_versions(model: str, versions: dict):
+def print_report(models: dict):
+    """
+    Description
+    -----------
+    Print the per model percentiles returned by telemetry.aggregate_reports().
+
+    """
+
+    if len(models) == 0:
+        click.echo('\nNo run reports found.\n')
+        return
+
+    for model_name, model in sorted(models.items()):
+        click.echo(f'\n{model_name}: {model["runs"]} run(s), {model["failed"]} failed')
+        click.echo(f'  {"METRIC":<28} {"COUNT":>5} {"P50":>14} {"P90":>14} {"P99":>14} {"MAX":>14}')
+        for metric, summary in model["metrics"].items():
+            values = [f'{summary[key]:>14.3f}' for key in ("p50", "p90", "p99", "max")]
+            click.echo(f'  {metric:<28} {summary["count"]:>5} {" ".join(values)}')
+    click.echo()
+
+
+def print_result_cache(entries: list):
     """
     Description
     -----------
-    Print the list of versions for a model.
+    Print the entries of the result cache returned by ResultCache.entries().
+
+    """
+
+    if len(entries) == 0:
+        click.echo('\nNo cached runs.\n')
+        return
+
+    click.echo(f'\n{"CACHED":<19}  {"MODEL":<30} {"FILES":>5} {"SIZE":>10}  RUN FOLDER')
+    for e in entries:
+        stored_at = datetime.fromtimestamp(e["stored_at"]).strftime('%Y-%m-%d %H:%M:%S')
+        folder = e["run_folder"] if e["valid"] else f'{e["run_folder"]} (missing or changed)'
+        click.echo(f'{stored_at:<19}  {(e.get("model_name") or "-")[:30]:<30} {len(e["files"]):>5} {e["bytes"] / (1024 * 1024):>8.1f}MB  {folder}')
+    click.echo()
+
+
+def print_search(results: list):
+    """
+    Description
+    -----------
+    Print the (model, snippet) results of ModelIndex.search().
+
+    """
+
+    if len(results) == 0:
+        click.echo('\nNo matching models.\n')
+        return
+
+    click.echo()
+    for idx, (model, snippet) in enumerate(results):
+        click.echo(f'({idx+1:>2d}) "{model["name"]}"  version: {model["id"]}  family: {model.get("family_name") or "-"}')
+        if snippet:
+            click.echo(f'     {" ".join(snippet.split())}')
+    click.echo()
+
+
+def print_status(statuses: list):
+    """
+    Description
+    -----------
+    Print a table of dojo containers returned by
+    docker_client.dojo_container_status().
+
+    """
+
+    if len(statuses) == 0:
+        click.echo('\nNo dojo containers found.\n')
+        return
+
+    def megabytes(value):
+        return f'{value / (1024 * 1024):.0f}MB' if value is not None else '-'
+
+    click.echo(f'\n{"NAME":<45} {"STATE":<10} {"EXIT":>4} {"RUNTIME":>9} {"CPU %":>6} {"MEMORY":>17}  MODEL')
+    for s in statuses:
+        exit_code = s["exit_code"] if s["exit_code"] is not None else '-'
+        runtime = '-'
+        if s["runtime_seconds"] is not None:
+            hours, remainder = divmod(s["runtime_seconds"], 3600)
+            runtime = f'{hours}:{remainder // 60:02d}:{remainder % 60:02d}'
+        cpu = f'{s["cpu_percent"]:.1f}' if s.get("cpu_percent") is not None else '-'
+        memory = '-'
+        if s.get("memory_bytes") is not None:
+            memory = f'{megabytes(s["memory_bytes"])}/{megabytes(s.get("memory_limit_bytes"))}'
+        model = f'{s["model_name"]} ({s["model_id"]})' if s["model_id"] is not None else '-'
+        click.echo(f'{s["name"]:<45} {s["state"]:<10} {exit_code:>4} {runtime:>9} {cpu:>6} {memory:>17}  {model}')
+    click.echo()
+
+
+def print_versions(model: str, history: list, runnable_only: bool = False):
+    """
+    Description
+    -----------
+    Print a table of the versions of a model.
 
     Parameters
     ----------
     model: str
         The name of the model.
-    versions: dict
-        JSON returned by dojo_client.get_verions() in the format 
-        {
-        "current_version": "21fe6a15-f0a5-4ea3-a813-1e33d37f948d",
-        "prev_versions": [],
-        "later_versions": []
-        }
+    history: list
+        Returned by dojo_client.get_version_history(), oldest first.
+    runnable_only: bool = False
+        Only print the versions that have a Docker image.
     """
 
+    if runnable_only:
+        history = [v for v in history if v["runnable"]]
+
     click.echo(f'\nAvailable versions of "{model}":\n')
-    
-    click.echo('Current Version')
-    click.echo(f'"{versions["current_version"]}"')
+    if len(history) == 0:
+        click.echo('No versions found.\n')
+        return
+
+    click.echo(f'  {"CREATED":<19}  {"VERSION":<36}  IMAGE')
+    for v in history:
+        marker = '*' if v["relation"] == "current" else ' '
+        click.echo(f'{marker} {v["created_at"] or "-":<19}  {v["id"]:<36}  {v["image"] or "- (no image; cannot be run)"}')
+    click.echo(f'\n* current version; {sum(1 for v in history if v["runnable"])} of {len(history)} version(s) can be run.\n')
+
+def print_runnable_versions(error: ModelImageError, dc: "DojoClient"):
+    """
+    Description
+    -----------
+    Called from cli.runmodel() and cli.sweep() when the model version has no
+    image. Prints the versions of the model that can be run.
 
-    click.echo('\nPrevious Versions')
-    for pv in versions["prev_versions"]:
-        click.echo(f'"{pv}"')
+    """
 
-    click.echo('\nLater Versions')
-    for lv in versions["later_versions"]:
-        click.echo(f'"{lv}"')
+    click.echo(f'{error.model_name} version {error.model_id} does not have a Docker image associated with it and therefore cannot be run.')
+    click.echo(f'\nThe following versions of {error.model_name} have images and are available to run:')
+    versions = dc.get_model_versions_with_images(error.model_name)
 
+    if len(versions) == 0:
+        click.echo('\nNo versions of this model with an image are available.')
+    else:
+        for t in versions:
+            click.echo(f'created date: {t[0]}  version: {t[1]}')
     click.echo()
 
+def cache_options(command):
+    """
+    Description
+    -----------
+    Decorator adding the --no-cache and --refresh options shared by every
+    command that calls the dojo api. The cache commands inspect and prune the
+    caches rather than read through them, and report and status never call
+    the dojo api, so they do not take these options.
+
+    """
+
+    command = click.option("--refresh", is_flag=True, default=False, help="ignore cached dojo api responses and fetch them again")(command)
+    command = click.option("--no-cache", "no_cache", is_flag=True, default=False, help="do not read or write the dojo api response cache")(command)
+    return command
+
+
+def resource_options(command):
+    """
+    Description
+    -----------
+    Decorator adding the container resource options shared by runmodel and
+    sweep. The values are collected into a "resources" dict argument.
+
+    """
+
+    options = [
+        click.option("--cpus", type=float, default=None, help="number of CPUs the model container may use e.g. 2.5"),
+        click.option("--cpuset", type=str, default=None, help="CPUs the model container may run on e.g. 0-3"),
+        click.option("--memory", type=str, default=None, help="memory limit of the model container e.g. 4g"),
+        click.option("--shm-size", "shm_size", type=str, default=None, help="size of /dev/shm in the model container e.g. 1g"),
+        click.option("--ulimit", "ulimits", type=str, multiple=True, help="ulimit of the model container e.g. nofile=1024:2048; may be repeated"),
+        click.option("--tmpfs", type=str, multiple=True, help="tmpfs scratch mount in the model container e.g. /scratch:size=1g; may be repeated"),
+    ]
 
-@click.group()
+    def wrapper(*args, cpus, cpuset, memory, shm_size, ulimits, tmpfs, **kwargs):
+        resources = {"cpus": cpus, "cpuset": cpuset, "memory": memory, "shm_size": shm_size, "ulimits": ulimits, "tmpfs": tmpfs}
+        return command(*args, resources=resources, **kwargs)
+
+    wrapper = update_wrapper(wrapper, command)
+    for option in reversed(options):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def dojo_client(config: str, no_cache: bool = False, refresh: bool = False):
+    """
+    Description
+    -----------
+    Create the DojoClient of a command from its --config and cache options.
+    With HTTP_TIMING set, a summary of the client's dojo api requests is
+    printed to stderr when the command ends.
+
+    """
+
+    from dojocli.dojo_client import DojoClient
+
+    dc = DojoClient(config, use_cache=not no_cache, refresh_cache=refresh)
+    ctx = click.get_current_context(silent=True)
+    if dc.http_config["HTTP_TIMING"] and ctx is not None:
+        ctx.call_on_close(lambda: print_timing_summary(dc))
+    return dc
+
+
+def print_timing_summary(dc: "DojoClient"):
+    """
+    Description
+    -----------
+    Print the request count and time of dojo_client.timing_summary() to stderr.
+
+    """
+
+    summary = dc.timing_summary()
+    click.echo(
+        f"{summary['requests']} dojo api request(s) in {summary['total_ms']} ms, {summary['mean_ms']} ms each on average.",
+        err=True,
+    )
+
+
+class DojoGroup(click.Group):
+    """
+    Description
+    -----------
+    Command group that reports the DojoError of a command, e.g. an unreadable
+    .config file or a failed dojo api request, as a message and exit code 1
+    instead of a traceback. The commands themselves are thin wrappers that
+    print what the DojoClient returns.
+
+    """
+
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except DojoError as e:
+            click.echo(f"\nError: {e}\n", err=True)
+            ctx.exit(1)
+
+
+@click.group(cls=DojoGroup)
 def cli():
     pass
 
+@cli.command()
+@click.option("--model", type=str, multiple=True, help="a model name e.g. CHIRPS-Monthly; may be repeated")
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--version", type=str, multiple=True, help="a version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c; may be repeated")
+@click.option("--workers", type=int, default=4, help="maximum number of images pulled at once (defaults to 4)")
+@click.option("--pull", type=click.Choice(["always", "missing"]), default="missing", help="always pull, or pull only missing or out of date images (defaults to missing)")
+@cache_options
+def prefetch(model, config, version, workers, pull, no_cache, refresh):
+    """Pull the Docker images of models ahead of running them."""
+
+    if len(model) == 0 and len(version) == 0:
+        click.echo('\nAt least one --model or --version is required.\n')
+        return
+
+    click.echo(f"\nPrefetching images for {len(model) + len(version)} model(s) ...\n")
+
+    dc = dojo_client(config, no_cache, refresh)
+    images = dc.prefetch_images(model, version, workers=workers, pull_policy=pull)
+    for image_name, status in images.items():
+        click.echo(f"{image_name}: {status}")
+    click.echo()
+
+
 @cli.command()
 @click.option("--id", type=str, help="the container id")
 @click.option("--name", type=str, help="the container name")
 @click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
-def results(id, name, config):
+@cache_options
+def results(id, name, config, no_cache, refresh):
     """Get the results from a stopped model run container by either id or name."""
 
     if (id is None and name is None):
         click.echo('\nEither --id (container id) or --name (container name) is required.\n')
         return
     
-    dc = DojoClient(config)
+    dc = dojo_client(config, no_cache, refresh)
     dc.get_results(id, name)
 
 
@@ -198,7 +433,8 @@ def results(id, name, config):
 @click.option("--model", type=str, help="the model name e.g. CHIRPS-Monthly")
 @click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
 @click.option("--version", type=str, default=None, help="optional version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c")
-def describe(model, version, config):
+@cache_options
+def describe(model, version, config, no_cache, refresh):
     """Print a description of the model."""
 
     if (model is None and version is None):
@@ -210,35 +446,170 @@ def describe(model, version, config):
     else:
         click.echo(f'\nGetting the description of model version "{version}" ...\n')
 
-    dc = DojoClient(config)
+    dc = dojo_client(config, no_cache, refresh)
     model_dict = dc.get_model_info(model, version)
-    param_dicts = dc.get_parameters(model_dict["id"])
-
     if (model_dict == None):
         click.echo(f"\n No meta data is available for this model.\n")
         return
 
+    param_dicts = dc.get_parameters(model_dict["id"])
     print_description(model_dict, param_dicts)
 
 
+@cli.group()
+def cache():
+    """Inspect and prune the dojo-cli caches."""
+    pass
+
+
+@cache.command("list")
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--json", "as_json", is_flag=True, default=False, help="print the cached runs as json")
+def cache_list(config, as_json):
+    """List the runs in the result cache."""
+
+    entries = dojo_client(config).result_cache.entries()
+    if as_json:
+        click.echo(json.dumps(entries, indent=4))
+    else:
+        print_result_cache(entries)
+
+
+@cache.command("size")
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+def cache_size(config):
+    """Show the disk space used by each cache."""
+
+    dc = dojo_client(config)
+    sizes = dc.cache_sizes()
+    click.echo()
+    for name, size in sizes.items():
+        click.echo(f'{name:<28} {size / (1024 * 1024):>10.1f} MB')
+    click.echo()
+
+
+@cache.command("prune")
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--days", type=float, default=None, help="remove cached runs older than this many days")
+@click.option("--model", type=str, default=None, help="remove the cached runs of this model name")
+@click.option("--all", "everything", is_flag=True, default=False, help="remove every cached run and cached api response")
+def cache_prune(config, days, model, everything):
+    """Remove stale entries from the caches."""
+
+    dc = dojo_client(config)
+    removed = dc.result_cache.prune(older_than_days=days, model_name=model, everything=everything)
+    click.echo(f'\nRemoved {removed} cached run(s); their run folders were left in place.')
+    if everything and dc.cache is not None:
+        dc.cache.clear()
+        click.echo('Cleared the cached api responses.')
+    if dc.blob_store is not None:
+        blobs, freed = dc.blob_store.prune()
+        click.echo(f'Removed {blobs} blob(s) no run folder links to, freeing {freed / (1024 * 1024):.1f} MB.')
+    click.echo()
+
+
+@cli.group()
+def index():
+    """Manage the local model index."""
+    pass
+
+
+@index.command()
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--full", is_flag=True, default=False, help="fetch the parameters of every model version again")
+@cache_options
+def sync(config, full, no_cache, refresh):
+    """Mirror the model catalog into the local model index."""
+
+    click.echo("\nSyncing the local model index ...\n")
+    dc = dojo_client(config, no_cache, refresh)
+    try:
+        summary = dc.sync_index(full=full)
+    except DojoError as e:
+        click.echo(f"\n{e}\n", err=True)
+        return
+
+    click.echo(
+        f'{dc.index.count()} model versions indexed in {summary["seconds"]:.1f}s: '
+        f'{summary["added"]} added, {summary["updated"]} updated, {summary["removed"]} removed, {summary["unchanged"]} unchanged.'
+    )
+    click.echo(f'Parameters fetched for {summary["parameters_fetched"]} version(s), {summary["parameters_failed"]} failed.')
+    click.echo(f'Index: "{dc.index.path}"\n')
+
+
 @cli.command()
+@click.argument("query", nargs=-1, required=True)
 @click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
-def listmodels(config):
-    """List available models."""
-    click.echo("\nListing available models ...\n")
+@click.option("--limit", type=int, default=20, help="maximum number of results (defaults to 20)")
+@click.option("--allversions", is_flag=True, default=False, help="search every model version, not only the latest")
+@click.option("--json", "as_json", is_flag=True, default=False, help="print the matching model records as json")
+@cache_options
+def search(query, config, limit, allversions, as_json, no_cache, refresh):
+    """Full-text search of the local model index."""
+
+    dc = dojo_client(config, no_cache, refresh)
+    if no_cache or refresh:
+        # Bring the index up to date from the dojo api before searching it.
+        dc.sync_index()
+    if dc.index.synced_at() is None:
+        click.echo('\nThe local model index is empty; run "dojo index sync" first.\n')
+        return
+
+    results = dc.index.search(" ".join(query), limit=limit, latest_only=not allversions)
+    if as_json:
+        click.echo(json.dumps([model for model, _ in results], indent=4))
+    else:
+        print_search(results)
 
-    dc = DojoClient(config)
 
-    models = dc.get_available_models() 
-    for idx, m in enumerate(models):
-        click.echo(f'({idx+1:>2d}) {m}')
+@cli.command()
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--limit", type=int, default=None, help="list at most this many models")
+@click.option("--filter", "filters", type=str, multiple=True, help="field=pattern the models must match e.g. family_name=chirps* or maintainer.name=*jataware*; may be repeated")
+@click.option("--json", "as_json", is_flag=True, default=False, help="print the models as a json array")
+@click.option("--jsonl", is_flag=True, default=False, help="print the models as json lines, one model per line")
+@cache_options
+def listmodels(config, limit, filters, as_json, jsonl, no_cache, refresh):
+    """List available models."""
+
+    field_filters = {}
+    for f in filters:
+        field, sep, pattern = f.partition("=")
+        if len(sep) == 0 or len(field) == 0:
+            click.echo(f'\nInvalid --filter "{f}"; expected field=pattern.\n')
+            return
+        field_filters[field] = pattern
+
+    dc = dojo_client(config, no_cache, refresh)
+    models = dc.iter_models(filters=field_filters, limit=limit)
+
+    # Print each model as its page arrives rather than after the whole catalog.
+    try:
+        if jsonl:
+            for m in models:
+                click.echo(json.dumps(m))
+        elif as_json:
+            # Closed even if a page fails, so stdout stays valid json.
+            click.echo("[")
+            try:
+                for idx, m in enumerate(models):
+                    click.echo(("," if idx > 0 else "") + json.dumps(m, indent=4))
+            finally:
+                click.echo("]")
+        else:
+            click.echo("\nListing available models ...\n")
+            for idx, m in enumerate(models):
+                click.echo(f'({idx+1:>2d}) "{m["name"]}"')
+    except DojoError as e:
+        click.echo(f"\n{e}\n", err=True)
 
 
 @cli.command()
 @click.option("--model", type=str, help="the model name e.g. CHIRPS-Monthly")
 @click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
 @click.option("--version", type=str, default=None, help="optional version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c")
-def outputs(model, config, version):
+@cache_options
+def outputs(model, config, version, no_cache, refresh):
     """Print descriptions of the output and accessory files produced by a model."""
 
     if (model is None and version is None):
@@ -250,8 +621,11 @@ def outputs(model, config, version):
     else:
         click.echo(f'\nGetting output file information for model version "{version}" ...')
 
-    dc = DojoClient(config)
+    dc = dojo_client(config, no_cache, refresh)
     model_dict = dc.get_model_info(model, version)
+    if model_dict is None:
+        click.echo(f'\nNo model data is available for this model.\n')
+        return
     if model is None:
         model = model_dict["name"]
     model_id = model_dict["id"]
@@ -265,7 +639,8 @@ def outputs(model, config, version):
 @click.option("--model", type=str, help="the model name e.g. CHIRPS-Monthly")
 @click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
 @click.option("--version", type=str, default=None, help="optional version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c")
-def parameters(model, config, version):
+@cache_options
+def parameters(model, config, version, no_cache, refresh):
     """Print the parameters required to run a model."""
     
     if (model is None and version is None):
@@ -277,7 +652,7 @@ def parameters(model, config, version):
     else:
         click.echo(f'\nGetting parameters for model version "{version}" ...')
 
-    dc = DojoClient(config)
+    dc = dojo_client(config, no_cache, refresh)
     model_dict = dc.get_model_info(model, version)
 
     if (model_dict == None):
@@ -296,7 +671,17 @@ def parameters(model, config, version):
 @click.option("--outputdir", type=str, default=None, help="model output directory")
 @click.option("--version", type=str, default=None, help="optional version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c")
 @click.option("--attached", type=bool, default=True, help="wait for model completion")
-def runmodel(model, config, paramsfile, params, outputdir: str = None, version: str = None, attached: bool = True):
+@click.option("--pull", type=click.Choice(PULL_POLICIES), default="missing", help="when to pull the model image: always, missing (absent or out of date locally), or never (defaults to missing)")
+@click.option("--quiet", is_flag=True, default=False, help="do not print the model logs while running attached")
+@click.option("--jsonlogs", is_flag=True, default=False, help="also write timestamped model logs to logs.jsonl")
+@click.option("--reuse/--no-reuse", default=None, help="reuse the results of an identical earlier run instead of running the model (defaults to RESULT_CACHE in the config)")
+@click.option("--force", is_flag=True, default=False, help="run the model even if an identical earlier run can be reused")
+@click.option("--stream-outputs", is_flag=True, default=False, help="copy each output file as soon as it stops growing while the model runs attached")
+@click.option("--bundle", "bundle_format", type=click.Choice(["tar.gz", "tar.zst", "zip"]), default=None, help="write the output and accessory files into a compressed bundle with a checksum manifest (defaults to BUNDLE_FORMAT in the config)")
+@click.option("--mount-outputs/--copy-outputs", default=None, help="bind-mount the output directories of an attached run so outputs need no copy (defaults to MOUNT_OUTPUTS in the config)")
+@resource_options
+@cache_options
+def runmodel(model, config, paramsfile, params, outputdir: str = None, version: str = None, attached: bool = True, pull: str = "missing", quiet: bool = False, jsonlogs: bool = False, reuse: bool = None, force: bool = False, stream_outputs: bool = False, mount_outputs: bool = None, bundle_format: str = None, resources: dict = None, no_cache: bool = False, refresh: bool = False):
     """Run a model."""
 
     # Confirm options and params.
@@ -310,54 +695,146 @@ def runmodel(model, config, paramsfile, params, outputdir: str = None, version:
             click.echo("\n--paramsfile not found and --params is blank.\nOne of either --paramsfile or --params is required.\n")
             return
 
-    dc = DojoClient(config)
+    dc = dojo_client(config, no_cache, refresh)
 
-    # Get the model_id and image from the model_name or version.
-    model_dict = dc.get_model_info(model, model_id=version)
-    if version is None:
-        version = model_dict["id"]
-    elif model is None:
-        model = model_dict["name"]
+    click.echo(f"\nRunning model {model or version} ...\n")
 
-    # Check if the user is attempting to run a model that does not have an image.
-    if len(model_dict["image"].strip()) == 0:
-        click.echo(f'{model} version {version} does not have a Docker image associated with it and therefore cannot be run.')
-        click.echo(f'\nThe following versions of {model} have images and are available to run:')
-        versions = dc.get_model_versions_with_images(model)
-        
-        if len(versions) == 0:
-            click.echo('\nNo versions of this model with an image are available.')
-        else:
-            for t in versions:
-                click.echo(f'created date: {t[0]}  version: {t[1]}')
+    # Unknown models and api failures are reported by DojoGroup.
+    try:
+        dc.run(model, params, paramsfile, version, local_output_folder = outputdir, run_attached=attached, pull_policy=pull, quiet=quiet, json_logs=jsonlogs, resources=resources, reuse=reuse, force=force, stream_outputs=stream_outputs, mount_outputs=mount_outputs, bundle_format=bundle_format)
+    except ModelImageError as e:
+        print_runnable_versions(e, dc)
+        sys.exit(1)
+    except ValueError as e:
+        click.echo(f"\nUnable to run {model or version}: {e}\n")
+        sys.exit(1)
+
+
+@cli.command()
+@click.option("--runsdir", type=str, default="runs", help="folder searched for run reports (defaults to runs)")
+@click.option("--model", type=str, default=None, help="only report runs of this model name")
+@click.option("--json", "as_json", is_flag=True, default=False, help="print the report as json")
+def report(runsdir, model, as_json):
+    """Summarize the run reports of past runs per model."""
+
+    from dojocli.telemetry import aggregate_reports, find_run_reports
+
+    reports = find_run_reports(runsdir)
+    if model is not None:
+        reports = [(folder, r) for folder, r in reports if r.get("run", {}).get("model_name") == model]
+    models = aggregate_reports(reports)
+    if as_json:
+        click.echo(json.dumps(models, indent=4))
+    else:
+        print_report(models)
+
+
+@cli.command()
+@click.option("--json", "as_json", is_flag=True, default=False, help="print the status as json")
+@click.option("--nostats", is_flag=True, default=False, help="skip the cpu and memory snapshot of running containers")
+def status(as_json, nostats):
+    """Show the status of all dojo model containers."""
+
+    from dojocli.dojo_client import shared_docker_client
+
+    statuses = shared_docker_client().dojo_container_status(include_stats=not nostats)
+    if as_json:
+        click.echo(json.dumps(statuses, indent=4))
+    else:
+        print_status(statuses)
+
+
+@cli.command()
+@click.option("--model", type=str, default=None, help="the model name e.g. CHIRPS-Monthly")
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--sweepfile", type=str, default=None, help="parameter sets, one per run, as a .jsonl or .csv file")
+@click.option("--grid", type=str, default=None, help="json file mapping parameter names to lists of values to run every combination of")
+@click.option("--outputdir", type=str, default=None, help="sweep output directory")
+@click.option("--version", type=str, default=None, help="optional version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c")
+@click.option("--workers", type=int, default=2, help="maximum number of concurrent model containers (defaults to 2)")
+@click.option("--retries", type=int, default=1, help="number of times a failed run is retried (defaults to 1)")
+@click.option("--pull", type=click.Choice(PULL_POLICIES), default="missing", help="when to pull the model image: always, missing (absent or out of date locally), or never (defaults to missing)")
+@click.option("--reuse/--no-reuse", default=None, help="reuse the results of an identical earlier run instead of running the model (defaults to RESULT_CACHE in the config)")
+@click.option("--force", is_flag=True, default=False, help="run the model even if an identical earlier run can be reused")
+@resource_options
+@cache_options
+def sweep(model, config, sweepfile, grid, outputdir, version, workers, retries, pull, reuse, force, resources, no_cache, refresh):
+    """Run a model over many parameter sets."""
+
+    if (model is None and version is None):
+        click.echo('\nEither --model or --version is required.\n')
+        return
+    elif (sweepfile is None) == (grid is None):
+        click.echo('\nExactly one of --sweepfile or --grid is required.\n')
+        return
+    elif workers < 1 or retries < 0:
+        click.echo('\n--workers must be at least 1 and --retries at least 0.\n')
         return
 
-    click.echo(f"\nRunning model {model} version \"{version}\" ...\n")
+    from dojocli.sweep import grid_parameter_sets, load_parameter_sets, run_sweep
 
-    dc.run_model(model, params, paramsfile, version, local_output_folder = outputdir, run_attached=attached)
+    if sweepfile is not None:
+        parameter_sets = load_parameter_sets(sweepfile)
+    else:
+        parameter_sets = grid_parameter_sets(grid)
+
+    if len(parameter_sets) == 0:
+        click.echo('\nNo parameter sets found.\n')
+        return
+
+    dc = dojo_client(config, no_cache, refresh)
+
+    # Unknown models and api failures are reported by DojoGroup.
+    try:
+        run_sweep(dc, model, parameter_sets, version=version, sweep_folder=outputdir, workers=workers, retries=retries, pull_policy=pull, resources=resources, reuse=reuse, force=force)
+    except ModelImageError as e:
+        print_runnable_versions(e, dc)
+        sys.exit(1)
+    except ValueError as e:
+        click.echo(f"\nUnable to run the sweep: {e}\n")
+        sys.exit(1)
+
+
+@cli.command()
+@click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
+@click.option("--follow", is_flag=True, default=False, help="keep watching for runs started later")
+@cache_options
+def watch(config, follow, no_cache, refresh):
+    """Collect the results of detached model runs as they finish."""
+
+    dc = dojo_client(config, no_cache, refresh)
+    dc.watch_runs(follow=follow)
 
 
 @cli.command()
 @click.option("--model", type=str, help="the model name e.g. CHIRPS-Monthly")
+@click.option("--version", type=str, default=None, help="optional version id e.g. ceedd3b0-f48f-43d2-b279-d74be695ed1c")
 @click.option("--config", type=str, default=".config", help="configuration json filename (defaults to .config)")
-def versions(model, config):
+@click.option("--runnable", is_flag=True, default=False, help="only list versions that have a Docker image")
+@click.option("--json", "as_json", is_flag=True, default=False, help="print the versions as json")
+@cache_options
+def versions(model, version, config, runnable, as_json, no_cache, refresh):
     """Print all registered versions of a model."""
     
-    if model==None:
-        click.echo("\n--model is a required option.\n")
+    if model is None and version is None:
+        click.echo("\nEither --model or --version is required.\n")
         return
 
-    click.echo(f"\nGetting versions of \"{model}\" ...")
+    if not as_json:
+        click.echo(f"\nGetting versions of \"{model or version}\" ...")
 
-    dc = DojoClient(config)
-    versions = dc.get_versions(model)
+    dc = dojo_client(config, no_cache, refresh)
+    history = dc.get_version_history(model, version)
 
-    if (versions == None):
+    if as_json:
+        click.echo(json.dumps(history, indent=4))
+        return
+    elif len(history) == 0:
         click.echo(f"\n No versions are available for this model.\n")
         return
 
     # Call a seperate print_versions function to keep things clean.
-    print_versions(model, versions)
+    print_versions(model or history[-1]["name"], history, runnable_only=runnable)
 
 if __name__ == "__main__":     
     cli()
@@ -0,0 +1,94 @@
+"""
+  Configuration of the dojo-cli clients: the dojo url and credentials, and the
+  optional settings documented in the README.
+"""
+
+from dojocli.exceptions import ConfigError
+import json
+
+# Keys every configuration must have.
+REQUIRED_KEYS = ("DOJO_URL", "DOJO_USER", "DOJO_PWD")
+
+
+class DojoConfig(object):
+    """
+    Description
+    -----------
+        The settings of a DojoClient, validated once and shareable by any
+        number of clients, e.g.
+
+            config = DojoConfig.from_file(".config")
+            config = DojoConfig(DOJO_URL="https://dojo.example.com", DOJO_USER="me",
+                                DOJO_PWD="secret", RESULT_CACHE=True)
+
+        Keys are the same as in the .config file.
+
+    Parameters
+    ----------
+        settings: dict = None
+            Settings, updated with any keyword arguments.
+
+    Raises
+    ------
+        ConfigError if DOJO_URL, DOJO_USER or DOJO_PWD is missing.
+    """
+
+    def __init__(self, settings: dict = None, **kwargs):
+        self.settings = dict(settings or {}, **kwargs)
+        self.source = None
+        missing = [key for key in REQUIRED_KEYS if key not in self.settings]
+        if len(missing) > 0:
+            raise ConfigError(f"the configuration is missing {', '.join(missing)}.")
+
+    @classmethod
+    def from_file(cls, filename: str):
+        """
+        Description
+        -----------
+            Read a .config json file.
+
+        Raises
+        ------
+            ConfigError if the file cannot be read or parsed, or misses a
+            required key.
+        """
+
+        try:
+            with open(filename) as fh:
+                settings = json.load(fh)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"unable to read {filename}: {e}")
+        if not isinstance(settings, dict):
+            raise ConfigError(f"{filename} is not a JSON object of settings.")
+        try:
+            config = cls(settings)
+        except ConfigError:
+            raise ConfigError(
+                f"{filename} is missing a required field of DOJO_USER, DOJO_URL, and/or DOJO_PWD."
+            )
+        config.source = filename
+        return config
+
+    @classmethod
+    def load(cls, config):
+        """
+        Description
+        -----------
+            A DojoConfig from a DojoConfig (returned as is), a dict of
+            settings, or a .config filename.
+        """
+
+        if isinstance(config, DojoConfig):
+            return config
+        if isinstance(config, dict):
+            return cls(config)
+        return cls.from_file(config)
+
+    def get(self, key: str, default=None):
+        return self.settings.get(key, default)
+
+    def __getitem__(self, key: str):
+        return self.settings[key]
+
+    def __contains__(self, key: str):
+        return key in self.settings
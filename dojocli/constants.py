@@ -0,0 +1,12 @@
+"""
+  Constants shared by the CLI and the Docker client. This module must stay
+  free of heavy imports: the CLI reads it while defining its options, before
+  it knows whether a command needs the Docker SDK.
+"""
+
+# Labels identifying the model run in a dojo container.
+DOJO_MODEL_ID_LABEL = "dojo.model_id"
+DOJO_MODEL_NAME_LABEL = "dojo.model_name"
+
+# Image pull policies accepted by DockerClient.ensure_image().
+PULL_POLICIES = ("always", "missing", "never")
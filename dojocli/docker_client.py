@@ -4,19 +4,255 @@ docker-py (https://pypi.org/project/docker-py/) client for dojo-api
 
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from sys import float_repr_style, stderr
+from threading import Lock
+from time import perf_counter, time
 import docker
-import click
 from docker.api.volume import VolumeApiMixin
+from dojocli.constants import DOJO_MODEL_ID_LABEL, DOJO_MODEL_NAME_LABEL, PULL_POLICIES
+from dojocli.exceptions import ContainerNotFoundError, DockerImageError
+from dojocli.logstream import LogStreamer
+from dojocli.matching import DIFF_ADDED, OutputMatcher
 from tqdm import tqdm
-import fnmatch
+import io
+import os
+import posixpath
+import re
+import tarfile
+
+# Connections kept open to the Docker daemon by a DockerClient.
+DOCKER_POOL_SIZE = 32
+
+# Container resource settings accepted by build_resource_kwargs().
+RESOURCE_KEYS = ("cpus", "cpuset", "memory", "shm_size", "ulimits", "tmpfs")
+
+# Keys of a container stats snapshot returned by parse_container_stats().
+STATS_KEYS = (
+    "cpu_percent",
+    "memory_bytes",
+    "memory_limit_bytes",
+    "block_read_bytes",
+    "block_write_bytes",
+    "net_rx_bytes",
+    "net_tx_bytes",
+)
+
+# Size of the reads used to stream files out of container archives.
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class ChunkStreamReader(io.RawIOBase):
+    """
+    Description
+    -----------
+        Read-only file object over an iterator of byte chunks, such as the
+        stream returned by get_archive(). Lets tarfile read the stream
+        incrementally instead of buffering the whole archive in memory.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.leftover = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.leftover) == 0:
+            try:
+                self.leftover = next(self.chunks)
+            except StopIteration:
+                return 0
+
+        size = min(len(buffer), len(self.leftover))
+        buffer[:size] = self.leftover[:size]
+        self.leftover = self.leftover[size:]
+        return size
+
+
+def parse_container_stats(stats: dict):
+    """
+    Description
+    -----------
+        Reduce one raw Docker stats document, from a snapshot or the stats
+        stream, to the values dojo reports.
+
+    Returns
+    -------
+        dict of cpu_percent (100 per fully used CPU), memory_bytes (excluding
+        page cache), memory_limit_bytes, and the cumulative block I/O
+        (block_read_bytes, block_write_bytes) and network traffic
+        (net_rx_bytes, net_tx_bytes) of the container.
+    """
+
+    cpu = stats.get("cpu_stats", {})
+    precpu = stats.get("precpu_stats", {})
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get(
+        "cpu_usage", {}
+    ).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len(
+        cpu.get("cpu_usage", {}).get("percpu_usage") or [1]
+    )
+    cpu_percent = cpu_delta / system_delta * online_cpus * 100 if system_delta > 0 else 0.0
+
+    memory = stats.get("memory_stats", {})
+    memory_stats = memory.get("stats", {})
+    cache = memory_stats.get("inactive_file", memory_stats.get("cache", 0))
+    memory_bytes = memory.get("usage", 0) - cache
+
+    block_read_bytes = block_write_bytes = 0
+    for entry in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        if entry.get("op", "").lower() == "read":
+            block_read_bytes += entry.get("value", 0)
+        elif entry.get("op", "").lower() == "write":
+            block_write_bytes += entry.get("value", 0)
+
+    networks = (stats.get("networks") or {}).values()
+
+    return {
+        "cpu_percent": round(cpu_percent, 1),
+        "memory_bytes": memory_bytes,
+        "memory_limit_bytes": memory.get("limit"),
+        "block_read_bytes": block_read_bytes,
+        "block_write_bytes": block_write_bytes,
+        "net_rx_bytes": sum(network.get("rx_bytes", 0) for network in networks),
+        "net_tx_bytes": sum(network.get("tx_bytes", 0) for network in networks),
+    }
+
+
+def group_paths_by_directory(paths, changes: list = None):
+    """
+    Description
+    -----------
+        Group container paths by their parent directory so that a single
+        archive request can cover every file in a directory.
+
+        A directory is only archived whole when that copies nothing but the
+        requested paths: the run must have added the directory, and every
+        other entry the run added there must be one of the paths or lie under
+        one. A directory of the image may hold any number of other files, so
+        its paths are archived one at a time.
+
+    Parameters
+    ----------
+        paths: list
+            Container paths of files or directories.
+        changes: list = None
+            Container diff entries {"Path": str, "Kind": int} of the run. With
+            no changes every path is archived on its own.
+
+    Returns
+    -------
+        dict of {archive path: [container paths]}.
+    """
+
+    by_directory = {}
+    for path in paths:
+        path = posixpath.normpath(path)
+        by_directory.setdefault(posixpath.dirname(path), []).append(path)
+
+    added = [
+        posixpath.normpath(change["Path"])
+        for change in changes or []
+        if change["Kind"] == DIFF_ADDED
+    ]
+    added_set = set(added)
+
+    def holds_only(directory, directory_paths):
+        if directory == "/" or directory not in added_set:
+            return False
+        for entry in added:
+            if not entry.startswith(directory + "/"):
+                continue
+            if not any(
+                entry == path or entry.startswith(path + "/") for path in directory_paths
+            ):
+                return False
+        return True
+
+    groups = {}
+    for directory, directory_paths in by_directory.items():
+        directory_paths = list(dict.fromkeys(directory_paths))
+        if len(directory_paths) > 1 and holds_only(directory, directory_paths):
+            groups[directory] = directory_paths
+        else:
+            for path in directory_paths:
+                groups[path] = [path]
+    return groups
+
+
+def build_resource_kwargs(resources: dict):
+    """
+    Description
+    -----------
+        Translate model run resource settings into keyword arguments accepted
+        by both APIClient.create_host_config() and client.containers.run(), so
+        attached and detached runs apply them the same way.
+
+    Parameters
+    ----------
+        resources: dict
+            Any of:
+                "cpus": float, number of CPUs e.g. 2.5
+                "cpuset": str, CPUs the container may use e.g. "0-3"
+                "memory": str or int, memory limit e.g. "4g"
+                "shm_size": str or int, size of /dev/shm e.g. "1g"
+                "ulimits": list of str, e.g. ["nofile=1024:2048"]
+                "tmpfs": list of str, scratch mounts e.g. ["/scratch:size=1g"]
+
+    Returns
+    -------
+        dict of keyword arguments.
+
+    Raises
+    ------
+        ValueError for unknown or malformed settings.
+    """
+
+    unknown = set(resources) - set(RESOURCE_KEYS)
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown resource setting(s): {', '.join(sorted(unknown))}.")
+
+    kwargs = {}
+    if resources.get("cpus") is not None:
+        kwargs["nano_cpus"] = int(float(resources["cpus"]) * 1e9)
+    if resources.get("cpuset") is not None:
+        kwargs["cpuset_cpus"] = str(resources["cpuset"])
+    if resources.get("memory") is not None:
+        kwargs["mem_limit"] = resources["memory"]
+    if resources.get("shm_size") is not None:
+        kwargs["shm_size"] = resources["shm_size"]
+
+    if resources.get("ulimits"):
+        kwargs["ulimits"] = []
+        for ulimit in resources["ulimits"]:
+            name, _, limits = ulimit.partition("=")
+            soft, _, hard = limits.partition(":")
+            if len(name) == 0 or not soft.isdigit() or not (hard == "" or hard.isdigit()):
+                raise ValueError(f'Invalid ulimit "{ulimit}"; expected name=soft[:hard].')
+            kwargs["ulimits"].append(
+                docker.types.Ulimit(name=name, soft=int(soft), hard=int(hard or soft))
+            )
+
+    if resources.get("tmpfs"):
+        kwargs["tmpfs"] = {}
+        for tmpfs in resources["tmpfs"]:
+            path, _, options = tmpfs.partition(":")
+            if not path.startswith("/"):
+                raise ValueError(f'Invalid tmpfs mount "{tmpfs}"; expected /path[:options].')
+            kwargs["tmpfs"][path] = options
+
+    return kwargs
 
 
 class DockerClient(object):
     def __init__(self):
-        self.api_client = docker.APIClient()  # base_url='unix://var/run/docker.sock')
-        self.client = docker.from_env()
-        self.container = None
+        # One connection pool serves both the high and the low level API. It
+        # is sized for the log, stats and copy streams of concurrent runs.
+        self.client = docker.from_env(max_pool_size=DOCKER_POOL_SIZE)
+        self.api_client = self.client.api
 
     def create_container(
         self,
@@ -25,6 +261,10 @@ class DockerClient(object):
         container_command,
         config_files,
         run_attached: bool = True,
+        log_streamer: LogStreamer = None,
+        labels: dict = None,
+        resources: dict = None,
+        stats_sampler=None,
     ):
         """
         Description
@@ -46,11 +286,28 @@ class DockerClient(object):
             run_attached: bool = True
                 Option to run detached (in background.)
 
+            log_streamer: LogStreamer = None
+                Consumes the model logs while running attached. Defaults to a
+                quiet LogStreamer that discards them.
+
+            labels: dict = None
+                Docker labels of the container e.g. the dojo model id.
+
+            resources: dict = None
+                CPU, memory, shm, ulimit and tmpfs settings; see
+                build_resource_kwargs().
+
+            stats_sampler: telemetry.StatsSampler = None
+                Started as soon as an attached container starts, to sample
+                its resource usage while it runs.
+
         Returns
         -------
             The created container either stopped or detached and running.
         """
 
+        resource_kwargs = build_resource_kwargs(resources or {})
+
         if run_attached:
             # attached volumes
             volumes_list = []
@@ -59,34 +316,34 @@ class DockerClient(object):
                 binds.append(f"{key}:{config_files[key]}")
                 if config_files[key] not in volumes_list:
                     volumes_list.append(f"{config_files[key]}")
-            # Create the container detached.
-            self.container = self.api_client.create_container(
+            # Create the container detached. The container is only returned,
+            # never kept on the client, so concurrent runs can share it.
+            container = self.api_client.create_container(
                 image_name,
                 command=container_command,
                 name=container_name,
                 detach=False,
                 host_config=self.api_client.create_host_config(
-                    auto_remove=False, binds=binds
+                    auto_remove=False, binds=binds, **resource_kwargs
                 ),
                 volumes=volumes_list,
+                labels=labels,
             )
 
             # Start the container.
-            self.api_client.start(self.container)
+            self.api_client.start(container)
+            if stats_sampler is not None:
+                stats_sampler.start(self.api_client, container)
 
             # Attach to the container and stream the logs.
-            log_header = False
-            logs = []
-            for b in self.api_client.logs(
-                self.container, stream=True, stderr=True, stdout=True
-            ):
-                if not log_header:
-                    click.echo("\nModel run logs:\n")
-                    log_header = True
-                line = b.decode("utf-8")
-                logs.append(line)
-                click.echo(line.strip())
-            return self.container
+            if log_streamer is None:
+                log_streamer = LogStreamer(quiet=True)
+            with log_streamer:
+                for chunk in self.api_client.logs(
+                    container, stream=True, stderr=True, stdout=True, follow=True
+                ):
+                    log_streamer.feed(chunk)
+            return container
         else:
             # volumes for detached
             detached_volume_array = []
@@ -95,7 +352,7 @@ class DockerClient(object):
                     detached_volume_array.append(f"{key}:{config_files[key]}")
 
             # If running detached, client.containers.run returns the container object.
-            self.container = self.client.containers.run(
+            container = self.client.containers.run(
                 image_name,
                 command=container_command,
                 stdin_open=True,
@@ -103,13 +360,43 @@ class DockerClient(object):
                 volumes=detached_volume_array,
                 detach=True,
                 name=container_name,
+                labels=labels,
+                **resource_kwargs,
             )
-            return self.container
+            return container
+
+    def wait_container(self, container_name):
+        """
+        Description
+        -----------
+        Block until the container stops and return its exit code.
 
-    def execute_command(self, model_command):
-        # click.echo(f'\nExecuting {model_command} in {self.container.name}.\n')
+        """
+
+        return self.api_client.wait(container_name)["StatusCode"]
+
+    def container_events(self, since=None):
+        """
+        Description
+        -----------
+        Stream the "die" events of containers started by dojo, as decoded
+        dicts, from the Docker events api. Blocks until the next event.
+
+        Parameters
+        ----------
+            since:
+                Also return events since this datetime or unix timestamp.
+        """
+
+        return self.client.events(
+            since=since,
+            decode=True,
+            filters={"type": "container", "event": "die", "label": DOJO_MODEL_ID_LABEL},
+        )
+
+    def execute_command(self, container_name, model_command):
         exe = self.api_client.exec_create(
-            container=self.container.name, cmd=model_command, stdin=True
+            container=container_name, cmd=model_command, stdin=True
         )
         self.api_client.exec_start(exe)
 
@@ -128,31 +415,61 @@ class DockerClient(object):
 
         return self.api_client.logs(container_name, timestamps=True)
 
+    def image_digest(self, image_name):
+        """
+        Description
+        -----------
+        Return the content-addressed id (sha256 digest) of a local image.
+
+        """
+
+        return self.api_client.inspect_image(image_name)["Id"]
+
+    def image_directory_contents(self, image_name, paths):
+        """
+        Description
+        -----------
+        Return {path: True if the directory holds any file or folder} for
+        directories of an image, read from a temporary container. Only the
+        first entries of each directory are read. Missing directories are
+        empty.
+
+        """
+
+        contents = {}
+        container = self.api_client.create_container(image_name, command='echo -n "Do nothing!"')
+        try:
+            for path in paths:
+                try:
+                    stream, _ = self.api_client.get_archive(container, path)
+                except docker.errors.NotFound:
+                    contents[path] = False
+                    continue
+                # The first member is the directory itself.
+                with tarfile.open(fileobj=ChunkStreamReader(stream), mode="r|") as tar:
+                    contents[path] = any(index > 0 for index, _ in zip(range(2), tar))
+        finally:
+            self.api_client.remove_container(container, force=True)
+        return contents
+
     def is_running(self, container_id: str = None, container_name: str = None):
-        if container_id is not None:
-            try:
-                result = self.api_client.inspect_container(container_id)
-                if "State" in result:
-                    if "Running" in result["State"]:
-                        return result["State"]["Running"]
-                raise docker.errors.NotFound
-            except docker.errors.NotFound:
-                click.echo(
-                    f"No information found for a docker container with id {container_id}."
-                )
-                return None
-        elif container_name is not None:
-            try:
-                result = self.api_client.inspect_container(container_name)
-                if "State" in result:
-                    if "Running" in result["State"]:
-                        return result["State"]["Running"]
-                raise docker.errors.NotFound
-            except docker.errors.NotFound:
-                click.echo(
-                    f"No information found for a docker container {container_name}."
-                )
-                return None
+        """
+        Description
+        -----------
+        Return True if the container with container_id, else container_name,
+        is running. Raises ContainerNotFoundError if there is no such
+        container.
+
+        """
+
+        container = container_id if container_id is not None else container_name
+        try:
+            result = self.api_client.inspect_container(container)
+        except docker.errors.NotFound:
+            raise ContainerNotFoundError(container)
+        if "Running" not in result.get("State", {}):
+            raise ContainerNotFoundError(container)
+        return result["State"]["Running"]
 
     def list_containers(self, model: str):
         """
@@ -173,7 +490,170 @@ class DockerClient(object):
         containers = self.client.containers.list(all=True, filters={"name": model})
         return [c.id for c in containers]
 
-    def pull_image(self, image_name):
+    def ensure_image(self, image_name, pull_policy: str = "missing", quiet: bool = False, echo=None):
+        """
+        Description
+        -----------
+        Make sure the image is available locally according to pull_policy:
+
+            "always"  : pull the image.
+            "missing" : pull only when the image is not local or its local
+                        digest does not match the registry digest.
+            "never"   : do not pull; the image must already be local.
+
+        Parameters
+        ----------
+            image_name: str
+                format repo:tag
+            pull_policy: str = "missing"
+                One of PULL_POLICIES.
+            quiet: bool = False
+                Pull without progress bars or messages.
+            echo: callable = None
+                Called with a message when the registry cannot be reached.
+
+        Returns
+        -------
+            True if the image was pulled, False if the pull was skipped.
+
+        Raises
+        ------
+            DockerImageError if the pull fails, or with pull_policy "never"
+            if the image is not local.
+        """
+
+        if pull_policy not in PULL_POLICIES:
+            raise ValueError(f"pull_policy must be one of {', '.join(PULL_POLICIES)}.")
+
+        if pull_policy == "never":
+            if not self.image_exists(image_name):
+                raise DockerImageError(image_name, "the image is not available locally.")
+            return False
+
+        if pull_policy == "missing" and self.image_is_current(image_name, echo=echo):
+            return False
+
+        self.pull_image(image_name, quiet=quiet)
+        return True
+
+    def image_exists(self, image_name):
+        try:
+            self.api_client.inspect_image(image_name)
+            return True
+        except docker.errors.ImageNotFound:
+            return False
+
+    def image_is_current(self, image_name, echo=None):
+        """
+        Description
+        -----------
+        Return True if the image is local and its digest matches the registry
+        digest. If the registry cannot be reached, a local image is considered
+        current and the reason is passed to echo, if given.
+
+        """
+
+        local_digests = self.local_repo_digests(image_name)
+        if len(local_digests) == 0:
+            return False
+
+        try:
+            registry_digest = self.client.images.get_registry_data(image_name).id
+        except docker.errors.APIError as e:
+            if echo is not None:
+                echo(f"Unable to check the registry digest of {image_name}, using the local image: {e}")
+            return True
+
+        return registry_digest in local_digests
+
+    def local_repo_digests(self, image_name):
+        """
+        Description
+        -----------
+        Return the registry digests (sha256:...) of the local copy of an image,
+        or an empty list if the image is not local.
+
+        """
+
+        try:
+            repo_digests = self.api_client.inspect_image(image_name).get("RepoDigests") or []
+        except docker.errors.ImageNotFound:
+            return []
+        return [repo_digest.split("@")[-1] for repo_digest in repo_digests]
+
+    def dojo_container_status(self, include_stats: bool = True, workers: int = 8):
+        """
+        Description
+        -----------
+        Return the status of every dojo-* container with a single filtered
+        list call, plus one stats snapshot per running container, taken
+        concurrently.
+
+        Parameters
+        ----------
+            include_stats: bool = True
+                Take a CPU and memory stats snapshot of running containers.
+            workers: int = 8
+                Number of stats snapshots taken at once.
+
+        Returns
+        -------
+            List of dicts with the container id, name, state, status, exit
+            code, created time, runtime in seconds, model name and id labels,
+            and cpu_percent, memory_bytes, and memory_limit_bytes for running
+            containers when include_stats is True.
+        """
+
+        now = time()
+        statuses = []
+        for c in self.api_client.containers(all=True, filters={"name": "dojo-"}):
+            # The name filter matches anywhere in the name.
+            if not any(name.lstrip("/").startswith("dojo-") for name in c.get("Names") or []):
+                continue
+            labels = c.get("Labels") or {}
+            exit_code = re.match(r"Exited \((-?\d+)\)", c.get("Status", ""))
+            statuses.append(
+                {
+                    "id": c["Id"][:12],
+                    "name": c["Names"][0].lstrip("/") if c.get("Names") else "",
+                    "state": c.get("State"),
+                    "status": c.get("Status"),
+                    "exit_code": int(exit_code.group(1)) if exit_code else None,
+                    "created": c.get("Created"),
+                    "runtime_seconds": int(now - c["Created"]) if c.get("State") == "running" else None,
+                    "model_name": labels.get(DOJO_MODEL_NAME_LABEL),
+                    "model_id": labels.get(DOJO_MODEL_ID_LABEL),
+                }
+            )
+
+        running = [status for status in statuses if status["state"] == "running"]
+        if include_stats and len(running) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for status, stats in zip(
+                    running, executor.map(self.container_stats, [s["id"] for s in running])
+                ):
+                    status.update(stats)
+        return statuses
+
+    def container_stats(self, container_name):
+        """
+        Description
+        -----------
+        Take one stats snapshot of a running container.
+
+        Returns
+        -------
+            dict of STATS_KEYS; see parse_container_stats(). Values are None
+            if the snapshot failed.
+        """
+
+        try:
+            stats = self.api_client.stats(container_name, stream=False)
+        except docker.errors.APIError:
+            return {key: None for key in STATS_KEYS}
+        return parse_container_stats(stats)
+
+    def pull_image(self, image_name, quiet: bool = False):
         """
         Description
         -----------
@@ -185,6 +665,13 @@ class DockerClient(object):
             imagename: str
                 format repo:tag
                 e.g. jataware/dojo-publish:CHIRPS-Monthly-latest
+            quiet: bool = False
+                Pull without progress bars e.g. when pulling several images at
+                once.
+
+        Raises
+        ------
+            DockerImageError if the registry refuses or fails the pull.
         """
 
         # Bulid the Docker Hub repo and tag from the image name.
@@ -192,6 +679,25 @@ class DockerClient(object):
         repo = sa[0]
         tag = sa[1]
 
+        # A failed pull either raises or streams an {"error": ...} line.
+        def pull_lines():
+            try:
+                for line in self.client.api.pull(repo, tag, True, decode=True):
+                    if "error" in line:
+                        raise DockerImageError(
+                            image_name, f"unable to pull the image: {line['error']}"
+                        )
+                    yield line
+            except docker.errors.APIError as e:
+                raise DockerImageError(
+                    image_name, f"unable to pull the image: {e.explanation or e}"
+                )
+
+        if quiet:
+            for _ in pull_lines():
+                pass
+            return
+
         # Use tqdm for progress bar handling. client.api.pull streams JSON
         # strings in line below e.g.:
         # {'status': 'Pulling from jataware/dojo-publish', 'id': 'AgMIPSeasonalCropEmulator-latest'}
@@ -204,7 +710,7 @@ class DockerClient(object):
         # Create a tqdm object for each line id.
         t_lookup = {}
         position_counter = -1
-        for line in self.client.api.pull(repo, tag, True, decode=True):
+        for line in pull_lines():
             status = line["status"]
             lineid = line["id"] if "id" in line else None
             progress = line["progress"] if "progress" in line else None
@@ -233,14 +739,237 @@ class DockerClient(object):
             # Set the description str referred by bar_format-'{desc}' in t.
             t.set_description_str(text)
 
-    def remove_container(self, container_name):
+    def stream_files(self, container_name, paths, missing: list = None):
+        """
+        Description
+        -----------
+        Stream files out of a container with the archive api, one tar stream
+        per path. Nothing is buffered in memory:
+        each file object reads directly from the tar stream and must be
+        consumed before the next item is requested.
+
+        Parameters
+        ----------
+            container_name: str
+                The container name or id.
+            paths: list
+                Container paths of files or directories to copy.
+            missing: list = None
+                List the requested paths that do not exist are appended to.
+
+        Yields
+        ------
+            (requested path, path relative to the requested path, TarInfo,
+            file object or None for directories) for every file and directory
+            found. Requested paths that do not exist are skipped.
+        """
+
+        # Without the container's changes no directory is archived whole.
+        for archive_path, group in group_paths_by_directory(paths).items():
+            yield from self.stream_group(container_name, archive_path, group, missing)
+
+    def stream_group(self, container_name, archive_path, group, missing: list = None):
         """
         Description
         -----------
-        Remove the Docker container from the system.
+        Stream the files of one group from group_paths_by_directory() out of a
+        single get_archive() tar stream. See stream_files().
+
+        """
+
+        if missing is None:
+            missing = []
+
+        try:
+            stream, _ = self.api_client.get_archive(container_name, archive_path)
+        except docker.errors.NotFound:
+            missing.extend(group)
+            return
+
+        found = set()
+        archive_parent = posixpath.dirname(archive_path)
+        with tarfile.open(fileobj=ChunkStreamReader(stream), mode="r|") as tar:
+            for member in tar:
+                member_path = posixpath.join(archive_parent, member.name)
+                for path in group:
+                    if member_path == path:
+                        relative_path = ""
+                    elif member_path.startswith(path + "/"):
+                        relative_path = member_path[len(path) + 1:]
+                    else:
+                        continue
+
+                    found.add(path)
+                    if member.isdir():
+                        yield path, relative_path, member, None
+                    elif member.isfile():
+                        yield path, relative_path, member, tar.extractfile(member)
+                    break
+
+        missing.extend(path for path in group if path not in found)
+
+    def copy_files(
+        self,
+        container_name,
+        destinations: dict,
+        workers: int = 1,
+        show_progress: bool = True,
+        blob_store=None,
+        bundle=None,
+    ):
+        """
+        Description
+        -----------
+        Copy files out of a container, keeping only their basenames as
+        "docker cp" does. The file contents are streamed straight to disk,
+        into blob_store and linked from there, or into a compressed bundle.
+        Paths sharing a directory the run created are copied with one tar
+        stream; see group_paths_by_directory(). Each tar stream is copied by
+        one of up to workers threads, and a tqdm bar shows the aggregate bytes
+        and files copied.
+
+        Parameters
+        ----------
+            container_name: str
+                The container name or id.
+            destinations: dict
+                {local folder: [container paths to copy into it]}
+            workers: int = 1
+                Number of tar streams copied at once.
+            show_progress: bool = True
+                Display the tqdm progress bar.
+            blob_store: BlobStore = None
+                Content-addressed store the files are written to, hashed as
+                they stream, and then linked into the local folders.
+            bundle: OutputBundle = None
+                Compressed archive the files are written to instead of the
+                local folders, named by their path relative to bundle.root.
+
+        Returns
+        -------
+            dict of the local file paths written ("files"), the total "bytes",
+            the elapsed "seconds", and the requested container paths that do
+            not exist ("missing"). With a blob_store also
+            "duplicate_files" and "duplicate_bytes" (content already in the
+            store) and "methods" ({"reflink"/"hardlink"/"copy": file count}).
+        """
+
+        # The container's changes are only needed if paths share a directory.
+        changes = None
+        for paths in destinations.values():
+            directories = [posixpath.dirname(posixpath.normpath(path)) for path in set(paths)]
+            if len(directories) > len(set(directories)):
+                changes = self.container_diff(container_name)
+                break
+
+        jobs = [
+            (local_folder, archive_path, group)
+            for local_folder, paths in destinations.items()
+            for archive_path, group in group_paths_by_directory(paths, changes).items()
+        ]
+
+        written = []
+        missing = []
+        totals = {"bytes": 0, "duplicate_files": 0, "duplicate_bytes": 0}
+        methods = {}
+        lock = Lock()
+        progress = tqdm(
+            desc="Copying files",
+            unit="B",
+            unit_scale=True,
+            unit_divisor=1024,
+            disable=not show_progress,
+        )
+
+        def copy_group(local_folder, archive_path, group):
+            group_missing = []
+            for path, relative_path, member, fileobj in self.stream_group(
+                container_name, archive_path, group, group_missing
+            ):
+                local_path = os.path.join(local_folder, posixpath.basename(path), relative_path)
+                local_path = local_path.rstrip(os.sep)
+                if bundle is not None:
+                    if fileobj is not None:
+                        bundle.add_file(local_path, member, fileobj, progress.update)
+                        with lock:
+                            written.append(local_path)
+                            totals["bytes"] += member.size
+                            progress.set_postfix(files=len(written))
+                    continue
+                if fileobj is None:
+                    os.makedirs(local_path, exist_ok=True)
+                    continue
+
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                if blob_store is not None:
+                    digest, new = blob_store.put(fileobj, member.mode, progress.update)
+                    method = blob_store.materialize(digest, local_path)
+                else:
+                    new = True
+                    method = None
+                    with open(local_path, "wb") as fh:
+                        while True:
+                            chunk = fileobj.read(COPY_BUFFER_SIZE)
+                            if not chunk:
+                                break
+                            fh.write(chunk)
+                            progress.update(len(chunk))
+                    os.chmod(local_path, member.mode & 0o777 | 0o600)
+
+                with lock:
+                    written.append(local_path)
+                    totals["bytes"] += member.size
+                    if not new:
+                        totals["duplicate_files"] += 1
+                        totals["duplicate_bytes"] += member.size
+                    if method is not None:
+                        methods[method] = methods.get(method, 0) + 1
+                    progress.set_postfix(files=len(written))
+
+            with lock:
+                missing.extend(group_missing)
+
+        start = perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for future in [executor.submit(copy_group, *job) for job in jobs]:
+                future.result()
+        progress.close()
+
+        copied = {
+            "files": written,
+            "missing": missing,
+            "bytes": totals["bytes"],
+            "seconds": perf_counter() - start,
+        }
+        if blob_store is not None:
+            copied["duplicate_files"] = totals["duplicate_files"]
+            copied["duplicate_bytes"] = totals["duplicate_bytes"]
+            copied["methods"] = methods
+        return copied
+
+    def write_logs(self, container_name, log_filename):
+        """
+        Description
+        -----------
+        Stream the container logs (stdout and stderr) to a file.
+
         """
 
-        self.api_client.remove_container(container_name)
+        with open(log_filename, "wb") as fh:
+            for chunk in self.api_client.logs(
+                container_name, stream=True, stdout=True, stderr=True, follow=False
+            ):
+                fh.write(chunk)
+
+    def remove_container(self, container_name, force: bool = False):
+        """
+        Description
+        -----------
+        Remove the Docker container from the system. force also removes a
+        running container.
+        """
+
+        self.api_client.remove_container(container_name, force=force)
 
     def container_diff(self, container_name):
         """
@@ -250,17 +979,33 @@ class DockerClient(object):
         """
         return self.api_client.diff(container_name)
 
-    def match_pattern_output_path(self, container_name, outputs):
+    def stat_path(self, container_name, path):
         """
         Description
         -----------
-        Return new output paths accounting for wildcards
+        Return the stat of a path in a container, as in the
+        X-Docker-Container-Path-Stat header of the archive endpoint: a dict of
+        name, size, mode (a Go os.FileMode), mtime and linkTarget. Only the
+        header is fetched (HEAD request), not the file. None if the path does
+        not exist.
+
         """
-        array_of_files = self.container_diff(container_name)
-        new_outputs = []
-        for output in outputs:
-            for file_changed in array_of_files:
-                if fnmatch.fnmatch(file_changed.get("Path", ""), output):
-                    new_outputs.append(file_changed.get("Path"))
 
-        return new_outputs
+        response = self.api_client.head(
+            self.api_client._url("/containers/{0}/archive", container_name),
+            params={"path": path},
+        )
+        if response.status_code == 404:
+            return None
+        self.api_client._raise_for_status(response)
+        encoded_stat = response.headers.get("x-docker-container-path-stat")
+        return docker.utils.decode_json_header(encoded_stat) if encoded_stat else None
+
+    def match_pattern_output_path(self, container_name, outputs):
+        """
+        Description
+        -----------
+        Return new output paths accounting for wildcards: the added and
+        modified files of the container that match any of outputs, each once.
+        """
+        return OutputMatcher(outputs).match_diff(self.container_diff(container_name))
@@ -4,33 +4,390 @@
 
 import click
 from datetime import datetime
-from docker.api import container
-
-from docker.api.volume import VolumeApiMixin
 
 # from requests.models import stream_decode_response_unicode
-from dojocli.docker_client import DockerClient
-from io import BytesIO
-from tarfile import open as tar_open
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dojocli.blobstore import BlobStore
+from dojocli.cache import (
+    CACHE_DEFAULTS,
+    CachedResponse,
+    MetadataCache,
+    ResultCache,
+    TemplateCache,
+    folder_size,
+    result_key,
+)
+from dojocli.config import DojoConfig
+from dojocli.constants import DOJO_MODEL_ID_LABEL, DOJO_MODEL_NAME_LABEL
+from dojocli.exceptions import (
+    ConfigTemplateError,
+    ContainerNotFoundError,
+    DockerUnavailableError,
+    DojoApiError,
+    DojoError,
+    ModelImageError,
+    ModelNotFoundError,
+)
+from dojocli.harvest import (
+    MOUNT_FOLDER_MODE,
+    STREAM_INTERVAL_DEFAULT,
+    StreamingHarvester,
+    collect_mounted_files,
+    is_under,
+    plan_output_mounts,
+)
+from dojocli.index import ModelIndex, record_hash
+from dojocli.logstream import LogStreamer
+from dojocli.matching import literal_prefix
+from dojocli.registry import RunRegistry
+from dojocli.report import read_run_report, update_run_report
+from dojocli.telemetry import STATS_INTERVAL_DEFAULT, PhaseTimer, StatsSampler
+from dojocli.templating import ParameterTemplate
+import fnmatch
 import json
 import os
+import posixpath
 import re
 import requests
+import shutil
+from requests.adapters import HTTPAdapter
+from threading import Lock
+from time import perf_counter
+from urllib.parse import quote
+from urllib3.util.retry import Retry
+
+# Defaults for the optional HTTP settings in the .config file.
+HTTP_DEFAULTS = {
+    "HTTP_POOL_SIZE": 10,
+    "HTTP_KEEP_ALIVE": True,
+    "HTTP_CONNECT_TIMEOUT": 5.0,
+    "HTTP_READ_TIMEOUT": 60.0,
+    "HTTP_RETRIES": 3,
+    "HTTP_BACKOFF_FACTOR": 0.5,
+    "HTTP_TIMING": False,
+}
+
+# Maximum number of /dojo endpoint requests get_metadata() issues at once.
+METADATA_WORKERS_DEFAULT = 5
+
+# Number of container archive streams process_finished_model() copies at once.
+HARVEST_WORKERS_DEFAULT = 4
+
+# Models requested per page of /models/latest by iter_models().
+MODELS_PAGE_SIZE = 100
+
+# Number of recent requests whose timings are kept in request_timings.
+REQUEST_TIMINGS_MAX = 1000
+
+# Response status codes that are retried with backoff.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def model_matches(model: dict, filters: dict):
+    """
+    Description
+    -----------
+        True if every {field: pattern} of filters matches the model. Fields
+        of nested objects are named with dots e.g. maintainer.name, and
+        patterns are case-insensitive shell-style wildcards e.g. "chirps*".
+    """
+
+    for field, pattern in filters.items():
+        value = model
+        for key in field.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            return False
+        values = value if isinstance(value, list) else [value]
+        if not any(fnmatch.fnmatch(str(v).lower(), pattern.lower()) for v in values):
+            return False
+    return True
+
+
+def new_docker_client():
+    """
+    Description
+    -----------
+        Create a DockerClient. The Docker SDK, tqdm and tarfile are imported
+        here on first use, so commands that only call the dojo api never load
+        them. Raises DockerUnavailableError if the Docker daemon cannot be
+        reached.
+    """
+
+    import docker
+    from dojocli.docker_client import DockerClient
+
+    try:
+        return DockerClient()
+    except docker.errors.DockerException as e:
+        raise DockerUnavailableError(str(e))
+
+
+def build_session(http_config: dict, auth: tuple):
+    """
+    Description
+    -----------
+        Build a pooled requests.Session for the dojo api. Connections are kept
+        alive between requests so a command pays the TCP/TLS handshake once
+        instead of once per request.
+
+    Parameters
+    ----------
+        http_config: dict
+            The HTTP_ settings; see HTTP_DEFAULTS.
+        auth: tuple
+            (user, password) of the dojo api.
+
+    Returns
+    -------
+        requests.Session
+    """
+
+    retry = Retry(
+        total=http_config["HTTP_RETRIES"],
+        backoff_factor=http_config["HTTP_BACKOFF_FACTOR"],
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=http_config["HTTP_POOL_SIZE"],
+        pool_maxsize=http_config["HTTP_POOL_SIZE"],
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.auth = auth
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not http_config["HTTP_KEEP_ALIVE"]:
+        session.headers["Connection"] = "close"
+    return session
+
+
+# State shared by every DojoClient of the process: the DockerClient of
+# shared_docker_client(), the sessions of shared_session() and the run stamps
+# of unique_run_stamp().
+shared_clients = {}
+shared_clients_lock = Lock()
+
+
+def unique_run_stamp(model_id: str, stamp: str):
+    """
+    Description
+    -----------
+        stamp, numbered e.g. 20220105101520-2 if this process already used it
+        for a run of model_id, so runs started in the same second get their
+        own run folder and container name.
+    """
+
+    with shared_clients_lock:
+        used = shared_clients.setdefault("run_stamps", set())
+        candidate = stamp
+        number = 1
+        while (model_id, candidate) in used:
+            number += 1
+            candidate = f"{stamp}-{number}"
+        used.add((model_id, candidate))
+        return candidate
+
+
+def shared_docker_client():
+    """
+    Description
+    -----------
+        The DockerClient of this process, created on first use. Its connection
+        pool is shared by every DojoClient that was not given a DockerClient
+        of its own, so a long-lived service pays the Docker connection setup
+        once rather than once per run.
+    """
+
+    with shared_clients_lock:
+        if "docker" not in shared_clients:
+            shared_clients["docker"] = new_docker_client()
+        return shared_clients["docker"]
+
+
+def shared_session(http_config: dict, auth: tuple):
+    """
+    Description
+    -----------
+        The pooled requests.Session of this process for the given HTTP
+        settings and credentials, created on first use. Every DojoClient that
+        was not given a session of its own uses it, so a service building a
+        client per job pays the connection setup and TLS handshake once
+        rather than once per client.
+    """
+
+    key = (tuple(auth), tuple(sorted(http_config.items())))
+    with shared_clients_lock:
+        sessions = shared_clients.setdefault("sessions", {})
+        if key not in sessions:
+            sessions[key] = build_session(http_config, auth)
+        return sessions[key]
 
 
 class DojoClient(object):
-    def __init__(self, config_filename):
-        self.set_config(config_filename)
+    def __init__(
+        self,
+        config,
+        use_cache: bool = True,
+        refresh_cache: bool = False,
+        session: requests.Session = None,
+        docker_client: "DockerClient" = None,
+        verbose: bool = True,
+    ):
+        """
+        Parameters
+        ----------
+            config: str, dict or DojoConfig
+                The .config json filename, or the settings themselves, with
+                the dojo url and credentials. A DojoConfig is read once and
+                can be shared by any number of clients.
+            use_cache: bool = True
+                Read and write api responses through the on-disk cache.
+            refresh_cache: bool = False
+                Ignore cached responses but store the fresh ones.
+            session: requests.Session = None
+                HTTP session for the dojo api calls. Defaults to the
+                process-wide shared_session() of the client's HTTP settings
+                and credentials.
+            docker_client: DockerClient = None
+                Docker client of the runs. Defaults to the process-wide
+                shared_docker_client().
+            verbose: bool = True
+                Echo progress messages. Library callers can turn them off and
+                rely on return values and exceptions instead.
+
+        Raises
+        ------
+            ConfigError if the configuration cannot be read or misses the dojo
+            url or credentials.
+        """
+
+        self.session = session
+        self.docker_client = docker_client
+        self.verbose = verbose
+        # (url, status code, seconds) of the most recent requests, and the
+        # count and total seconds of every request, so a long-lived client
+        # keeps a bounded history.
+        self.request_timings = deque(maxlen=REQUEST_TIMINGS_MAX)
+        self.request_count = 0
+        self.request_seconds = 0.0
+        self.timings_lock = Lock()
+        self.use_cache = use_cache
+        self.refresh_cache = refresh_cache
+        self.cache = None
+        self.template_cache = None
+        self.index = None
+        self.use_index = False
+        self.index_ttl = CACHE_DEFAULTS["CACHE_TTL"]
+        self.set_config(config)
+
+    def close(self):
+        """
+        Description
+        -----------
+            Let go of the HTTP session. Its connections stay open for the
+            other clients using it: a shared_session() lives as long as the
+            process, and a session passed in is closed by its owner.
+        """
+
+        self.session = None
+
+    def get_session(self):
+        """
+        Description
+        -----------
+            The session given to this client, else the shared one.
+        """
+
+        if self.session is None:
+            self.session = shared_session(self.http_config, self.dojo_auth)
+        return self.session
+
+    def echo(self, message: str = "", **kwargs):
+        """
+        Description
+        -----------
+            click.echo() a progress message unless the client is not verbose.
+        """
 
-    def generic_dojo_get_request(self, url):
+        if self.verbose:
+            click.echo(message, **kwargs)
+
+    def get_docker_client(self):
+        """
+        Description
+        -----------
+            The DockerClient given to this client, else the shared one.
+        """
+
+        if self.docker_client is not None:
+            return self.docker_client
+        return shared_docker_client()
+
+    def generic_dojo_get_request(self, url, use_cache: bool = True):
         try:
-            response = requests.get(url, auth=(self.dojo_auth))
+            # Serve fresh cache entries without touching the network.
+            entry = None
+            headers = {}
+            use_cache = use_cache and self.cache is not None
+            if use_cache and not self.refresh_cache:
+                entry = self.cache.get(url)
+                if entry is not None:
+                    if self.cache.is_fresh(entry):
+                        return self.cached_response(entry)
+                    headers = self.cache.validation_headers(entry)
+
+            # Failed requests are timed too, with no status code.
+            start = perf_counter()
+            response = None
+            try:
+                response = self.get_session().get(
+                    url,
+                    headers=headers,
+                    timeout=(
+                        self.http_config["HTTP_CONNECT_TIMEOUT"],
+                        self.http_config["HTTP_READ_TIMEOUT"],
+                    ),
+                )
+            finally:
+                self.record_timing(
+                    url,
+                    response.status_code if response is not None else None,
+                    perf_counter() - start,
+                )
+
+            if use_cache:
+                if response.status_code == 304 and entry is not None:
+                    return self.cached_response(self.cache.revalidated(entry))
+                if response.status_code == 200:
+                    self.cache.put(url, response)
             return response
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(e.message)
-            else:
-                click.echo(e)
+        except requests.RequestException as e:
+            raise DojoApiError(url, str(e))
+
+    def record_timing(self, url: str, status_code: int, elapsed: float):
+        """
+        Description
+        -----------
+            Add a request to request_timings and the totals of
+            timing_summary(), and print it to stderr with HTTP_TIMING.
+        """
+
+        with self.timings_lock:
+            self.request_timings.append((url, status_code, elapsed))
+            self.request_count += 1
+            self.request_seconds += elapsed
+        if self.http_config["HTTP_TIMING"]:
+            status = status_code if status_code is not None else "failed"
+            self.echo(f"GET {url} {status} {elapsed * 1000:.1f} ms", err=True)
+
+    @staticmethod
+    def cached_response(entry: dict):
+        return CachedResponse(entry["url"], entry["status_code"], entry["text"])
 
 
     def get_accessories(self, model_id: str):
@@ -53,36 +410,165 @@ class DojoClient(object):
         Description
         -----------
 
-            Get latest models with images from dojo api.
+            Get the names of the latest versions of all models from the dojo
+            api, quoted and sorted. See iter_models() to stream the models
+            instead.
+
+        """
 
-            Use /models and not models/latest so that images can be restricted to
-            jataware/dojo-publish.
+        return sorted({f"\"{model['name']}\"" for model in self.iter_models()})
 
+    def iter_models(
+        self,
+        page_size: int = MODELS_PAGE_SIZE,
+        filters: dict = None,
+        limit: int = None,
+        latest: bool = True,
+        query: str = None,
+    ):
         """
-        # url = f'{self.dojo_url}/models?query=image:"{IMAGE_QUERY_NAME}" AND NOT _exists_:"next_version"&size=1000'
-        url = f"{self.dojo_url}/models/latest?size=1000"
-        response = self.generic_dojo_get_request(url)
+        Description
+        -----------
+            Yield the latest version of every model as the pages of
+            /models/latest arrive, following the scroll_id of each page, so
+            catalogs of any size are listed without holding them in memory.
+            Pages are not cached since a scroll_id is only valid once.
 
-        try:
-            resp = response.json()
-            models = set()
-
-            # for r in resp["results"]:
-            #    if r['image'] != '' and r['next_version'] == None:
-            #        models.add(f"\"{r['name']}\"")
-
-            # List the latest versions of models even if it does not have an image.
-            models = {f"\"{r['name']}\"" for r in resp["results"]}
-            models = list(models)
-            models.sort()
-            return models
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(f"{e.message}\n{response.text}")
-            else:
-                click.echo(response.text)
-            exit
+        Parameters
+        ----------
+            page_size: int
+                Models requested per page.
+            filters: dict = None
+                {field: pattern} the models must match; see model_matches().
+            limit: int = None
+                Stop after this many matching models.
+            latest: bool = True
+                Yield every version of every model from /models instead if
+                False.
+            query: str = None
+                Search query the api filters the models by e.g. name:"CHIRPS".
+
+        Raises
+        ------
+            DojoApiError if a page fails.
+        """
+
+        if limit is not None and limit <= 0:
+            return
+
+        endpoint = "/models/latest" if latest else "/models"
+        query_string = f"&query={quote(query)}" if query is not None else ""
+        url = f"{self.dojo_url}{endpoint}?size={page_size}{query_string}"
+        yielded = 0
+        seen = set()
+        while True:
+            response = self.generic_dojo_get_request(url, use_cache=False)
+            if response is None:
+                raise DojoApiError(endpoint, "request failed")
+            elif response.status_code != 200:
+                raise DojoApiError(endpoint, f"HTTP {response.status_code} {response.text}")
+            try:
+                page = response.json()
+            except ValueError as e:
+                raise DojoApiError(endpoint, f"invalid JSON response ({e})")
+
+            # Stop on an empty page, or on a repeated one from a server that
+            # ignores scroll_id.
+            results = [r for r in page.get("results", []) if r.get("id") not in seen]
+            if len(results) == 0:
+                return
+
+            for model in results:
+                seen.add(model.get("id"))
+                if filters and not model_matches(model, filters):
+                    continue
+                yield model
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+
+            scroll_id = page.get("scroll_id")
+            if scroll_id is None or len(page.get("results", [])) < page_size:
+                return
+            url = f"{self.dojo_url}{endpoint}?size={page_size}{query_string}&scroll_id={quote(scroll_id)}"
+
+    def sync_index(self, full: bool = False):
+        """
+        Description
+        -----------
+            Mirror every version of every model into the local model index.
+            Only new or changed records are written, and the /dojo/parameters
+            of a version are fetched once, concurrently, since a version never
+            changes. Versions deleted from the dojo api are dropped.
+
+        Parameters
+        ----------
+            full: bool = False
+                Fetch the parameters of every version again.
+
+        Returns
+        -------
+            dict of the added, updated, removed and unchanged record counts,
+            the parameters fetched and failed, and the elapsed seconds.
+        """
 
+        start = perf_counter()
+        indexed = self.index.record_hashes()
+        summary = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        needs_parameters = []
+        batch = []
+
+        for model in self.iter_models(latest=False):
+            model_id = model["id"]
+            seen.add(model_id)
+            if model_id not in indexed:
+                summary["added"] += 1
+            elif indexed[model_id][0] != record_hash(model):
+                summary["updated"] += 1
+            else:
+                summary["unchanged"] += 1
+                model = None
+            if model is not None:
+                batch.append((model, None))
+            if full or model_id not in indexed or not indexed[model_id][1]:
+                needs_parameters.append(model_id)
+
+            # Write a page worth of records per transaction.
+            if len(batch) >= MODELS_PAGE_SIZE:
+                self.index.upsert(batch)
+                batch = []
+        self.index.upsert(batch)
+
+        removed = [model_id for model_id in indexed if model_id not in seen]
+        self.index.remove(removed)
+        summary["removed"] = len(removed)
+
+        def fetch(model_id):
+            try:
+                return model_id, self.get_dojo_endpoint_json("parameters", model_id)
+            except DojoApiError:
+                return model_id, None
+
+        parameters = {}
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, self.metadata_workers)) as executor:
+            for model_id, model_parameters in executor.map(fetch, needs_parameters):
+                if model_parameters is None:
+                    # Left unindexed so the next sync retries it.
+                    failed += 1
+                    continue
+                parameters[model_id] = model_parameters
+                if len(parameters) >= MODELS_PAGE_SIZE:
+                    self.index.set_parameters(parameters)
+                    parameters = {}
+        self.index.set_parameters(parameters)
+
+        self.index.finish_sync()
+        summary["parameters_fetched"] = len(needs_parameters) - failed
+        summary["parameters_failed"] = failed
+        summary["seconds"] = round(perf_counter() - start, 3)
+        return summary
 
     def get_dojo_stuff(self, stuff, model_id):
         """
@@ -93,12 +579,8 @@ class DojoClient(object):
         response = self.generic_dojo_get_request(url)
         try:
             return response.json()
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(e.message)
-            else:
-                click.echo(e)
-            exit
+        except ValueError as e:
+            raise DojoApiError(url, f"invalid JSON response ({e})")
 
 
     def get_metadata(self, model_id: str):
@@ -124,16 +606,57 @@ class DojoClient(object):
         -------
             dict: metadata as JSON
 
+        Raises
+        ------
+            DojoApiError naming the first endpoint that failed.
+
         """
 
         # Get "dojo_stuff", i.e. the four types of information available by GET
-        # /dojo/, and add to the metadata.
-        metadata = {}
+        # /dojo/, and add to the metadata. The requests are independent so they
+        # are issued concurrently, up to METADATA_WORKERS at a time.
         dojo_stuff = ["accessories", "config", "directive", "outputfile"]
-        for stuff in dojo_stuff:
-            metadata[stuff] = self.get_dojo_stuff(stuff, model_id)
 
-        return metadata
+        workers = min(self.metadata_workers, len(dojo_stuff))
+        if workers <= 1:
+            return {
+                stuff: self.get_dojo_endpoint_json(stuff, model_id)
+                for stuff in dojo_stuff
+            }
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                stuff: executor.submit(self.get_dojo_endpoint_json, stuff, model_id)
+                for stuff in dojo_stuff
+            }
+            # result() re-raises the DojoApiError naming the failed endpoint.
+            return {stuff: future.result() for stuff, future in futures.items()}
+
+    def get_dojo_endpoint_json(self, stuff: str, model_id: str):
+        """
+        Description
+        -----------
+            GET /dojo/{stuff}/{model_id} and return the decoded JSON payload.
+            Unlike get_dojo_stuff(), an error status is raised as well, naming
+            the endpoint rather than the full url.
+
+        Raises
+        ------
+            DojoApiError naming the endpoint if the request fails, returns an
+            error status, or returns a payload that is not JSON.
+        """
+
+        endpoint = f"/dojo/{stuff}/{model_id}"
+        response = self.generic_dojo_get_request(f"{self.dojo_url}{endpoint}")
+        if response is None:
+            raise DojoApiError(endpoint, "request failed")
+        if response.status_code >= 400:
+            raise DojoApiError(endpoint, f"HTTP {response.status_code} {response.text}")
+
+        try:
+            return response.json()
+        except ValueError as e:
+            raise DojoApiError(endpoint, f"invalid JSON response ({e})")
 
 
     def get_model_info(self, model_name: str, model_id: str = None):
@@ -158,13 +681,34 @@ class DojoClient(object):
 
         """
 
+        # Answer from the local model index when there is one. The latest
+        # version of a name changes, so it is only taken from a fresh index.
+        if self.use_index:
+            model_dict = None
+            if model_id is not None:
+                model_dict = self.index.get(model_id)
+            elif self.index_is_fresh():
+                model_dict = self.index.latest(model_name)
+            if model_dict is not None:
+                return model_dict
+
         # url = f'{self.dojo_url}/models?query=name:"{model_name}" AND image:"{IMAGE_QUERY_NAME}" AND NOT _exists_:"next_version"'
         if model_id == None:
             url = f'{self.dojo_url}/models/latest?query=name:"{model_name}"'
         else:
             url = f"{self.dojo_url}/models/{model_id}"
 
-        response = self.generic_dojo_get_request(url)
+        try:
+            response = self.generic_dojo_get_request(url)
+        except DojoApiError as e:
+            # Without the network, the latest version of a stale index is
+            # still better than no answer.
+            if self.use_index and model_id is None:
+                model_dict = self.index.latest(model_name)
+                if model_dict is not None:
+                    self.echo_stale_index(e)
+                    return model_dict
+            raise
 
         try:
             resp = response.json()
@@ -179,29 +723,26 @@ class DojoClient(object):
                 if resp["name"] == model_name or resp["id"] == model_id:
                     return resp
 
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(e.message)
-            else:
-                click.echo(e)
-            exit
+        except ValueError as e:
+            raise DojoApiError(url, f"invalid JSON response ({e})")
 
 
     def get_parameters(self, model_id: str):
         """
         TODO
         """
+        if self.use_index:
+            parameters = self.index.parameters(model_id)
+            if parameters is not None:
+                return parameters
+
         url = f'{self.dojo_url}/dojo/parameters/{model_id}'
         try:
             response = self.generic_dojo_get_request(url)
             return response.json()
 
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(e.message)
-            else:
-                click.echo(e)
-            exit
+        except ValueError as e:
+            raise DojoApiError(url, f"invalid JSON response ({e})")
 
 
 
@@ -223,27 +764,103 @@ class DojoClient(object):
         Sorted (reverse=true) list of (created_at, version) tuples.
         """
 
-        url = f'{self.dojo_url}/models?query=name:"{model_name}"&size=100'
-        response = self.generic_dojo_get_request(url)
-        resp = response.json()
-        versions = []
-        try:
-            for r in resp["results"]:
-                if len(r["image"].strip()) > 0:
+        versions = [
+            (version["created_at"], version["id"])
+            for version in self.get_version_history(model_name)
+            if version["runnable"]
+        ]
+        versions.sort(reverse=True)
+        return versions
+
+    def get_version_history(self, model_name: str, model_id: str = None):
+        """
+        Description
+        -----------
+        Return every version in the lineage of a model, oldest first, with
+        its created date and image. The lineage is fetched with one
+        /models/{model_id}/versions request. The version records are taken
+        from the local model index, then from the pages of a /models query
+        by the model's name. Only records neither has, e.g. of versions
+        under another name, are requested one at a time, concurrently (up
+        to METADATA_WORKERS at once) through the response cache.
+
+        Parameters
+        ----------
+        model_name: str
+            The name of the model; its latest version anchors the lineage.
+        model_id: str = None
+            A version of the model, anchoring the lineage instead.
+
+        Returns
+        -------
+        list of dicts of id, name, created_at ("%Y-%m-%d %H:%M:%S" or None),
+        image, runnable (has an image), and relation ("previous", "current"
+        or "later" relative to the anchor version). Empty if the model is
+        unknown.
+        """
+
+        versions = self.get_versions(model_name, model_id)
+        if not isinstance(versions, dict) or "current_version" not in versions:
+            return []
+
+        relations = {version: "previous" for version in versions["prev_versions"]}
+        relations[versions["current_version"]] = "current"
+        relations.update({version: "later" for version in versions["later_versions"]})
+
+        records = {}
+        if self.use_index:
+            for version_id in relations:
+                record = self.index.get(version_id)
+                if record is not None:
+                    records[version_id] = record
+
+        missing = [version_id for version_id in relations if version_id not in records]
+        if len(missing) > 0:
+            if model_name is None:
+                anchor = self.get_model_info(None, model_id=versions["current_version"])
+                model_name = anchor["name"] if anchor is not None else None
+                if anchor is not None and anchor["id"] in relations:
+                    records[anchor["id"]] = anchor
+            if model_name is not None:
+                try:
+                    for record in self.iter_models(latest=False, query=f'name:"{model_name}"'):
+                        if record.get("id") in relations:
+                            records[record["id"]] = record
+                        if all(version_id in records for version_id in relations):
+                            break
+                except DojoApiError:
+                    # The records are requested one at a time below instead.
+                    pass
+
+        def resolve(version_id):
+            if version_id in records:
+                return records[version_id]
+            return self.get_model_info(None, model_id=version_id)
+
+        history = []
+        with ThreadPoolExecutor(max_workers=max(1, self.metadata_workers)) as executor:
+            for version_id, record in zip(relations, executor.map(resolve, relations)):
+                record = record or {}
+                created_at = None
+                if record.get("created_at") is not None:
                     created_at = datetime.fromtimestamp(
-                        r["created_at"] / 1000
+                        record["created_at"] / 1000
                     ).strftime("%Y-%m-%d %H:%M:%S")
-                    versions.append((created_at, r["id"]))
-
-            versions.sort(reverse=True)
-            return versions
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(e.message)
-            else:
-                click.echo(e)
-            exit
+                image = (record.get("image") or "").strip()
+                history.append(
+                    {
+                        "id": version_id,
+                        "name": record.get("name"),
+                        "created_at": created_at,
+                        "image": image,
+                        "runnable": len(image) > 0,
+                        "relation": relations[version_id],
+                    }
+                )
 
+        # Versions whose record could not be resolved sort first.
+        history.sort(key=lambda version: version["created_at"] or "")
+        return history
 
     def get_outputfiles(self, model_id: str):
         """
@@ -276,49 +893,73 @@ class DojoClient(object):
                 The container id.
             name: str
                 The container name.
+
+        Raises
+        ------
+            ContainerNotFoundError if there is no such container and the run
+            registry does not record its results as collected.
         """
+        # Collected runs have had their container removed, so the run
+        # registry is checked before Docker.
+        run = RunRegistry().find(container_id=id, container_name=name)
+        if run is not None and run["harvested"]:
+            self.echo(
+                f'Results for {name if name is not None else id} were already collected in "{run["local_output_folder"]}".'
+            )
+            return
+
         # Instantiate the Docker Client.
-        docker_client = DockerClient()
+        docker_client = self.get_docker_client()
 
-        is_running = docker_client.is_running(container_id=id, container_name=name)
-        if is_running is None:
-            return
-        if is_running:
-            click.echo(
+        if docker_client.is_running(container_id=id, container_name=name):
+            self.echo(
                 f"Results for {name if name is not None else id} are not yet ready."
             )
-        else:
-            # Docker commands accept either name or id.
-            container = name if name is not None else id
+            return
 
-            # Copy the local_output_folder.txt file from the stopped container.
-            os.system(
-                f"docker cp {container}:/home/clouseau/local_output_folder.txt {os.getcwd()}/runs/local_output_folder.txt"
-            )
+        if run is not None:
+            self.harvest_run(run, docker_client)
+            return
 
-            # Read the local_output_folder location.
-            with open(f"{os.getcwd()}/runs/local_output_folder.txt", "r") as fh:
-                local_output_folder = fh.readline()
+        # Runs started before the run registry existed recorded their output
+        # folder in the container.
+        # Docker commands accept either name or id.
+        container = name if name is not None else id
 
-            # Read and process the run info.
-            with open(f"{local_output_folder}/run-info.txt", "r") as fh:
-                for l in fh.readlines():
-                    if l.startswith("output:"):
-                        output_paths = l.split("output:")[1].strip().split("\t")
-                    elif l.startswith("accessories:"):
-                        accessory_paths = l.split("accessories:")[1].strip().split("\t")
+        # Copy the local_output_folder.txt file from the stopped container.
+        copied = docker_client.copy_files(
+            container,
+            {f"{os.getcwd()}/runs": ["/home/clouseau/local_output_folder.txt"]},
+            show_progress=False,
+        )
+        if len(copied["missing"]) > 0:
+            self.echo(f"{container} does not record the run folder of its results.")
+            return
 
-            # Move all the model stuff.
-            self.process_finished_model(
-                container_id=id,
-                container_name=name,
-                local_output_folder=local_output_folder,
-                output_paths=output_paths,
-                accessory_paths=accessory_paths,
-            )
+        # Read the local_output_folder location.
+        with open(f"{os.getcwd()}/runs/local_output_folder.txt", "r") as fh:
+            local_output_folder = fh.readline()
+
+        # Read and process the run info.
+        with open(f"{local_output_folder}/run-info.txt", "r") as fh:
+            for l in fh.readlines():
+                if l.startswith("output:"):
+                    output_paths = l.split("output:")[1].strip().split("\t")
+                elif l.startswith("accessories:"):
+                    accessory_paths = l.split("accessories:")[1].strip().split("\t")
+
+        # Move all the model stuff.
+        self.process_finished_model(
+            container_id=id,
+            container_name=name,
+            local_output_folder=local_output_folder,
+            output_paths=output_paths,
+            accessory_paths=accessory_paths,
+            docker_client=docker_client,
+        )
 
-            # Clean up.
-            os.system(f"rm {os.getcwd()}/runs/local_output_folder.txt")
+        # Clean up.
+        os.remove(f"{os.getcwd()}/runs/local_output_folder.txt")
 
 
     # TODO: Make this a more generalized function so it can be used with outputfiles
@@ -344,32 +985,75 @@ class DojoClient(object):
             Content of the file as a string.
         """
 
-        docker_client = DockerClient()
+        return self.get_config_contents(image_name, [path])[path]
 
-        container = docker_client.client.containers.create(
-            image_name, 
-            command='echo -n "Do nothing!"',
-            detach=False
-        )
-        file_contents_stream, info = container.get_archive(path)
+    def get_config_contents(
+        self,
+        image_name: str,
+        paths: list,
+        docker_client: "DockerClient" = None,
+    ):
+        """
+        Description
+        -----------
+            Grabs the content of config file templates from a model image.
+            Templates are cached by (image digest, path), so each template is
+            read from an image only once. All templates missing from the cache
+            are read from a single temporary container.
+
+        Parameters
+        ----------
+            image_name: str
+                The name of the image to generate the docker container
+            paths: list
+                The paths where the config files are located
+            docker_client: DockerClient = None
+                Client used to read the image; a new one is created if None.
 
-        print(f'Copying "{info["name"]}" into memory')
-        file_contents = BytesIO()
-        for chunk in file_contents_stream:
-            file_contents.write(chunk)
+        Returns
+        ----------
+            dict of {path: content of the file as a string}.
+        """
 
+        if docker_client is None:
+            docker_client = self.get_docker_client()
 
-        file_contents.seek(0)
-        with tar_open(fileobj=file_contents, mode="r:") as tar:
-            config_filehandle = os.path.basename(path)
-            extracted_contents = tar.extractfile(config_filehandle)
-            config_content = extracted_contents.read().decode()
+        image_digest = docker_client.image_digest(image_name)
 
-        container.remove(force=True)
-        return config_content
+        config_contents = {}
+        if self.template_cache is not None and not self.refresh_cache:
+            for path in paths:
+                content = self.template_cache.get(image_digest, path)
+                if content is not None:
+                    config_contents[path] = content
 
+        missing = [path for path in paths if path not in config_contents]
+        if len(missing) == 0:
+            return config_contents
 
-    def get_versions(self, model_name: str):
+        container = docker_client.client.containers.create(
+            image_name,
+            command='echo -n "Do nothing!"',
+            detach=False
+        )
+        try:
+            for path, _, _, fileobj in docker_client.stream_files(container.id, missing):
+                if fileobj is None:
+                    continue
+                self.echo(f'Copying "{os.path.basename(path)}" into memory')
+                config_contents[path] = fileobj.read().decode()
+                if self.template_cache is not None:
+                    self.template_cache.put(image_digest, path, config_contents[path])
+        finally:
+            container.remove(force=True)
+
+        for path in missing:
+            if path not in config_contents:
+                raise ConfigTemplateError(image_name, f"{path} was not found.")
+
+        return config_contents
+
+    def get_versions(self, model_name: str, model_id: str = None):
         """
         Description
         -----------
@@ -380,6 +1064,8 @@ class DojoClient(object):
 
         model_name: str
             The name of the model.
+        model_id: str = None
+            A version of the model, used instead of its latest version.
 
         Returns
         -------
@@ -394,140 +1080,107 @@ class DojoClient(object):
         """
 
         # (1) Get the model_id of the latest version.
-        model_dict = self.get_model_info(model_name)
-        model_id = model_dict["id"]
+        if model_id is None:
+            model_dict = self.get_model_info(model_name)
+            if model_dict is None:
+                return None
+            model_id = model_dict["id"]
+
+        # New versions are added over time, so the version lists are only
+        # taken from a fresh index.
+        if self.use_index and self.index_is_fresh():
+            versions = self.index.versions(model_id)
+            if versions is not None:
+                return versions
 
         # (2) Call dojo /models/{model_id}/versions
         url = f"{self.dojo_url}/models/{model_id}/versions"
-        response = self.generic_dojo_get_request(url)
+        try:
+            response = self.generic_dojo_get_request(url)
+        except DojoApiError as e:
+            # Without the network, fall back to the versions of a stale index.
+            if self.use_index:
+                versions = self.index.versions(model_id)
+                if versions is not None:
+                    self.echo_stale_index(e)
+                    return versions
+            raise
         try:
             return response.json()
 
-        except Exception as e:
-            if hasattr(e, "message"):
-                click.echo(e.message)
-            else:
-                click.echo(e)
-            exit
-
-    def process_finished_model(
-        self,
-        container_id: str,
-        container_name: str,
-        local_output_folder: str,
-        output_paths,
-        accessory_paths,
-    ):
-        """
-        Description
-        -----------
-            Process the finished model:
-            (1) copy logs
-            (2) write output and accessory files
-            (3) remove container
-
-        Parameters
-        ----------
-            container_id: str
-                Docker container id e.g. e76880c24933
-                Either this or container_name are required.
-            container_name: str
-                Docker container name e.g. dojo-stochasticgriddedconflictmodel20211227133418
-                Etiher this or container_id are required.
-            local_output_fodler: str
-                Path to the model output directory.
-            output_paths:
-                Docker container paths for output files.
-            accessory_paths:
-                Docker container paths for accessory files.
-
-
-        """
-        # The docker commands will take either id or name.
-        container = container_id if container_id is not None else container_name
-
-        # Capture the container logs to file.
-        os.system(f"docker logs {container} > '{local_output_folder}/logs.txt'")
-
-        # Copy output files from the container to the local folder.
-        if len(output_paths) > 0:
-            os.makedirs(f"{local_output_folder}/output")
-        for path in output_paths:
-            os.system(
-                f"docker cp {container}:'{path}' '{local_output_folder}/output/{os.path.basename(path)}'"
-            )
-
-        # Copy accessory files from the container to the local folder.
-        if len(accessory_paths) > 0:
-            os.makedirs(f"{local_output_folder}/accessories")
-        for path in accessory_paths:
-            os.system(
-                f"docker cp {container}:'{path}' '{local_output_folder}/accessories/{os.path.basename(path)}'"
-            )
-
-        # Nuke the container from orbit.
-        os.system(f"docker container rm {container}")
-
-        # A miracle occurred.
-        click.echo(
-            f'\n\nRun completed.\nModel output, run-parameters, and log files are located in "{local_output_folder}".'
-        )
+        except ValueError as e:
+            raise DojoApiError(url, f"invalid JSON response ({e})")
 
-    def run_model(
+    def prepare_run(
         self,
         model_name: str,
-        params: str = None,
-        params_filename: str = None,
         version: str = None,
-        local_output_folder: str = None,
-        run_attached: bool = True,
+        docker_client=None,
+        pull_policy: str = "missing",
+        resources: dict = None,
+        timer: PhaseTimer = None,
     ):
         """
         Description
         -----------
-            Runs the selected model or model_id. Gets metadata from the dojo api, builds
-            the volume mounts, and uses docker_client.py to download and run
-            the image. Finally, it executes the model directive.
+            Gather everything a run of the model needs that does not depend on
+            the run parameters: the model record, the /dojo metadata, output and
+            accessory paths, accessory captions, and the config file templates.
+            The image is pulled here because the config templates are read from
+            it. A sweep calls this once and reuses the result for every run.
 
         Parameters
         ----------
             model_name: str
                 Name of the model to run e.g. CHIRPS-Monthly
-
-            params: str
-                JSON of model parameters.
-
-            params_filename: str
-                If params if not passed, model parameters JSON is loaded from this file.
-
             version: str = None
                 The specific model_id (or "version") to run. Overrides model_name.
+            docker_client: DockerClient = None
+                Client used to pull the image and read config templates.
+            pull_policy: str = "missing"
+                When to pull the image; see DockerClient.ensure_image().
+            resources: dict = None
+                Container resource settings overriding the RESOURCES defaults
+                of the .config file; see model_resources().
+            timer: PhaseTimer = None
+                Records the metadata, image and config_templates phases.
 
-            local_output_folder: str
-                Local folder where model output is written.
-
-            run_attached: bool = True
-                Option to run the model detached (in background.)
-
+        Returns
+        -------
+            dict run context passed to run_prepared_model().
+
+        Raises
+        ------
+            ModelNotFoundError if no model matches model_name or version,
+            ModelImageError if the model version has no Docker image,
+            DockerImageError if the image cannot be pulled, and
+            ConfigTemplateError if its config files cannot be read.
         """
 
+        if timer is None:
+            timer = PhaseTimer()
+
         # Get the model_id and image from the model_name or version.
-        model_dict = self.get_model_info(model_name, model_id=version)
+        with timer.phase("metadata"):
+            model_dict = self.get_model_info(model_name, model_id=version)
+        if model_dict is None:
+            raise ModelNotFoundError(version or model_name)
         model_id = model_dict["id"]
         image_name = model_dict["image"]
+        if model_name is None:
+            model_name = model_dict["name"]
+        if len((image_name or "").strip()) == 0:
+            raise ModelImageError(model_name, model_id)
 
-        # Use default directory if not specified.
-        datetimestamp = datetime.today().strftime("%Y%m%d%H%M%S")
-        if local_output_folder == None:
-            local_output_folder = (
-                f"{os.getcwd()}/runs/{model_name}/{model_id}/{datetimestamp}"
-            )
+        # Check the container resource settings before any slow work.
+        from dojocli.docker_client import build_resource_kwargs
 
-        # Create main directory structure.
-        os.makedirs(local_output_folder)
+        resources = self.model_resources(model_name, resources)
+        build_resource_kwargs(resources)
 
         # Get the metadata for this model.
-        metadata = self.get_metadata(model_id)
+        with timer.phase("metadata"):
+            metadata = self.get_metadata(model_id)
 
         # Process output file locations.
         outputfiles = metadata["outputfile"]
@@ -553,62 +1206,665 @@ class DojoClient(object):
                     os.path.basename(accessory_file_path)
                 ] = accessory_file["caption"]
 
-        # Load parameters.
-        if params == None:
-            # If params json not passed then read from file.
-            with open(params_filename, "r") as fh:
-                params = json.load(fh)
-        elif isinstance(params, str):
-            # If params was passed in the command line it is a str; convert to dict.
-            params = json.loads(params)
-
-
-        def replace_along_params(string, new_values, available_parameters):
-            # Assuming no overlap
-            for param in sorted(available_parameters, key = lambda param: param['start'], reverse=True):
-                name = param["annotation"]["name"]
-                value = new_values[name] if name in new_values else param["annotation"]["default_value"]
-                string = string[:param["start"]] + str(value) + string[param["end"]:]
-            return string
+        if docker_client is None:
+            docker_client = self.get_docker_client()
 
+        # Pull the image unless the local copy is already current.
+        self.echo(f"Getting model image ...\n")
+        with timer.phase("image"):
+            if not docker_client.ensure_image(
+                image_name, pull_policy, quiet=not self.verbose, echo=self.echo
+            ):
+                self.echo(f"{image_name} is up to date.\n")
 
-        # get config files and hydrate them
-        config_dict = {}
-        for config_file in metadata["config"]:
+        # Get the config file templates from the image.
+        config_contents = {}
+        with timer.phase("config_templates"):
             try:
-                config_content = self.get_config_content(image_name, config_file["path"])
-                config_rehydrated = replace_along_params(config_content, params, config_file["parameters"])
-                if not os.path.isdir("temp"):
-                    os.mkdir("temp")
-
-                temp_file_name = (
-                    os.getcwd() + "/temp/temp_" + config_file["path"].split("/")[-1]
+                config_contents = self.get_config_contents(
+                    image_name,
+                    [config_file["path"] for config_file in metadata["config"]],
+                    docker_client,
                 )
-                config_dict.update({temp_file_name: config_file["path"]})
-                with open(temp_file_name, "w") as f:
-                    f.write(config_rehydrated)
-
+            except DojoError:
+                raise
             except Exception as e:
-                print(f"error getting config files: {e}")
+                raise ConfigTemplateError(image_name, str(e)) from e
 
-        # Write the parameters used out to the run result directory.
-        with open(f"{local_output_folder}/run-parameters.json", "w") as fh:
-            json.dump(params, fh, indent=4)
+            # Compile the directive and config templates once for every run.
+            command_template = ParameterTemplate(
+                metadata["directive"]["command"], metadata["directive"]["parameters"]
+            )
+            config_templates = {
+                config_file["path"]: ParameterTemplate(
+                    config_contents[config_file["path"]], config_file["parameters"]
+                )
+                for config_file in metadata["config"]
+                if config_file["path"] in config_contents
+            }
 
-        # Write accessory file captions to the run result directory.
-        if len(accessory_captions) > 0:
-            with open(f"{local_output_folder}/accessories-captions.json", "w") as fh:
-                json.dump(accessory_captions, fh, indent=4)
+        return {
+            "model_name": model_name,
+            "model_id": model_id,
+            "image_name": image_name,
+            "metadata": metadata,
+            "output_paths": output_paths,
+            "accessory_paths": accessory_paths,
+            "accessory_captions": accessory_captions,
+            "command_template": command_template,
+            "config_templates": config_templates,
+            "resources": resources,
+        }
+
+    def harvest_run(self, run: dict, docker_client: "DockerClient", exit_code: int = None):
+        """
+        Description
+        -----------
+            Collect the results of a finished detached run from the run
+            registry and mark it harvested.
 
-        # Instantiate the Docker Client.
-        docker_client = DockerClient()
+        Parameters
+        ----------
+            run: dict
+                A run returned by RunRegistry.
+            docker_client: DockerClient
+                Client used to copy the files.
+            exit_code: int = None
+                The container exit code, if already known e.g. from a Docker
+                event.
+        """
 
-        # Pull the image
-        click.echo(f"Getting model image ...\n")
-        docker_client.pull_image(image_name)
+        container_id = run["container_id"]
+        if exit_code is None:
+            exit_code = docker_client.wait_container(container_id)
 
-        # Set run command from metadata["directive"]["command"] and substitute params.
-        model_command = replace_along_params(metadata["directive"]["command"], params, metadata["directive"]["parameters"])
+        # account for wildcard output files
+        wildcard_outputs = docker_client.match_pattern_output_path(
+            container_id, run["output_paths"]
+        )
+
+        self.process_finished_model(
+            container_id=container_id,
+            container_name=None,
+            local_output_folder=run["local_output_folder"],
+            output_paths=wildcard_outputs,
+            accessory_paths=run["accessory_paths"],
+            docker_client=docker_client,
+        )
+        report = read_run_report(run["local_output_folder"])
+        run_report = report.get("run", {})
+        run_report["exit_code"] = exit_code
+        update_run_report(run["local_output_folder"], "run", run_report)
+
+        # Record runs started with result reuse on.
+        if "result_cache" in report and exit_code == 0:
+            with open(f"{run['local_output_folder']}/run-parameters.json", "r") as fh:
+                params = json.load(fh)
+            self.result_cache.put(
+                report["result_cache"]["key"],
+                run["local_output_folder"],
+                {
+                    "model_name": run["model_name"],
+                    "model_id": run["model_id"],
+                    "image": run_report.get("image"),
+                    "params": params,
+                },
+            )
+        RunRegistry().mark_harvested(container_id, exit_code)
+
+    def model_resources(self, model_name: str, overrides: dict = None):
+        """
+        Description
+        -----------
+            Merge the container resource settings of a run: the "default"
+            entry of the RESOURCES field of the .config file, then the entry
+            named after the model, then overrides e.g. from runmodel options.
+            Unset (None or empty) overrides are ignored.
+
+            Example .config field:
+                "RESOURCES": {
+                    "default": {"cpus": 2, "memory": "4g"},
+                    "Topoflow": {"cpuset": "0-7", "memory": "16g", "shm_size": "2g"}
+                }
+
+        Returns
+        -------
+            dict of resource settings; see docker_client.build_resource_kwargs().
+        """
+
+        resources = dict(self.resource_defaults.get("default", {}))
+        resources.update(self.resource_defaults.get(model_name, {}))
+        for key, value in (overrides or {}).items():
+            if value is not None and value != [] and value != ():
+                resources[key] = list(value) if isinstance(value, tuple) else value
+        return resources
+
+    def prefetch_images(
+        self,
+        model_names: list = (),
+        versions: list = (),
+        workers: int = 4,
+        pull_policy: str = "missing",
+    ):
+        """
+        Description
+        -----------
+            Resolve the images of models and model versions through the dojo
+            api and pull the ones that are missing or out of date locally, up
+            to workers images at a time.
+
+        Parameters
+        ----------
+            model_names: list
+                Model names; the latest version of each is used.
+            versions: list
+                Model version ids.
+            workers: int = 4
+                Maximum number of images pulled at once.
+            pull_policy: str = "missing"
+                When to pull each image; see DockerClient.ensure_image().
+
+        Returns
+        -------
+            dict of {image name: "pulled", "up to date", "no image", or an
+            error message}.
+        """
+
+        images = {}
+        lookups = [(name, None) for name in model_names] + [(None, v) for v in versions]
+        for model_name, version in lookups:
+            model_dict = self.get_model_info(model_name, model_id=version)
+            label = model_name if version is None else version
+            if model_dict is None or len(model_dict["image"].strip()) == 0:
+                images[label] = "no image"
+            else:
+                images[model_dict["image"]] = None
+
+        def prefetch(image_name):
+            try:
+                pulled = self.get_docker_client().ensure_image(image_name, pull_policy, quiet=True)
+                return "pulled" if pulled else "up to date"
+            except Exception as e:
+                return f"error: {e}"
+
+        pending = [image for image, status in images.items() if status is None]
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for image_name, status in zip(pending, executor.map(prefetch, pending)):
+                images[image_name] = status
+
+        return images
+
+    def process_finished_model(
+        self,
+        container_id: str,
+        container_name: str,
+        local_output_folder: str,
+        output_paths,
+        accessory_paths,
+        docker_client: "DockerClient" = None,
+        show_progress: bool = True,
+        timer: PhaseTimer = None,
+        bundle_format: str = None,
+        local_paths: list = None,
+    ):
+        """
+        Description
+        -----------
+            Process the finished model:
+            (1) copy logs
+            (2) write output and accessory files
+            (3) remove container and the rendered config files
+
+        Parameters
+        ----------
+            container_id: str
+                Docker container id e.g. e76880c24933
+                Either this or container_name are required.
+            container_name: str
+                Docker container name e.g. dojo-stochasticgriddedconflictmodel20211227133418
+                Etiher this or container_id are required.
+            local_output_fodler: str
+                Path to the model output directory.
+            output_paths:
+                Docker container paths for output files.
+            accessory_paths:
+                Docker container paths for accessory files.
+            docker_client: DockerClient = None
+                Client used to copy the files; a new one is created if None.
+            show_progress: bool = True
+                Display copy progress and the copy throughput summary. The
+                summary is written to run-report.json either way.
+            timer: PhaseTimer = None
+                Timer of the run, to which the logs, copy and cleanup phases
+                are added. Phases are merged into the "phases" section of
+                run-report.json either way.
+            bundle_format: str = None
+                Write the output and accessory files into a compressed
+                {local_output_folder}/outputs.{bundle_format} bundle (tar.gz,
+                tar.zst or zip) instead of the output and accessories folders;
+                see OutputBundle. Defaults to the BUNDLE_FORMAT setting of the
+                .config file.
+            local_paths: list = None
+                Files and folders already in the output or accessories folder,
+                e.g. collected from output mounts. With a bundle they are
+                moved into it too; otherwise they are left in place.
+
+        """
+        # The docker commands will take either id or name.
+        container = container_id if container_id is not None else container_name
+
+        if docker_client is None:
+            docker_client = self.get_docker_client()
+        if timer is None:
+            timer = PhaseTimer()
+
+        # Capture the container logs to file, unless they were streamed there
+        # during an attached run.
+        if not os.path.exists(f"{local_output_folder}/logs.txt"):
+            with timer.phase("logs"):
+                docker_client.write_logs(container, f"{local_output_folder}/logs.txt")
+
+        # Copy output and accessory files from the container to the local
+        # folder.
+        destinations = {}
+        if len(output_paths) > 0:
+            destinations[f"{local_output_folder}/output"] = output_paths
+        if len(accessory_paths) > 0:
+            destinations[f"{local_output_folder}/accessories"] = accessory_paths
+        if bundle_format is None:
+            bundle_format = self.bundle_format
+        local_files = []
+        for path in local_paths or []:
+            if os.path.isdir(path):
+                local_files.extend(
+                    os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+                )
+            else:
+                local_files.append(path)
+        bundle = None
+        if bundle_format is not None and len(destinations) + len(local_files) > 0:
+            from dojocli.bundle import BUNDLE_MANIFEST_FILENAME, OutputBundle
+
+            bundle = OutputBundle(
+                f"{local_output_folder}/outputs.{bundle_format}",
+                bundle_format,
+                local_output_folder,
+                self.bundle_level,
+            )
+        else:
+            for folder in destinations:
+                os.makedirs(folder, exist_ok=True)
+
+        with timer.phase("copy"):
+            copied = docker_client.copy_files(
+                container,
+                destinations,
+                workers=self.harvest_workers,
+                show_progress=show_progress,
+                blob_store=self.blob_store if bundle is None else None,
+                bundle=bundle,
+            )
+            manifest = None
+            if bundle is not None:
+                with ThreadPoolExecutor(max_workers=max(1, self.harvest_workers)) as executor:
+                    list(executor.map(bundle.add_local_file, local_files))
+                manifest = bundle.close()
+                # The bundled files are removed only once the bundle is
+                # complete, along with the folders they leave empty.
+                for path in local_paths or []:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                for folder in (f"{local_output_folder}/output", f"{local_output_folder}/accessories"):
+                    try:
+                        os.rmdir(folder)
+                    except OSError:
+                        pass
+        for path in copied["missing"]:
+            self.echo(f"{path} was not found in {container}.")
+        megabytes = copied["bytes"] / (1024 * 1024)
+        mb_per_second = megabytes / copied["seconds"] if copied["seconds"] > 0 else 0.0
+        if show_progress:
+            self.echo(
+                f"Copied {len(copied['files'])} file(s), {megabytes:.1f} MB in {copied['seconds']:.1f}s ({mb_per_second:.1f} MB/s)."
+            )
+        harvest = {
+            "files": len(copied["files"]),
+            "bytes": copied["bytes"],
+            "seconds": round(copied["seconds"], 3),
+            "mb_per_second": round(mb_per_second, 3),
+            "workers": self.harvest_workers,
+        }
+        if len(copied["missing"]) > 0:
+            harvest["missing"] = copied["missing"]
+        if manifest is not None:
+            harvest["bundle"] = {
+                "path": bundle.path,
+                "format": bundle_format,
+                "bytes": manifest["bytes"],
+                "bundle_bytes": manifest["bundle_bytes"],
+                "ratio": round(manifest["bundle_bytes"] / manifest["bytes"], 3) if manifest["bytes"] > 0 else None,
+            }
+            if show_progress:
+                self.echo(
+                    f"Bundled into {bundle.path}, {manifest['bundle_bytes'] / (1024 * 1024):.1f} MB compressed; see {BUNDLE_MANIFEST_FILENAME} for checksums."
+                )
+        elif self.blob_store is not None:
+            harvest["blob_store"] = {
+                "root": self.blob_store.root,
+                "duplicate_files": copied["duplicate_files"],
+                "bytes_saved": copied["duplicate_bytes"],
+                "methods": copied["methods"],
+            }
+            if show_progress:
+                self.echo(
+                    f"{copied['duplicate_files']} file(s), {copied['duplicate_bytes'] / (1024 * 1024):.1f} MB were already in the blob store and take no extra space."
+                )
+        update_run_report(local_output_folder, "harvest", harvest)
+
+        # Nuke the container from orbit.
+        with timer.phase("cleanup"):
+            docker_client.remove_container(container)
+            shutil.rmtree(f"{local_output_folder}/configs", ignore_errors=True)
+
+        # A detached run recorded its earlier phases when it was started.
+        phases = read_run_report(local_output_folder).get("phases", {})
+        phases.update(timer.as_dict())
+        update_run_report(local_output_folder, "phases", phases)
+
+        # A miracle occurred.
+        self.echo(
+            f'\n\nRun completed.\nModel output, run-parameters, and log files are located in "{local_output_folder}".'
+        )
+
+    def reuse_results_of(
+        self, entry: dict, local_output_folder: str, run_report: dict, timer: PhaseTimer
+    ):
+        """
+        Description
+        -----------
+            Fill a run folder with the results of an earlier identical run from
+            the result cache, in place of running the container.
+
+        Returns
+        -------
+            0, the exit code of the cached run.
+        """
+
+        with timer.phase("reuse"):
+            restored = self.result_cache.restore(entry, local_output_folder)
+
+        run_report["exit_code"] = 0
+        update_run_report(local_output_folder, "run", run_report)
+        update_run_report(
+            local_output_folder,
+            "result_cache",
+            dict(key=entry["key"], hit=True, reused_from=entry["run_folder"], **restored),
+        )
+        update_run_report(local_output_folder, "phases", timer.as_dict())
+
+        self.echo(
+            f'\nReused the results of the identical run in "{entry["run_folder"]}" ({restored["linked"]} file(s) linked, {restored["copied"]} copied); use --force to run the model again.'
+        )
+        self.echo(
+            f'\nRun completed.\nModel output, run-parameters, and log files are located in "{local_output_folder}".'
+        )
+        return 0
+
+    def prepare_output_mounts(
+        self,
+        run_context: dict,
+        config_dict: dict,
+        local_output_folder: str,
+        docker_client: "DockerClient",
+    ):
+        """
+        Description
+        -----------
+            Create the host folders bind-mounted at the output directories of a
+            run, under {local_output_folder}/mounts, writable by any container
+            user (MOUNT_FOLDER_MODE). The directories chosen by
+            plan_output_mounts() are recorded in the "output_mounts" section of
+            run-report.json, with the reason each other directory is copied.
+
+        Returns
+        -------
+            dict of {host folder: container directory}.
+        """
+
+        directories = [output["output_directory"] for output in run_context["metadata"]["outputfile"]]
+        if "image_directory_contents" not in run_context:
+            run_context["image_directory_contents"] = docker_client.image_directory_contents(
+                run_context["image_name"], sorted({posixpath.normpath(d) for d in directories})
+            )
+        directories, fallbacks = plan_output_mounts(
+            directories, list(config_dict.values()), run_context["image_directory_contents"]
+        )
+
+        mounts = {}
+        for directory in directories:
+            host_folder = f"{local_output_folder}/mounts/{directory.strip('/').replace('/', '_')}"
+            os.makedirs(host_folder, exist_ok=True)
+            # makedirs() applies the umask; the container user needs write access.
+            os.chmod(host_folder, MOUNT_FOLDER_MODE)
+            mounts[host_folder] = directory
+        for directory, reason in fallbacks.items():
+            self.echo(f"Copying the outputs of {directory} after the run instead of mounting it: {reason}.")
+
+        update_run_report(
+            local_output_folder,
+            "output_mounts",
+            {"mounts": {directory: host for host, directory in mounts.items()}, "fallbacks": fallbacks},
+        )
+        return mounts
+
+    def collect_output_mounts(
+        self,
+        mounts: dict,
+        local_output_folder: str,
+        output_paths: list,
+        accessory_paths: list,
+        show_progress: bool = True,
+    ):
+        """
+        Description
+        -----------
+            Move the output and accessory files of a finished run out of its
+            output mounts into the output and accessories folders, then remove
+            the mounts folder with the files no output path matched. The
+            mounts folder is kept if any file could not be moved.
+
+        Returns
+        -------
+            list of the local files and folders collected.
+        """
+
+        destinations = {}
+        if len(output_paths) > 0:
+            destinations[f"{local_output_folder}/output"] = output_paths
+        if len(accessory_paths) > 0:
+            destinations[f"{local_output_folder}/accessories"] = accessory_paths
+
+        collected = collect_mounted_files(mounts, destinations)
+        if show_progress:
+            self.echo(
+                f"\nCollected {len(collected['files'])} file(s), {collected['bytes'] / (1024 * 1024):.1f} MB from the output mounts without copying."
+            )
+        if len(collected["failed"]) > 0:
+            self.echo(
+                f"Could not move {len(collected['failed'])} file(s) out of {local_output_folder}/mounts; they were left there."
+            )
+        else:
+            shutil.rmtree(f"{local_output_folder}/mounts", ignore_errors=True)
+
+        report = read_run_report(local_output_folder).get("output_mounts", {})
+        report.update(
+            {
+                "files": len(collected["files"]),
+                "bytes": collected["bytes"],
+                "failed": collected["failed"],
+            }
+        )
+        update_run_report(local_output_folder, "output_mounts", report)
+        return collected["files"]
+
+    def render_config_files(self, run_context: dict, params: dict, config_folder: str):
+        """
+        Description
+        -----------
+            Substitute the run parameters into the config file templates and
+            write them to config_folder for mounting into the container.
+
+        Returns
+        -------
+            dict of {local file path: container file path}.
+        """
+
+        os.makedirs(config_folder, exist_ok=True)
+
+        config_dict = {}
+        for path, template in run_context["config_templates"].items():
+            config_rehydrated = template.render(params)
+            temp_file_name = (
+                f"{config_folder}/temp_" + path.split("/")[-1]
+            )
+            config_dict.update({temp_file_name: path})
+            with open(temp_file_name, "w") as f:
+                f.write(config_rehydrated)
+
+        return config_dict
+
+    def run(
+        self,
+        model_name: str = None,
+        params: dict = None,
+        params_filename: str = None,
+        version: str = None,
+        local_output_folder: str = None,
+        run_attached: bool = True,
+        pull_policy: str = "missing",
+        quiet: bool = False,
+        json_logs: bool = False,
+        resources: dict = None,
+        reuse: bool = None,
+        force: bool = False,
+        stream_outputs: bool = False,
+        mount_outputs: bool = None,
+        bundle_format: str = None,
+    ):
+        """
+        Description
+        -----------
+            Runs the selected model or model_id. Gets metadata from the dojo api, builds
+            the volume mounts, and uses docker_client.py to download and run
+            the image. Finally, it executes the model directive.
+
+            This is the entry point of library callers: failures raise
+            DojoError subclasses, and the outcome of the run is returned.
+
+        Parameters
+        ----------
+            model_name: str
+                Name of the model to run e.g. CHIRPS-Monthly
+
+            params: dict or str
+                Model parameters, or their JSON.
+
+            params_filename: str
+                If params if not passed, model parameters JSON is loaded from this file.
+
+            version: str = None
+                The specific model_id (or "version") to run. Overrides model_name.
+
+            local_output_folder: str
+                Local folder where model output is written.
+
+            run_attached: bool = True
+                Option to run the model detached (in background.)
+
+            pull_policy: str = "missing"
+                When to pull the image; see DockerClient.ensure_image().
+
+            quiet: bool = False
+                Do not echo the model logs while running attached.
+
+            json_logs: bool = False
+                Also write timestamped JSON lines logs to logs.jsonl.
+
+            resources: dict = None
+                Container resource settings; see model_resources().
+
+            reuse: bool = None
+                Reuse the results of an identical earlier run; see
+                run_prepared_model().
+
+            force: bool = False
+                Run the model even if an identical run is cached.
+
+            stream_outputs: bool = False
+                Copy output files while an attached run is still running; see
+                run_prepared_model().
+
+            mount_outputs: bool = None
+                Bind-mount the output directories of an attached run; see
+                run_prepared_model().
+
+            bundle_format: str = None
+                Bundle the copied output files of an attached run; see
+                process_finished_model().
+
+        Returns
+        -------
+            dict of the run's model_name, model_id, container_name and
+            output_folder; its exit_code when attached or reused (else None);
+            the detached Docker container (else None); and the contents of
+            its run-report.json ("report").
+
+        Raises
+        ------
+            ModelNotFoundError, ModelImageError, DockerImageError,
+            DojoApiError, TemplateError, DockerUnavailableError, and ValueError for an unusable bundle
+            format or one combined with stream_outputs.
+
+        """
+
+        # Load parameters.
+        if params == None:
+            # If params json not passed then read from file.
+            with open(params_filename, "r") as fh:
+                params = json.load(fh)
+        elif isinstance(params, str):
+            # If params was passed in the command line it is a str; convert to dict.
+            params = json.loads(params)
+
+        # Fail on an unusable bundle format before the model runs. Streamed
+        # files are written to the run folder as they are harvested, so they
+        # cannot go into a bundle that is written after the run.
+        if (bundle_format or self.bundle_format) is not None:
+            from dojocli.bundle import check_bundle_format
+
+            check_bundle_format(bundle_format or self.bundle_format)
+            if stream_outputs and run_attached:
+                raise ValueError("--stream-outputs cannot be combined with --bundle or BUNDLE_FORMAT.")
+
+        # The Docker client is connected by prepare_run() once the model is
+        # found, so an unknown model fails without needing Docker.
+        timer = PhaseTimer()
+        run_context = self.prepare_run(
+            model_name, version, None, pull_policy, resources, timer
+        )
+        docker_client = self.get_docker_client()
+
+        # Use default directory if not specified. Runs of a model started in
+        # the same second by this process get numbered.
+        datetimestamp = unique_run_stamp(
+            run_context["model_id"], datetime.today().strftime("%Y%m%d%H%M%S")
+        )
+        if local_output_folder == None:
+            local_output_folder = (
+                f"{os.getcwd()}/runs/{run_context['model_name']}/{run_context['model_id']}/{datetimestamp}"
+            )
 
         # Create the container name.
         if model_name is None:
@@ -617,53 +1873,390 @@ class DojoClient(object):
             container_name = re.sub("[ \]\[,()_]", "", model_name.lower()).strip()
             container_name = f"dojo-{container_name}{datetimestamp}"
 
-        click.echo(
+        outcome = self.run_prepared_model(
+            run_context,
+            params,
+            local_output_folder,
+            container_name,
+            docker_client,
+            run_attached=run_attached,
+            quiet=quiet,
+            json_logs=json_logs,
+            timer=timer,
+            reuse=reuse,
+            force=force,
+            stream_outputs=stream_outputs,
+            mount_outputs=mount_outputs,
+            bundle_format=bundle_format,
+        )
+
+        attached = run_attached or isinstance(outcome, int)
+        return {
+            "model_name": run_context["model_name"],
+            "model_id": run_context["model_id"],
+            "container_name": container_name,
+            "output_folder": local_output_folder,
+            "exit_code": outcome if attached else None,
+            "container": None if attached else outcome,
+            "report": read_run_report(local_output_folder),
+        }
+
+    def run_model(
+        self,
+        model_name: str,
+        params: str = None,
+        params_filename: str = None,
+        version: str = None,
+        local_output_folder: str = None,
+        run_attached: bool = True,
+        pull_policy: str = "missing",
+        quiet: bool = False,
+        json_logs: bool = False,
+        resources: dict = None,
+        reuse: bool = None,
+        force: bool = False,
+        stream_outputs: bool = False,
+        mount_outputs: bool = None,
+        bundle_format: str = None,
+    ):
+        """
+        Description
+        -----------
+            Runs the selected model or model_id; see run() for the parameters.
+
+        Returns
+        -------
+            The container exit code when attached, otherwise the detached
+            container.
+        """
+
+        result = self.run(
+            model_name,
+            params,
+            params_filename,
+            version,
+            local_output_folder,
+            run_attached=run_attached,
+            pull_policy=pull_policy,
+            quiet=quiet,
+            json_logs=json_logs,
+            resources=resources,
+            reuse=reuse,
+            force=force,
+            stream_outputs=stream_outputs,
+            mount_outputs=mount_outputs,
+            bundle_format=bundle_format,
+        )
+        return result["container"] if result["container"] is not None else result["exit_code"]
+
+    def run_prepared_model(
+        self,
+        run_context: dict,
+        params: dict,
+        local_output_folder: str,
+        container_name: str,
+        docker_client: "DockerClient",
+        run_attached: bool = True,
+        quiet: bool = False,
+        json_logs: bool = False,
+        timer: PhaseTimer = None,
+        reuse: bool = None,
+        force: bool = False,
+        stream_outputs: bool = False,
+        mount_outputs: bool = None,
+        bundle_format: str = None,
+    ):
+        """
+        Description
+        -----------
+            Run one parameter set of a model prepared by prepare_run(): write the
+            run folder, render the config files, run the container, and, when
+            attached, collect the outputs.
+
+        Parameters
+        ----------
+            run_context: dict
+                Returned by prepare_run().
+            params: dict
+                Model parameters for this run.
+            local_output_folder: str
+                Local folder where model output is written. Must not exist.
+            container_name: str
+                Name of the Docker container for this run.
+            docker_client: DockerClient
+                Client used to run the container.
+            run_attached: bool = True
+                Option to run the model detached (in background.)
+            quiet: bool = False
+                Do not echo the model logs or copy progress of an attached
+                run. The last log lines are still shown if the model fails.
+            json_logs: bool = False
+                Also write the logs of an attached run to logs.jsonl as
+                timestamped JSON lines.
+            timer: PhaseTimer = None
+                Timer of the run, e.g. already holding the prepare_run()
+                phases. The phases are written to run-report.json together
+                with the container resource samples of an attached run.
+            reuse: bool = None
+                Reuse the results of an earlier identical run instead of
+                running the container, and record this run for reuse if it
+                succeeds. Defaults to the RESULT_CACHE setting of the .config
+                file.
+            force: bool = False
+                Run the container even if an earlier identical run is cached.
+            stream_outputs: bool = False
+                Copy each output file of an attached run as soon as it stops
+                growing, checking every STREAM_INTERVAL seconds, so only the
+                files written last are left to copy after the run.
+            mount_outputs: bool = None
+                Bind-mount host folders at the output directories of an
+                attached run, so the files written there need no copy; see
+                prepare_output_mounts(). Defaults to the MOUNT_OUTPUTS setting
+                of the .config file.
+            bundle_format: str = None
+                Write the copied output and accessory files of an attached run
+                into a compressed bundle; see process_finished_model().
+
+        Returns
+        -------
+            The container exit code when attached, otherwise the detached
+            container. 0 when the results of an earlier run were reused.
+        """
+
+        model_name = run_context["model_name"]
+        model_id = run_context["model_id"]
+        image_name = run_context["image_name"]
+        output_paths = run_context["output_paths"]
+        accessory_paths = run_context["accessory_paths"]
+        accessory_captions = run_context["accessory_captions"]
+        if timer is None:
+            timer = PhaseTimer()
+        # A client that is not verbose renders no logs or progress bars.
+        quiet = quiet or not self.verbose
+
+        # Create main directory structure.
+        os.makedirs(local_output_folder)
+        run_report = {
+            "model_name": model_name,
+            "model_id": model_id,
+            "image": image_name,
+            "container_name": container_name,
+            "started": datetime.now().isoformat(),
+            "exit_code": None,
+        }
+        update_run_report(local_output_folder, "run", run_report)
+        render_start = perf_counter()
+
+        # Parameters that appear in neither the directive nor a config file are
+        # most likely typos; they would silently leave the default in place.
+        known_names = run_context["command_template"].parameter_names.union(
+            *[template.parameter_names for template in run_context["config_templates"].values()]
+        )
+        unknown_names = sorted(set(params) - known_names)
+        if len(unknown_names) > 0:
+            self.echo(
+                f"Warning: {model_name} has no parameter(s) named {', '.join(unknown_names)}; they will be ignored."
+            )
+
+        # Hydrate the config files into the run folder, so concurrent runs do
+        # not overwrite each other's configs. The folder is removed once the
+        # container is done with it.
+        config_folder = f"{os.path.abspath(local_output_folder)}/configs"
+        config_dict = self.render_config_files(run_context, params, config_folder)
+
+        # Write the parameters used out to the run result directory.
+        with open(f"{local_output_folder}/run-parameters.json", "w") as fh:
+            json.dump(params, fh, indent=4)
+
+        # Write accessory file captions to the run result directory.
+        if len(accessory_captions) > 0:
+            with open(f"{local_output_folder}/accessories-captions.json", "w") as fh:
+                json.dump(accessory_captions, fh, indent=4)
+
+        # Set run command from metadata["directive"]["command"] and substitute params.
+        model_command = run_context["command_template"].render(params)
+        timer.add("render", perf_counter() - render_start)
+
+        # Identical runs of the same image produce the same results; reuse
+        # those of an earlier run rather than running the container again.
+        run_key = None
+        if reuse if reuse is not None else self.reuse_results:
+            configs = {}
+            for local_path, container_path in config_dict.items():
+                with open(local_path, "r") as fh:
+                    configs[container_path] = fh.read()
+            run_key = result_key(
+                model_id,
+                docker_client.image_digest(image_name),
+                {name: value for name, value in params.items() if name in known_names},
+                model_command,
+                configs,
+                bundle_format if bundle_format is not None else self.bundle_format,
+            )
+            entry = None if force else self.result_cache.get(run_key)
+            if entry is not None:
+                shutil.rmtree(config_folder, ignore_errors=True)
+                return self.reuse_results_of(entry, local_output_folder, run_report, timer)
+            update_run_report(local_output_folder, "result_cache", {"key": run_key, "hit": False})
+
+        self.echo(
             f"\n\nRunning {model_name} version {model_id} in Docker container {container_name} ... \n"
         )
         if run_attached:
-            click.echo(
+            self.echo(
                 f"The model is running attached; this process will wait until the run is completed."
             )
 
-            # Run the container attached.
-            docker_client.create_container(image_name, container_name, model_command, config_dict)
+            # Run the container attached, streaming the logs to logs.txt as
+            # the model runs.
+            labels = {DOJO_MODEL_ID_LABEL: model_id, DOJO_MODEL_NAME_LABEL: model_name}
+            log_streamer = LogStreamer(
+                log_filename=f"{local_output_folder}/logs.txt",
+                jsonl_filename=f"{local_output_folder}/logs.jsonl" if json_logs else None,
+                quiet=quiet,
+            )
+            stats_sampler = StatsSampler(self.stats_interval) if self.stats_interval > 0 else None
+
+            # Outputs and accessories in bind-mounted output directories are
+            # written straight to the run folder; only the others are copied.
+            mounts = {}
+            if mount_outputs if mount_outputs is not None else self.mount_outputs:
+                mounts = self.prepare_output_mounts(
+                    run_context, config_dict, local_output_folder, docker_client
+                )
+
+            def is_mounted(path):
+                prefix = posixpath.normpath(literal_prefix(path))
+                return any(is_under(prefix, directory) for directory in mounts.values())
+
+            copied_outputs = [path for path in output_paths if not is_mounted(path)]
+            copied_accessories = [path for path in accessory_paths if not is_mounted(path)]
+
+            harvester = None
+            if stream_outputs and len(copied_outputs) > 0:
+                harvester = StreamingHarvester(
+                    container_name,
+                    copied_outputs,
+                    f"{local_output_folder}/output",
+                    self.stream_interval,
+                    self.blob_store,
+                )
+            try:
+                if harvester is not None:
+                    harvester.start(docker_client)
+                with timer.phase("container"):
+                    docker_client.create_container(
+                        image_name,
+                        container_name,
+                        model_command,
+                        {**config_dict, **mounts},
+                        log_streamer=log_streamer,
+                        labels=labels,
+                        resources=run_context["resources"],
+                        stats_sampler=stats_sampler,
+                    )
+                    exit_code = docker_client.wait_container(container_name)
+            finally:
+                # Stop the background pollers even if the container could not
+                # be created or waited on.
+                if harvester is not None:
+                    harvester.stop()
+                if stats_sampler is not None:
+                    stats_sampler.stop()
+                shutil.rmtree(config_folder, ignore_errors=True)
+
+            run_report["exit_code"] = exit_code
+            update_run_report(local_output_folder, "run", run_report)
+            if stats_sampler is not None:
+                update_run_report(
+                    local_output_folder, "container_stats", stats_sampler.summary()
+                )
+            if exit_code != 0:
+                tail = "\n".join(log_streamer.tail())
+                self.echo(
+                    f"\n{container_name} exited with code {exit_code}. Last {len(log_streamer.tail())} log line(s):\n{tail}"
+                )
+
+            mounted_paths = []
+            if len(mounts) > 0:
+                mounted_paths = self.collect_output_mounts(
+                    mounts,
+                    local_output_folder,
+                    [path for path in output_paths if is_mounted(path)],
+                    [path for path in accessory_paths if is_mounted(path)],
+                    show_progress=not quiet,
+                )
 
             # account for wildcard output files
             wildcard_outputs = docker_client.match_pattern_output_path(
-                container_name, output_paths
+                container_name, copied_outputs
             )
 
+            # Only the outputs the streaming harvest missed are left to copy.
+            if harvester is not None:
+                wildcard_outputs = harvester.remaining(docker_client, wildcard_outputs)
+                update_run_report(local_output_folder, "streamed_harvest", harvester.summary())
+                if not quiet:
+                    self.echo(
+                        f"\nCopied {harvester.stats['files']} output file(s) while the model ran; {len(wildcard_outputs)} left to copy."
+                    )
+
             # Perform the finishing steps e.g. logging.
             self.process_finished_model(
                 container_id=None,
                 container_name=container_name,
                 local_output_folder=local_output_folder,
                 output_paths=wildcard_outputs,
-                accessory_paths=accessory_paths,
+                accessory_paths=copied_accessories,
+                docker_client=docker_client,
+                show_progress=not quiet,
+                timer=timer,
+                bundle_format=bundle_format,
+                local_paths=mounted_paths,
             )
+            if run_key is not None and exit_code == 0:
+                self.result_cache.put(
+                    run_key,
+                    local_output_folder,
+                    {"model_name": model_name, "model_id": model_id, "image": image_name, "params": params},
+                )
+            return exit_code
 
         else:
-            click.echo(f"The model is running detached in background.")
-            click.echo(
+            self.echo(f"The model is running detached in background.")
+            self.echo(
                 f'\nModel progress can be monitored by the following command: "dojo results --name={container_name}"\n'
             )
 
             # Run the container detached.
-            container = docker_client.create_container(
-                image_name,
-                container_name,
-                model_command,
-                config_dict,
-                run_attached=False,
-            )
+            with timer.phase("container_start"):
+                container = docker_client.create_container(
+                    image_name,
+                    container_name,
+                    model_command,
+                    config_dict,
+                    run_attached=False,
+                    labels={
+                        DOJO_MODEL_ID_LABEL: model_id,
+                        DOJO_MODEL_NAME_LABEL: model_name,
+                    },
+                    resources=run_context["resources"],
+                )
+            update_run_report(local_output_folder, "phases", timer.as_dict())
 
-            # Write the output folder path to the container or we won't know it.
-            docker_client.execute_command(
-                f"bash -c 'printf \"{local_output_folder}\" > /home/clouseau/local_output_folder.txt'"
+            # Record the run so "dojo results" and "dojo watch" can find its
+            # output folder when it finishes.
+            RunRegistry().register(
+                container.id,
+                container_name,
+                model_id,
+                model_name,
+                local_output_folder,
+                output_paths,
+                accessory_paths,
             )
 
-            # Write the run information to the output folder to be read when
-            # processing the finished model run.
+            # Write the run information to the output folder.
             with open(f"{local_output_folder}/run-info.txt", "w") as fh:
                 fh.write(f"Docker container name: {container_name}\n")
                 fh.write(f"Docker container id: {container.id}\n")
@@ -673,21 +2266,198 @@ class DojoClient(object):
                 fh.write(f"output: {outputs}\n")
                 accessories = "\t".join(accessory_paths)
                 fh.write(f"accessories: {accessories}\n")
+            return container
 
-    def set_config(self, config_filename):
-        with open(config_filename) as f:
-            config = json.load(f)
+    def set_config(self, config):
+        """
+        Description
+        -----------
+            Apply a configuration: a DojoConfig, a dict of settings, or a
+            .config json filename.
 
-            if (
-                "DOJO_USER" not in config
-                or "DOJO_URL" not in config
-                or "DOJO_PWD" not in config
-            ):
-                click.echo(
-                    f"{config_filename} is missing a required field of DOJO_USER, DOJO_URL, and/or DOJO_PWD."
+        Raises
+        ------
+            ConfigError if the configuration cannot be read or misses the dojo
+            url or credentials.
+        """
+
+        config = DojoConfig.load(config)
+        self.config = config
+
+        # Set dojo url and authentication credentials.
+        self.dojo_auth = (config["DOJO_USER"], config["DOJO_PWD"])
+        self.dojo_url = config["DOJO_URL"]
+
+        # Optional HTTP connection pool, timeout, and retry settings.
+        self.http_config = {
+            key: config.get(key, default) for key, default in HTTP_DEFAULTS.items()
+        }
+        self.metadata_workers = config.get(
+            "METADATA_WORKERS", METADATA_WORKERS_DEFAULT
+        )
+
+        self.harvest_workers = config.get(
+            "HARVEST_WORKERS", HARVEST_WORKERS_DEFAULT
+        )
+
+        # Seconds between container resource samples of attached runs.
+        self.stats_interval = config.get("STATS_INTERVAL", STATS_INTERVAL_DEFAULT)
+
+        # Optional compressed bundle of the copied outputs of each run.
+        self.bundle_format = config.get("BUNDLE_FORMAT", None)
+        self.bundle_level = config.get("BUNDLE_LEVEL", None)
+
+        # Bind-mount the output directories of attached runs.
+        self.mount_outputs = config.get("MOUNT_OUTPUTS", False)
+
+        # Seconds between the output checks of a streaming harvest.
+        self.stream_interval = config.get("STREAM_INTERVAL", STREAM_INTERVAL_DEFAULT)
+
+        # Optional content-addressed store deduplicating run outputs.
+        self.blob_store = None
+        if config.get("BLOB_STORE", False):
+            self.blob_store = BlobStore.from_config(config)
+
+        # Opt-in reuse of the results of identical earlier runs.
+        self.reuse_results = config.get("RESULT_CACHE", False)
+        self.result_cache = ResultCache.from_config(config)
+
+        # Optional default container resource settings per model.
+        self.resource_defaults = config.get("RESOURCES", {})
+
+        # Local model index filled by "dojo index sync"; like the cache it
+        # is bypassed by --no-cache and --refresh. The records of a version
+        # never change, but the latest version of a name and the version
+        # lists are only read from it for INDEX_TTL seconds after a sync.
+        self.index = ModelIndex.from_config(config)
+        self.index_ttl = config.get("INDEX_TTL", config.get("CACHE_TTL", CACHE_DEFAULTS["CACHE_TTL"]))
+        self.use_index = (
+            self.use_cache
+            and not self.refresh_cache
+            and self.index.exists()
+            and self.index.synced_at() is not None
+        )
+
+        # Optional on-disk cache of api responses.
+        if self.use_cache:
+            self.cache = MetadataCache.from_config(config)
+            self.template_cache = TemplateCache.from_config(config)
+
+    def index_is_fresh(self):
+        """
+        Description
+        -----------
+            True if the local model index was synced less than INDEX_TTL
+            seconds ago, so its answers about the latest versions of models
+            can be trusted.
+        """
+
+        return self.index.is_fresh(self.index_ttl)
+
+    def echo_stale_index(self, error: DojoApiError):
+        """
+        Description
+        -----------
+            Tell that an answer comes from a stale index because a request to
+            the dojo api failed.
+        """
+
+        synced_at = datetime.fromisoformat(self.index.synced_at()).strftime("%Y-%m-%d %H:%M:%S")
+        self.echo(
+            f"Request to {error.endpoint} failed; using the local model index synced {synced_at}.",
+            err=True,
+        )
+
+    def cache_sizes(self):
+        """
+        Description
+        -----------
+            Disk space used by each cache, in bytes. Cached runs are not
+            copies; their size is that of the run folders they point at.
+        """
+
+        sizes = {
+            "api responses": self.cache.size() if self.cache is not None else 0,
+            "config templates": folder_size(self.template_cache.cache_dir) if self.template_cache is not None else 0,
+            "model index": os.path.getsize(self.index.path) if self.index.exists() else 0,
+            "blob store": self.blob_store.size() if self.blob_store is not None else 0,
+            "cached runs (in run folders)": sum(
+                entry["bytes"] for entry in self.result_cache.entries() if entry["valid"]
+            ),
+        }
+        return sizes
+
+    def watch_runs(self, follow: bool = False):
+        """
+        Description
+        -----------
+            Collect the results of detached runs automatically as their
+            containers exit. Runs in the registry that have already finished
+            are collected first; then the Docker events stream is followed, so
+            no container is polled.
+
+        Parameters
+        ----------
+            follow: bool = False
+                Keep watching after every registered run has been collected,
+                for runs started later.
+        """
+
+        registry = RunRegistry()
+        docker_client = self.get_docker_client()
+
+        # Subscribe from before the scan so a run exiting in between is not
+        # missed.
+        since = datetime.now()
+
+        for container_id, run in registry.pending().items():
+            try:
+                is_running = docker_client.is_running(container_id=container_id)
+            except ContainerNotFoundError:
+                # The container was removed without collecting its results.
+                registry.mark_harvested(container_id)
+                continue
+            if not is_running:
+                self.harvest_run(run, docker_client)
+
+        pending = registry.pending()
+        if len(pending) == 0 and not follow:
+            self.echo("\nNo detached runs are waiting to be collected.\n")
+            return
+
+        self.echo(f"\nWaiting for {len(pending)} detached run(s) to finish ...\n")
+        for event in docker_client.container_events(since=since):
+            # Re-read the registry to pick up runs started after the watch.
+            pending = registry.pending()
+            run = pending.get(event.get("id"))
+            if run is not None:
+                exit_code = event.get("Actor", {}).get("Attributes", {}).get("exitCode")
+                self.harvest_run(
+                    run,
+                    docker_client,
+                    exit_code=int(exit_code) if exit_code is not None else None,
                 )
-                return
+                pending.pop(run["container_id"])
+
+            if len(pending) == 0 and not follow:
+                break
+
+    def timing_summary(self):
+        """
+        Description
+        -----------
+            Summarize the wall-clock time of every dojo api request made by
+            this client.
+
+        Returns
+        -------
+            dict with the request count, total and mean time in milliseconds.
+        """
 
-            # Set dojo url and authentication credentials.
-            self.dojo_auth = (config["DOJO_USER"], config["DOJO_PWD"])
-            self.dojo_url = config["DOJO_URL"]
+        count = self.request_count
+        total = self.request_seconds
+        return {
+            "requests": count,
+            "total_ms": round(total * 1000, 1),
+            "mean_ms": round(total * 1000 / count, 1) if count > 0 else 0.0,
+        }
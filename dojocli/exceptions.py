@@ -0,0 +1,150 @@
+"""
+  Exceptions raised by the dojo-cli clients.
+"""
+
+
+class DojoError(Exception):
+    """Base class for dojo-cli errors."""
+
+
+class DojoApiError(DojoError):
+    """
+    Description
+    -----------
+        Raised when a request to a dojo api endpoint fails or returns a payload
+        that cannot be decoded.
+
+    Parameters
+    ----------
+        endpoint: str
+            The endpoint that failed e.g. /dojo/config/{model_id}.
+        message: str
+            Description of the failure.
+    """
+
+    def __init__(self, endpoint: str, message: str):
+        self.endpoint = endpoint
+        super().__init__(f"{endpoint}: {message}")
+
+
+class TemplateError(DojoError):
+    """
+    Description
+    -----------
+        Raised when a directive or config file template has invalid parameter
+        spans, or is rendered with parameter names it does not know.
+    """
+
+
+class ConfigTemplateError(TemplateError):
+    """
+    Description
+    -----------
+        Raised when the config file templates of a model cannot be read from
+        its image.
+
+    Parameters
+    ----------
+        image_name: str
+            The image the templates were read from.
+        message: str
+            Description of the failure.
+    """
+
+    def __init__(self, image_name: str, message: str):
+        self.image_name = image_name
+        super().__init__(f"unable to read the config files of {image_name}: {message}")
+
+
+class ConfigError(DojoError):
+    """
+    Description
+    -----------
+        Raised when a configuration cannot be read or misses a required
+        setting.
+    """
+
+
+class ModelNotFoundError(DojoError):
+    """
+    Description
+    -----------
+        Raised when no model matches a model name or version id.
+
+    Parameters
+    ----------
+        model: str
+            The model name or version id looked up.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        super().__init__(f"no model named or with version id {model} was found.")
+
+
+class ModelImageError(DojoError):
+    """
+    Description
+    -----------
+        Raised when a model version has no Docker image to run.
+
+    Parameters
+    ----------
+        model_name: str
+            The name of the model.
+        model_id: str
+            The version id without an image.
+    """
+
+    def __init__(self, model_name: str, model_id: str):
+        self.model_name = model_name
+        self.model_id = model_id
+        super().__init__(f"{model_name} version {model_id} does not have a Docker image.")
+
+
+class DockerImageError(DojoError):
+    """
+    Description
+    -----------
+        Raised when a Docker image is not available locally and cannot be
+        pulled.
+
+    Parameters
+    ----------
+        image_name: str
+            The image name, format repo:tag.
+        message: str
+            Description of the failure.
+    """
+
+    def __init__(self, image_name: str, message: str):
+        self.image_name = image_name
+        super().__init__(f"{image_name}: {message}")
+
+
+class DockerUnavailableError(DojoError):
+    """
+    Description
+    -----------
+        Raised when the Docker daemon cannot be reached.
+    """
+
+    def __init__(self, message: str):
+        super().__init__(f"unable to connect to Docker: {message}")
+
+
+class ContainerNotFoundError(DojoError):
+    """
+    Description
+    -----------
+        Raised when no Docker container has a given id or name.
+
+    Parameters
+    ----------
+        container: str
+            The container id or name looked up.
+    """
+
+    def __init__(self, container: str):
+        self.container = container
+        super().__init__(f"no Docker container {container} was found.")
@@ -0,0 +1,307 @@
+"""
+  Output harvesting alternatives to copying every file after the run:
+  streaming harvest, which copies the output files of an attached run while
+  the model is still running, and output mounts, which bind-mount host folders
+  at the output directories so files need no copy at all.
+"""
+
+from dojocli.cache import folder_size, link_or_copy
+from dojocli.matching import OutputMatcher
+from threading import Event, Lock, Thread
+from time import perf_counter
+import os
+import posixpath
+import shutil
+
+# Default seconds between the checks for new output files.
+STREAM_INTERVAL_DEFAULT = 30.0
+
+# File type bits of a Go os.FileMode, as in the container path stats of the
+# Docker archive endpoint: directory, symlink, device, named pipe, socket,
+# character device and irregular file.
+GO_MODE_TYPE = (1 << 31) | (1 << 27) | (1 << 26) | (1 << 25) | (1 << 24) | (1 << 21) | (1 << 19)
+
+# Container directories that are never bind-mounted over, nor anything below
+# them: mounting there would hide the system files of the image.
+SYSTEM_TREES = ("/bin", "/boot", "/dev", "/etc", "/lib", "/lib32", "/lib64", "/proc", "/sbin", "/sys", "/usr")
+
+# Container directories that are never bind-mounted over themselves, though
+# folders below them can be.
+SYSTEM_DIRS = ("/", "/home", "/opt", "/root", "/run", "/srv", "/tmp", "/var")
+
+# Mode of the host folders bind-mounted at output directories. Models run as
+# whatever user their image sets, e.g. clouseau, which must be able to write
+# there whatever the host user and umask.
+MOUNT_FOLDER_MODE = 0o777
+
+
+def is_regular_file(stat: dict):
+    return stat is not None and stat.get("mode", 0) & GO_MODE_TYPE == 0
+
+
+class StreamingHarvester(object):
+    """
+    Description
+    -----------
+        Copies the output files of a running container on a background thread.
+        Every interval seconds it diffs the container for files matching the
+        output paths, and copies each file whose size and modification time
+        did not change since the previous check, i.e. that stopped growing.
+
+        After the container exits, remaining() tells which outputs still need
+        copying: those never harvested, and those changed since. Directories
+        are always left to the final copy.
+
+    Parameters
+    ----------
+        container_name: str
+            The container of the run. Checks before the container exists are
+            skipped.
+        output_paths: list
+            Output paths of the model, optionally with wildcards.
+        local_folder: str
+            Folder the output files are copied to.
+        interval: float = 30.0
+            Seconds between checks.
+        blob_store: BlobStore = None
+            Store the files are written to; see DockerClient.copy_files().
+    """
+
+    def __init__(
+        self,
+        container_name: str,
+        output_paths: list,
+        local_folder: str,
+        interval: float = STREAM_INTERVAL_DEFAULT,
+        blob_store=None,
+    ):
+        self.container_name = container_name
+        self.output_paths = output_paths
+        self.local_folder = local_folder
+        self.interval = interval
+        self.blob_store = blob_store
+
+        # {path: (size, mtime)} of the last check and of the harvested copy.
+        self.seen = {}
+        self.harvested = {}
+        self.stats = {"polls": 0, "files": 0, "bytes": 0, "seconds": 0.0}
+        self.first_file_seconds = None
+        self.error = None
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+        self.start_time = None
+
+    def start(self, docker_client):
+        self.start_time = perf_counter()
+        self.thread = Thread(target=self.run, args=(docker_client,), daemon=True)
+        self.thread.start()
+
+    def run(self, docker_client):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.poll(docker_client)
+                self.error = None
+            except Exception as e:
+                # Streaming is best effort: the files it misses are copied
+                # after the run. The container may not exist yet.
+                self.error = str(e)
+
+    def poll(self, docker_client):
+        """
+        Description
+        -----------
+            Check the container once, and copy the matching output files that
+            stopped growing since the previous check.
+        """
+
+        self.stats["polls"] += 1
+        for path in docker_client.match_pattern_output_path(self.container_name, self.output_paths):
+            if self.stopped.is_set():
+                return
+            stat = docker_client.stat_path(self.container_name, path)
+            if not is_regular_file(stat):
+                continue
+
+            version = (stat.get("size"), stat.get("mtime"))
+            if self.harvested.get(path) == version:
+                continue
+            if self.seen.get(path) != version:
+                self.seen[path] = version
+                continue
+
+            start = perf_counter()
+            copied = docker_client.copy_files(
+                self.container_name,
+                {self.local_folder: [path]},
+                show_progress=False,
+                blob_store=self.blob_store,
+            )
+            with self.lock:
+                self.harvested[path] = version
+                self.stats["files"] += len(copied["files"])
+                self.stats["bytes"] += copied["bytes"]
+                self.stats["seconds"] += perf_counter() - start
+                if self.first_file_seconds is None:
+                    self.first_file_seconds = perf_counter() - self.start_time
+
+    def stop(self):
+        """
+        Description
+        -----------
+            Stop checking, waiting for a copy in progress to finish.
+        """
+
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def remaining(self, docker_client, output_paths: list):
+        """
+        Description
+        -----------
+            The output paths of the finished container that were not harvested
+            or changed after they were.
+        """
+
+        remaining = []
+        for path in output_paths:
+            version = self.harvested.get(path)
+            if version is not None:
+                stat = docker_client.stat_path(self.container_name, path)
+                if stat is not None and (stat.get("size"), stat.get("mtime")) == version:
+                    continue
+            remaining.append(path)
+        return remaining
+
+    def summary(self):
+        """
+        Description
+        -----------
+            Summarize the streaming harvest for the run report: the check
+            interval and count, the files and bytes copied during the run,
+            the copy time, and the seconds from the start of the run to the
+            first copied file.
+        """
+
+        summary = {
+            "interval": self.interval,
+            "polls": self.stats["polls"],
+            "files": self.stats["files"],
+            "bytes": self.stats["bytes"],
+            "seconds": round(self.stats["seconds"], 3),
+            "first_file_seconds": None if self.first_file_seconds is None else round(self.first_file_seconds, 3),
+        }
+        if self.error is not None:
+            summary["error"] = self.error
+        return summary
+
+
+def is_under(path: str, directory: str):
+    return path == directory or path.startswith(directory.rstrip("/") + "/")
+
+
+def plan_output_mounts(output_directories: list, config_paths: list, image_contents: dict = None):
+    """
+    Description
+    -----------
+        Choose the output directories to bind-mount. A directory is not
+        mounted, and its outputs are copied as usual, if it is or is under a
+        system path, if a config file is mounted inside it, or if it already
+        holds files in the image, which a mount would hide. A directory inside
+        another mounted directory is covered by that mount.
+
+    Parameters
+    ----------
+        output_directories: list
+            Container output directories of the model.
+        config_paths: list
+            Container paths of the mounted config files.
+        image_contents: dict = None
+            {output directory: True if it holds files in the image}.
+
+    Returns
+    -------
+        (list of the directories to mount, {directory not mounted: reason}).
+    """
+
+    image_contents = image_contents or {}
+    mounts = []
+    fallbacks = {}
+    directories = sorted({posixpath.normpath(d) for d in output_directories}, key=len)
+    for directory in directories:
+        if any(is_under(directory, mount) for mount in mounts):
+            continue
+        if directory in SYSTEM_DIRS or any(is_under(directory, tree) for tree in SYSTEM_TREES):
+            fallbacks[directory] = "system path"
+        elif any(is_under(posixpath.normpath(path), directory) for path in config_paths):
+            fallbacks[directory] = "contains a config file"
+        elif image_contents.get(directory, False):
+            fallbacks[directory] = "holds files in the image"
+        else:
+            mounts.append(directory)
+    return mounts, fallbacks
+
+
+def collect_mounted_files(mounts: dict, destinations: dict):
+    """
+    Description
+    -----------
+        Move the files matching the output and accessory paths out of the
+        bind-mounted folders of a finished run into their local folders,
+        keeping only their basenames as the copy after the run does. A path
+        matching more than one destination is moved to the first, and
+        hardlinked or copied to the others.
+
+    Parameters
+    ----------
+        mounts: dict
+            {host folder: container directory} of the output mounts.
+        destinations: dict
+            {local folder: list of container paths, optionally with wildcards}.
+
+    Returns
+    -------
+        dict of the local paths written ("files"), their total "bytes", and
+        the paths that could not be moved ("failed") e.g. when a subfolder
+        created by the container is not writable by this user.
+    """
+
+    matchers = {folder: OutputMatcher(paths) for folder, paths in destinations.items()}
+    written = []
+    failed = []
+    total = 0
+    for host_folder, container_dir in mounts.items():
+        for folder, dirnames, filenames in os.walk(host_folder):
+            relative = os.path.relpath(folder, host_folder)
+            container_folder = container_dir if relative == "." else posixpath.join(container_dir, *relative.split(os.sep))
+            for name in list(dirnames) + filenames:
+                container_path = posixpath.join(container_folder, name)
+                targets = [f for f, matcher in matchers.items() if matcher.matches(container_path)]
+                if len(targets) == 0:
+                    continue
+                if name in dirnames:
+                    # Matched folders move whole.
+                    dirnames.remove(name)
+
+                source = os.path.join(folder, name)
+                size = folder_size(source) if os.path.isdir(source) else os.path.getsize(source)
+                first = os.path.join(targets[0], name)
+                try:
+                    os.makedirs(targets[0], exist_ok=True)
+                    os.replace(source, first)
+                except OSError:
+                    failed.append(source)
+                    continue
+                written.append(first)
+                total += size
+                for target in targets[1:]:
+                    destination = os.path.join(target, name)
+                    if os.path.isdir(first):
+                        shutil.copytree(first, destination, copy_function=link_or_copy, dirs_exist_ok=True)
+                    else:
+                        link_or_copy(first, destination)
+                    written.append(destination)
+                    total += size
+
+    return {"files": written, "bytes": total, "failed": failed}
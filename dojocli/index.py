@@ -0,0 +1,394 @@
+"""
+  Local SQLite index of dojo model records, for offline lookups and full-text
+  search.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from dojocli.cache import CACHE_DEFAULTS
+from hashlib import sha256
+import json
+import os
+import re
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    family_name TEXT,
+    category TEXT,
+    maintainer TEXT,
+    created_at INTEGER,
+    prev_version TEXT,
+    next_version TEXT,
+    is_latest INTEGER DEFAULT 0,
+    record TEXT,
+    record_hash TEXT,
+    parameters TEXT
+);
+CREATE INDEX IF NOT EXISTS models_name ON models (name, is_latest, created_at);
+CREATE INDEX IF NOT EXISTS models_family ON models (family_name);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# Full-text index of the searchable fields, one row per model version with the
+# rowid of its models row.
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS models_fts USING fts5 (
+    name, family_name, category, maintainer, description, parameters
+);
+"""
+
+
+def record_hash(model: dict):
+    return sha256(json.dumps(model, sort_keys=True).encode()).hexdigest()
+
+
+def parameter_text(parameters: list):
+    """
+    Description
+    -----------
+        The searchable text of /dojo/parameters: the name, description and
+        type of every parameter.
+    """
+
+    words = []
+    for parameter in parameters or []:
+        annotation = parameter.get("annotation", {})
+        for key in ("name", "description", "type"):
+            if annotation.get(key):
+                words.append(str(annotation[key]))
+    return " ".join(words)
+
+
+def fts_query(text: str):
+    """
+    Description
+    -----------
+        Turn free text into an FTS5 query matching every word as a prefix e.g.
+        'rain fall' -> '"rain"* "fall"*', so user input never hits FTS5 syntax.
+    """
+
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class ModelIndex(object):
+    """
+    Description
+    -----------
+        SQLite mirror of the model records of a dojo api, filled by
+        DojoClient.sync_index(). Answers name to latest version resolution,
+        model lookups by id, version chains and full-text search without the
+        network. Every dojo url gets its own database file.
+
+    Parameters
+    ----------
+        path: str
+            The SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ready = False
+
+    @classmethod
+    def from_config(cls, config: dict):
+        cache_dir = os.path.expanduser(config.get("CACHE_DIR", CACHE_DEFAULTS["CACHE_DIR"]))
+        url_hash = sha256(config["DOJO_URL"].rstrip("/").encode()).hexdigest()[:16]
+        return cls(os.path.join(cache_dir, "index", f"{url_hash}.sqlite"))
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @contextmanager
+    def connect(self):
+        """
+        Description
+        -----------
+            Open a connection for one operation, committing on success. A
+            connection per operation keeps the index usable from any thread.
+        """
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        connection.row_factory = sqlite3.Row
+        try:
+            if not self.ready:
+                connection.executescript(SCHEMA)
+                try:
+                    connection.executescript(FTS_SCHEMA)
+                except sqlite3.OperationalError:
+                    # SQLite built without FTS5; search() falls back to LIKE.
+                    pass
+                self.ready = True
+            yield connection
+            connection.commit()
+        finally:
+            connection.close()
+
+    @staticmethod
+    def has_fts(connection):
+        row = connection.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'models_fts'"
+        ).fetchone()
+        return row is not None
+
+    def record_hashes(self):
+        """
+        Description
+        -----------
+            {model id: (record hash, parameters indexed)} of the indexed models.
+        """
+
+        with self.connect() as connection:
+            return {
+                row["id"]: (row["record_hash"], row["parameters"] is not None)
+                for row in connection.execute("SELECT id, record_hash, parameters FROM models")
+            }
+
+    def upsert(self, models: list):
+        """
+        Description
+        -----------
+            Store model records in one transaction.
+
+        Parameters
+        ----------
+            models: list
+                (model record, parameters) pairs. The indexed parameters of a
+                model are kept when parameters is None.
+        """
+
+        with self.connect() as connection:
+            fts = self.has_fts(connection)
+            for model, parameters in models:
+                self.upsert_one(connection, fts, model, parameters)
+
+    def upsert_one(self, connection, fts: bool, model: dict, parameters: list = None):
+        maintainer = model.get("maintainer") or {}
+        category = model.get("category") or []
+        row = connection.execute(
+            "SELECT rowid, parameters FROM models WHERE id = ?", (model["id"],)
+        ).fetchone()
+        if parameters is None and row is not None and row["parameters"] is not None:
+            parameters = json.loads(row["parameters"])
+
+        values = (
+            model["id"],
+            model.get("name"),
+            model.get("family_name"),
+            " ".join(category) if isinstance(category, list) else str(category),
+            " ".join(str(v) for v in maintainer.values()) if isinstance(maintainer, dict) else str(maintainer),
+            model.get("created_at"),
+            model.get("prev_version") or None,
+            model.get("next_version") or None,
+            json.dumps(model),
+            record_hash(model),
+            json.dumps(parameters) if parameters is not None else None,
+        )
+        if row is None:
+            cursor = connection.execute(
+                "INSERT INTO models (id, name, family_name, category, maintainer, created_at,"
+                " prev_version, next_version, record, record_hash, parameters)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+            rowid = cursor.lastrowid
+        else:
+            rowid = row["rowid"]
+            connection.execute(
+                "UPDATE models SET id = ?, name = ?, family_name = ?, category = ?,"
+                " maintainer = ?, created_at = ?, prev_version = ?, next_version = ?,"
+                " record = ?, record_hash = ?, parameters = ? WHERE rowid = ?",
+                values + (rowid,),
+            )
+
+        if fts:
+            connection.execute("DELETE FROM models_fts WHERE rowid = ?", (rowid,))
+            connection.execute(
+                "INSERT INTO models_fts (rowid, name, family_name, category, maintainer,"
+                " description, parameters) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (rowid,) + values[1:5] + (model.get("description"), parameter_text(parameters)),
+            )
+
+    def set_parameters(self, parameters: dict):
+        """
+        Description
+        -----------
+            Store {model id: /dojo/parameters} of indexed models.
+        """
+
+        with self.connect() as connection:
+            fts = self.has_fts(connection)
+            for model_id, model_parameters in parameters.items():
+                row = connection.execute(
+                    "SELECT record FROM models WHERE id = ?", (model_id,)
+                ).fetchone()
+                if row is not None:
+                    self.upsert_one(connection, fts, json.loads(row["record"]), model_parameters)
+
+    def remove(self, model_ids):
+        with self.connect() as connection:
+            fts = self.has_fts(connection)
+            for model_id in model_ids:
+                row = connection.execute("SELECT rowid FROM models WHERE id = ?", (model_id,)).fetchone()
+                if row is None:
+                    continue
+                if fts:
+                    connection.execute("DELETE FROM models_fts WHERE rowid = ?", (row["rowid"],))
+                connection.execute("DELETE FROM models WHERE rowid = ?", (row["rowid"],))
+
+    def finish_sync(self):
+        """
+        Description
+        -----------
+            Flag the latest version of every model (the versions without a
+            next_version) and record the sync time.
+        """
+
+        with self.connect() as connection:
+            connection.execute("UPDATE models SET is_latest = (next_version IS NULL)")
+            connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)",
+                (datetime.now().isoformat(),),
+            )
+
+    def synced_at(self):
+        with self.connect() as connection:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+        return row["value"] if row is not None else None
+
+    def is_fresh(self, ttl: float):
+        """
+        Description
+        -----------
+            True if the index was synced less than ttl seconds ago.
+        """
+
+        synced_at = self.synced_at()
+        if synced_at is None:
+            return False
+        return (datetime.now() - datetime.fromisoformat(synced_at)).total_seconds() < ttl
+
+    def count(self):
+        with self.connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM models").fetchone()[0]
+
+    def get(self, model_id: str):
+        """
+        Description
+        -----------
+            The model record of a version, or None if it is not indexed.
+        """
+
+        with self.connect() as connection:
+            row = connection.execute("SELECT record FROM models WHERE id = ?", (model_id,)).fetchone()
+        return json.loads(row["record"]) if row is not None else None
+
+    def latest(self, model_name: str):
+        """
+        Description
+        -----------
+            The model record of the latest version of a model name, or None if
+            it is not indexed.
+        """
+
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT record FROM models WHERE name = ? AND is_latest = 1"
+                " ORDER BY created_at DESC LIMIT 1",
+                (model_name,),
+            ).fetchone()
+        return json.loads(row["record"]) if row is not None else None
+
+    def parameters(self, model_id: str):
+        """
+        Description
+        -----------
+            The indexed /dojo/parameters of a version, or None if they are not
+            indexed.
+        """
+
+        with self.connect() as connection:
+            row = connection.execute("SELECT parameters FROM models WHERE id = ?", (model_id,)).fetchone()
+        if row is None or row["parameters"] is None:
+            return None
+        return json.loads(row["parameters"])
+
+    def versions(self, model_id: str):
+        """
+        Description
+        -----------
+            Follow the prev_version and next_version links of a version, in
+            the format of the /models/{model_id}/versions endpoint.
+
+        Returns
+        -------
+            dict of current_version, prev_versions (nearest first) and
+            later_versions (nearest first), or None if model_id is not indexed.
+        """
+
+        with self.connect() as connection:
+            links = {
+                row["id"]: (row["prev_version"], row["next_version"])
+                for row in connection.execute("SELECT id, prev_version, next_version FROM models")
+            }
+        if model_id not in links:
+            return None
+
+        def follow(direction: int):
+            chain = []
+            version = links[model_id][direction]
+            while version is not None and version not in chain and version != model_id:
+                chain.append(version)
+                version = links.get(version, (None, None))[direction]
+            return chain
+
+        return {
+            "current_version": model_id,
+            "prev_versions": follow(0),
+            "later_versions": follow(1),
+        }
+
+    def search(self, text: str, limit: int = 20, latest_only: bool = True):
+        """
+        Description
+        -----------
+            Full-text search of the names, families, categories, maintainers,
+            descriptions and parameters of the indexed models, best matches
+            first.
+
+        Returns
+        -------
+            list of (model record, snippet of the matching description).
+        """
+
+        query = fts_query(text)
+        if len(query) == 0:
+            return []
+
+        latest = "AND m.is_latest = 1" if latest_only else ""
+        with self.connect() as connection:
+            if self.has_fts(connection):
+                rows = connection.execute(
+                    "SELECT m.record, snippet(models_fts, -1, '[', ']', '...', 12) AS snippet"
+                    f" FROM models_fts JOIN models m ON m.rowid = models_fts.rowid"
+                    f" WHERE models_fts MATCH ? {latest}"
+                    " ORDER BY bm25(models_fts, 10.0, 5.0, 3.0, 3.0, 1.0, 1.0) LIMIT ?",
+                    (query, limit),
+                ).fetchall()
+            else:
+                words = re.findall(r"\w+", text)
+                clauses = " AND ".join(
+                    "(m.name || ' ' || IFNULL(m.family_name, '') || ' ' || m.record || ' '"
+                    " || IFNULL(m.parameters, '')) LIKE ?"
+                    for _ in words
+                )
+                rows = connection.execute(
+                    f"SELECT m.record, '' AS snippet FROM models m WHERE {clauses} {latest}"
+                    " ORDER BY m.name LIMIT ?",
+                    [f"%{word}%" for word in words] + [limit],
+                ).fetchall()
+        return [(json.loads(row["record"]), row["snippet"]) for row in rows]
@@ -0,0 +1,135 @@
+"""
+  Streaming of model container logs to the terminal and to log files.
+"""
+
+import click
+from collections import deque
+from datetime import datetime, timezone
+import json
+
+# Number of log lines kept for display after the run.
+TAIL_LINES_DEFAULT = 50
+
+# Longest partial line kept while waiting for its newline; longer ones are
+# emitted as a line of their own.
+PARTIAL_LINE_MAX = 64 * 1024
+
+
+class LogStreamer(object):
+    """
+    Description
+    -----------
+        Consumes the byte chunks of a container log stream. Chunks are split
+        into lines, reassembling lines that span chunk boundaries, and each
+        line is:
+
+            - written to log_filename as it arrives;
+            - written to jsonl_filename as {"time": ..., "line": ...} if given;
+            - kept in a bounded ring buffer of the last tail_lines lines;
+            - echoed to the terminal unless quiet, one write per chunk.
+
+        A partial line is cut at its last carriage return, as a terminal
+        would overwrite it, so \r progress bars do not accumulate, and is
+        emitted once it exceeds PARTIAL_LINE_MAX bytes. Memory use is bounded
+        by the ring buffer and PARTIAL_LINE_MAX, however long the model runs.
+
+    Parameters
+    ----------
+        log_filename: str = None
+            File the raw log is written to, e.g. {local_output_folder}/logs.txt.
+        jsonl_filename: str = None
+            Optional file of timestamped JSON lines.
+        quiet: bool = False
+            Skip terminal rendering entirely.
+        tail_lines: int = TAIL_LINES_DEFAULT
+            Size of the ring buffer returned by tail().
+    """
+
+    def __init__(
+        self,
+        log_filename: str = None,
+        jsonl_filename: str = None,
+        quiet: bool = False,
+        tail_lines: int = TAIL_LINES_DEFAULT,
+    ):
+        self.log_fh = open(log_filename, "wb") if log_filename is not None else None
+        self.jsonl_fh = open(jsonl_filename, "w") if jsonl_filename is not None else None
+        self.quiet = quiet
+        self.lines = deque(maxlen=tail_lines)
+        self.partial = b""
+        self.line_count = 0
+        self.header_shown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def feed(self, chunk: bytes):
+        """
+        Description
+        -----------
+            Process one chunk of the log stream.
+        """
+
+        if self.log_fh is not None:
+            self.log_fh.write(chunk)
+
+        data = self.partial + chunk
+        *complete, partial = data.split(b"\n")
+
+        # Keep what follows the last carriage return, unless it ends the
+        # partial line and may be the first half of a \r\n.
+        carriage_return = partial.rfind(b"\r", 0, len(partial) - 1)
+        if carriage_return >= 0:
+            partial = partial[carriage_return + 1:]
+        if len(partial) > PARTIAL_LINE_MAX:
+            complete.append(partial)
+            partial = b""
+        self.partial = partial
+
+        if len(complete) > 0:
+            self.emit([line.decode("utf-8", errors="replace").rstrip("\r") for line in complete])
+
+    def emit(self, lines: list):
+        self.line_count += len(lines)
+        self.lines.extend(lines)
+
+        if self.jsonl_fh is not None:
+            now = datetime.now(timezone.utc).isoformat()
+            self.jsonl_fh.write(
+                "".join(json.dumps({"time": now, "line": line}) + "\n" for line in lines)
+            )
+
+        if not self.quiet:
+            if not self.header_shown:
+                click.echo("\nModel run logs:\n")
+                self.header_shown = True
+            click.echo("\n".join(lines))
+
+    def tail(self):
+        """
+        Description
+        -----------
+            Return the last lines of the log kept in the ring buffer.
+        """
+
+        return list(self.lines)
+
+    def close(self):
+        """
+        Description
+        -----------
+            Flush a trailing partial line and close the log files.
+        """
+
+        if len(self.partial) > 0:
+            self.emit([self.partial.decode("utf-8", errors="replace").rstrip("\r")])
+            self.partial = b""
+
+        for fh in (self.log_fh, self.jsonl_fh):
+            if fh is not None:
+                fh.close()
+        self.log_fh = None
+        self.jsonl_fh = None
@@ -0,0 +1,98 @@
+"""
+  Compiled matching of wildcard output paths against the files a model run
+  changed.
+"""
+
+import fnmatch
+import re
+
+# Kinds of a Docker container diff entry.
+DIFF_MODIFIED = 0
+DIFF_ADDED = 1
+DIFF_DELETED = 2
+
+# Characters that start an fnmatch wildcard.
+WILDCARD_CHARS = re.compile(r"[*?\[]")
+
+
+def literal_prefix(pattern: str):
+    """
+    Description
+    -----------
+        The literal text of a pattern before its first wildcard e.g.
+        '/model/output/*.nc' -> '/model/output/'. A pattern without wildcards
+        is its own prefix.
+    """
+
+    wildcard = WILDCARD_CHARS.search(pattern)
+    return pattern if wildcard is None else pattern[: wildcard.start()]
+
+
+class OutputMatcher(object):
+    """
+    Description
+    -----------
+        Output path patterns compiled once into a single regular expression,
+        with the same semantics as fnmatch.fnmatch. Paths that start with none
+        of the literal pattern prefixes are rejected with one str.startswith
+        call, so matching a container diff is a single pass over its entries
+        rather than a pass per pattern.
+
+    Parameters
+    ----------
+        patterns: list
+            Output paths, optionally with fnmatch wildcards e.g.
+            /model/output/*.nc
+    """
+
+    def __init__(self, patterns: list):
+        self.patterns = list(dict.fromkeys(patterns))
+        prefixes = tuple(literal_prefix(pattern) for pattern in self.patterns)
+        # An empty prefix, e.g. of the pattern "*.nc", matches every path.
+        self.prefixes = None if "" in prefixes else prefixes
+        self.regex = None
+        if len(self.patterns) > 0:
+            self.regex = re.compile(
+                "|".join(fnmatch.translate(pattern) for pattern in self.patterns)
+            )
+
+    def matches(self, path: str):
+        if self.regex is None:
+            return False
+        if self.prefixes is not None and not path.startswith(self.prefixes):
+            return False
+        return self.regex.match(path) is not None
+
+    def match_diff(self, diff: list):
+        """
+        Description
+        -----------
+            The paths of a container diff that match any pattern, in diff
+            order and without duplicates. Deleted entries are skipped.
+
+        Parameters
+        ----------
+            diff: list
+                Container diff entries {"Path": str, "Kind": int} as returned
+                by the Docker API.
+        """
+
+        if self.regex is None:
+            return []
+
+        # The loop below runs once per changed file of the container, which
+        # can be hundreds of thousands, so it avoids attribute lookups and
+        # method calls per entry.
+        match = self.regex.match
+        prefixes = self.prefixes or ("",)
+        matched = {}
+        for entry in diff or []:
+            path = entry.get("Path", "")
+            if (
+                path.startswith(prefixes)
+                and entry.get("Kind") != DIFF_DELETED
+                and path not in matched
+                and match(path) is not None
+            ):
+                matched[path] = None
+        return list(matched)
@@ -0,0 +1,141 @@
+"""
+  Local registry of detached model runs.
+"""
+
+from datetime import datetime
+import json
+import os
+
+REGISTRY_FILENAME = "index.jsonl"
+
+
+class RunRegistry(object):
+    """
+    Description
+    -----------
+        Append-only JSON lines index of detached model runs, stored in
+        {runs_folder}/index.jsonl. Each line is an event:
+
+            {"event": "started", "container_id": ..., "container_name": ...,
+             "model_id": ..., "model_name": ..., "local_output_folder": ...,
+             "output_paths": [...], "accessory_paths": [...], "time": ...}
+            {"event": "harvested", "container_id": ..., "exit_code": ..., "time": ...}
+
+        Appending single lines keeps concurrent writers from corrupting each
+        other; the current state of every run is rebuilt by folding the events.
+
+    Parameters
+    ----------
+        runs_folder: str = None
+            Folder holding index.jsonl. Defaults to {cwd}/runs.
+    """
+
+    def __init__(self, runs_folder: str = None):
+        if runs_folder is None:
+            runs_folder = f"{os.getcwd()}/runs"
+        self.filename = os.path.join(runs_folder, REGISTRY_FILENAME)
+
+    def append(self, event: dict):
+        event["time"] = datetime.now().isoformat()
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        with open(self.filename, "a") as fh:
+            fh.write(json.dumps(event) + "\n")
+
+    def register(
+        self,
+        container_id: str,
+        container_name: str,
+        model_id: str,
+        model_name: str,
+        local_output_folder: str,
+        output_paths: list,
+        accessory_paths: list,
+    ):
+        """
+        Description
+        -----------
+            Record a detached run that has just started.
+        """
+
+        self.append(
+            {
+                "event": "started",
+                "container_id": container_id,
+                "container_name": container_name,
+                "model_id": model_id,
+                "model_name": model_name,
+                "local_output_folder": local_output_folder,
+                "output_paths": output_paths,
+                "accessory_paths": accessory_paths,
+            }
+        )
+
+    def mark_harvested(self, container_id: str, exit_code: int = None):
+        """
+        Description
+        -----------
+            Record that the results of a run have been collected.
+        """
+
+        self.append(
+            {"event": "harvested", "container_id": container_id, "exit_code": exit_code}
+        )
+
+    def runs(self):
+        """
+        Description
+        -----------
+            Return every registered run, keyed by container id. Harvested runs
+            have "harvested" set to True.
+        """
+
+        runs = {}
+        if not os.path.exists(self.filename):
+            return runs
+
+        with open(self.filename, "r") as fh:
+            for line in fh:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Skip a line cut short by an interrupted writer.
+                    continue
+
+                container_id = event.get("container_id")
+                if event.get("event") == "started":
+                    run = dict(event)
+                    run.pop("event")
+                    run["harvested"] = False
+                    runs[container_id] = run
+                elif event.get("event") == "harvested" and container_id in runs:
+                    runs[container_id]["harvested"] = True
+                    runs[container_id]["exit_code"] = event.get("exit_code")
+        return runs
+
+    def pending(self):
+        """
+        Description
+        -----------
+            Return the runs whose results have not been collected yet.
+        """
+
+        return {
+            container_id: run
+            for container_id, run in self.runs().items()
+            if not run["harvested"]
+        }
+
+    def find(self, container_id: str = None, container_name: str = None):
+        """
+        Description
+        -----------
+            Return the run with the given container name, or the container id
+            or a short id prefix of it, or None.
+        """
+
+        for run_id, run in self.runs().items():
+            if container_name is not None and run["container_name"] == container_name:
+                return run
+            if container_id is not None and run_id.startswith(container_id):
+                return run
+        return None
@@ -0,0 +1,51 @@
+"""
+  Run report written to run-report.json in each model run folder.
+"""
+
+import json
+import os
+
+RUN_REPORT_FILENAME = "run-report.json"
+
+
+def read_run_report(local_output_folder: str):
+    """
+    Description
+    -----------
+        Return the run report of a run folder, or an empty dict if the run has
+        none yet.
+    """
+
+    try:
+        with open(os.path.join(local_output_folder, RUN_REPORT_FILENAME), "r") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_run_report(local_output_folder: str, section: str, data):
+    """
+    Description
+    -----------
+        Set one section of the run report of a run folder, keeping the other
+        sections, and rewrite run-report.json.
+
+    Parameters
+    ----------
+        local_output_folder: str
+            Path to the model run folder.
+        section: str
+            Top-level key of the report e.g. "harvest".
+        data:
+            JSON serializable value of the section.
+
+    Returns
+    -------
+        dict: the updated report.
+    """
+
+    report = read_run_report(local_output_folder)
+    report[section] = data
+    with open(os.path.join(local_output_folder, RUN_REPORT_FILENAME), "w") as fh:
+        json.dump(report, fh, indent=4)
+    return report
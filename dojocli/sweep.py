@@ -0,0 +1,222 @@
+"""
+  Run a model over many parameter sets with a bounded pool of containers.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from itertools import product
+from time import perf_counter
+import csv
+import json
+import os
+import re
+
+
+def load_parameter_sets(filename: str):
+    """
+    Description
+    -----------
+        Read parameter sets from a .jsonl file (one JSON object per line) or a
+        .csv file (one parameter set per row, header row of parameter names).
+
+    Returns
+    -------
+        list of dicts of model parameters.
+    """
+
+    if filename.lower().endswith(".csv"):
+        with open(filename, "r", newline="") as fh:
+            return [dict(row) for row in csv.DictReader(fh)]
+
+    parameter_sets = []
+    with open(filename, "r") as fh:
+        for line_number, line in enumerate(fh, start=1):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            params = json.loads(line)
+            if not isinstance(params, dict):
+                raise ValueError(
+                    f"{filename} line {line_number} is not a JSON object of parameters."
+                )
+            parameter_sets.append(params)
+    return parameter_sets
+
+
+def grid_parameter_sets(grid_filename: str):
+    """
+    Description
+    -----------
+        Expand a grid spec into the cartesian product of its parameter values.
+        The grid spec is a JSON object mapping each parameter name to a list of
+        values, e.g. {"year": [2019, 2020], "month": ["01", "07"]} gives four
+        parameter sets. Scalar values are held fixed.
+
+    Returns
+    -------
+        list of dicts of model parameters.
+    """
+
+    with open(grid_filename, "r") as fh:
+        grid = json.load(fh)
+
+    names = list(grid.keys())
+    values = [v if isinstance(v, list) else [v] for v in grid.values()]
+    return [dict(zip(names, combination)) for combination in product(*values)]
+
+
+def run_sweep(
+    dojo_client,
+    model_name: str,
+    parameter_sets: list,
+    version: str = None,
+    sweep_folder: str = None,
+    workers: int = 2,
+    retries: int = 1,
+    pull_policy: str = "missing",
+    resources: dict = None,
+    reuse: bool = None,
+    force: bool = False,
+):
+    """
+    Description
+    -----------
+        Run every parameter set of a sweep across a pool of at most workers
+        concurrent containers. Model metadata, config templates and the image
+        pull are fetched once for the whole sweep. Each run is written to
+        {sweep_folder}/run-{index}; runs that fail are retried up to retries
+        more times, keeping the failed attempt folder as run-{index}-attempt{n}.
+        A sweep-manifest.json summarizing every run is written at the end.
+
+    Parameters
+    ----------
+        dojo_client: DojoClient
+            Client used for the dojo api calls.
+        model_name: str
+            Name of the model to run e.g. CHIRPS-Monthly
+        parameter_sets: list
+            List of dicts of model parameters, one per run.
+        version: str = None
+            The specific model_id (or "version") to run. Overrides model_name.
+        sweep_folder: str = None
+            Parent folder of the run folders. Defaults to
+            runs/{model}/{version}/sweep-{datetime}.
+        workers: int = 2
+            Maximum number of containers running at once.
+        retries: int = 1
+            Number of times a failed run is retried.
+        pull_policy: str = "missing"
+            When to pull the image; see DockerClient.ensure_image().
+        resources: dict = None
+            Container resource settings of every run; see
+            DojoClient.model_resources().
+        reuse: bool = None
+            Reuse the results of identical earlier runs; see
+            DojoClient.run_prepared_model().
+        force: bool = False
+            Run every parameter set even if an identical run is cached.
+
+    Returns
+    -------
+        dict manifest of the sweep.
+    """
+
+    run_context = dojo_client.prepare_run(
+        model_name, version, pull_policy=pull_policy, resources=resources
+    )
+    model_name = run_context["model_name"]
+    model_id = run_context["model_id"]
+
+    datetimestamp = datetime.today().strftime("%Y%m%d%H%M%S")
+    if sweep_folder is None:
+        sweep_folder = f"{os.getcwd()}/runs/{model_name}/{model_id}/sweep-{datetimestamp}"
+    os.makedirs(sweep_folder, exist_ok=True)
+
+    container_prefix = re.sub("[ \]\[,()_]", "", model_name.lower()).strip()
+    container_prefix = f"dojo-{container_prefix}{datetimestamp}"
+
+    def run_one(index: int, params: dict):
+        run_folder = f"{sweep_folder}/run-{index:04d}"
+        container_name = f"{container_prefix}-{index:04d}"
+        docker_client = dojo_client.get_docker_client()
+        result = {
+            "index": index,
+            "params": params,
+            "output_folder": run_folder,
+            "container_name": container_name,
+            "attempts": 0,
+            "exit_code": None,
+            "error": None,
+        }
+
+        start = perf_counter()
+        for attempt in range(1, retries + 2):
+            result["attempts"] = attempt
+            if attempt > 1:
+                # Keep the failed attempt and clear its container, if left behind.
+                if os.path.exists(run_folder):
+                    os.rename(run_folder, f"{run_folder}-attempt{attempt - 1}")
+                try:
+                    docker_client.remove_container(container_name, force=True)
+                except Exception:
+                    pass
+            try:
+                result["exit_code"] = dojo_client.run_prepared_model(
+                    run_context,
+                    params,
+                    run_folder,
+                    container_name,
+                    docker_client,
+                    quiet=True,
+                    reuse=reuse,
+                    force=force,
+                )
+                result["error"] = None
+            except Exception as e:
+                result["error"] = str(e)
+            if result["error"] is None and result["exit_code"] == 0:
+                break
+
+        result["status"] = "succeeded" if result["error"] is None and result["exit_code"] == 0 else "failed"
+        result["elapsed_seconds"] = round(perf_counter() - start, 3)
+        return result
+
+    dojo_client.echo(
+        f"\nRunning {len(parameter_sets)} parameter sets of {model_name} version {model_id} with {workers} concurrent containers ...\n"
+    )
+
+    start = perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_one, index, params)
+            for index, params in enumerate(parameter_sets, start=1)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            dojo_client.echo(
+                f"[{len(results)}/{len(parameter_sets)}] run-{result['index']:04d} {result['status']} (exit code {result['exit_code']}, {result['attempts']} attempt(s))"
+            )
+
+    results.sort(key=lambda r: r["index"])
+    manifest = {
+        "model_name": model_name,
+        "model_id": model_id,
+        "image": run_context["image_name"],
+        "sweep_folder": sweep_folder,
+        "started": datetimestamp,
+        "elapsed_seconds": round(perf_counter() - start, 3),
+        "workers": workers,
+        "retries": retries,
+        "succeeded": sum(1 for r in results if r["status"] == "succeeded"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "runs": results,
+    }
+    with open(f"{sweep_folder}/sweep-manifest.json", "w") as fh:
+        json.dump(manifest, fh, indent=4)
+
+    dojo_client.echo(
+        f'\nSweep completed: {manifest["succeeded"]} succeeded, {manifest["failed"]} failed.\nThe sweep manifest is located in "{sweep_folder}/sweep-manifest.json".'
+    )
+    return manifest
@@ -0,0 +1,244 @@
+"""
+  Run telemetry: phase timings and container resource sampling of model runs,
+  and their aggregation across run reports.
+"""
+
+from contextlib import contextmanager
+from dojocli.report import RUN_REPORT_FILENAME
+from threading import Event, Thread
+from time import perf_counter
+import json
+import math
+import os
+
+# Default seconds between container stats samples; 0 disables sampling.
+STATS_INTERVAL_DEFAULT = 1.0
+
+# Samples kept in a run report. Longer runs keep every other sample each time
+# the limit is reached, so the samples still span the whole run.
+MAX_STATS_SAMPLES = 720
+
+# Percentiles reported by aggregate_reports().
+REPORT_PERCENTILES = (50, 90, 99)
+
+
+class PhaseTimer(object):
+    """
+    Description
+    -----------
+        Wall clock time of the named phases of a model run e.g.
+
+            timer = PhaseTimer()
+            with timer.phase("metadata"):
+                ...
+
+        Time spent in a phase entered more than once is added up.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def as_dict(self):
+        return {name: round(seconds, 3) for name, seconds in self.phases.items()}
+
+
+class StatsSampler(object):
+    """
+    Description
+    -----------
+        Samples the CPU, memory, block I/O and network usage of a running
+        container from the Docker stats stream on a background thread, until
+        the container stops or stop() is called.
+
+    Parameters
+    ----------
+        interval: float = 1.0
+            Seconds between kept samples. The Docker stats stream produces
+            about one document per second, so shorter intervals keep every
+            document.
+    """
+
+    def __init__(self, interval: float = STATS_INTERVAL_DEFAULT):
+        self.interval = interval
+        self.samples = []
+        self.thread = None
+        self.stopped = Event()
+        self.error = None
+
+    def start(self, api_client, container):
+        self.thread = Thread(target=self.sample, args=(api_client, container), daemon=True)
+        self.thread.start()
+
+    def sample(self, api_client, container):
+        from dojocli.docker_client import parse_container_stats
+
+        start = perf_counter()
+        last = None
+        taken = 0
+        step = 1
+        try:
+            for count, stats in enumerate(
+                api_client.stats(container, stream=True, decode=True)
+            ):
+                if self.stopped.is_set():
+                    break
+                now = perf_counter()
+                # The first document has no previous cpu reading to compare.
+                if count == 0 or (last is not None and now - last < self.interval):
+                    continue
+                last = now
+                taken += 1
+                if taken % step != 0:
+                    continue
+
+                sample = parse_container_stats(stats)
+                sample["seconds"] = round(now - start, 3)
+                self.samples.append(sample)
+                if len(self.samples) >= MAX_STATS_SAMPLES:
+                    self.samples = self.samples[::2]
+                    step *= 2
+        except Exception as e:
+            # Sampling is best effort; it must never fail the run.
+            self.error = str(e)
+
+    def stop(self, timeout: float = 5.0):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def summary(self):
+        """
+        Description
+        -----------
+            Summarize the samples for the run report.
+
+        Returns
+        -------
+            dict of the sampling interval and sample count, cpu_percent mean
+            and max, memory_bytes mean and max, the final block I/O and
+            network byte counts, and the samples themselves.
+        """
+
+        samples = list(self.samples)
+        summary = {"interval": self.interval, "count": len(samples)}
+        if len(samples) > 0:
+            cpu = [s["cpu_percent"] for s in samples]
+            memory = [s["memory_bytes"] for s in samples]
+            summary.update(
+                {
+                    "cpu_percent_mean": round(sum(cpu) / len(cpu), 1),
+                    "cpu_percent_max": max(cpu),
+                    "memory_bytes_mean": int(sum(memory) / len(memory)),
+                    "memory_bytes_max": max(memory),
+                    "memory_limit_bytes": samples[-1]["memory_limit_bytes"],
+                    "block_read_bytes": samples[-1]["block_read_bytes"],
+                    "block_write_bytes": samples[-1]["block_write_bytes"],
+                    "net_rx_bytes": samples[-1]["net_rx_bytes"],
+                    "net_tx_bytes": samples[-1]["net_tx_bytes"],
+                }
+            )
+        if self.error is not None:
+            summary["error"] = self.error
+        summary["samples"] = samples
+        return summary
+
+
+def percentile(values: list, q: float):
+    """
+    Description
+    -----------
+        The q-th percentile of values, interpolating between the closest
+        ranks. Returns None for no values.
+    """
+
+    values = sorted(values)
+    if len(values) == 0:
+        return None
+    rank = (len(values) - 1) * q / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def find_run_reports(runs_folder: str):
+    """
+    Description
+    -----------
+        Read every run-report.json below runs_folder.
+
+    Returns
+    -------
+        list of (run folder, report dict).
+    """
+
+    reports = []
+    for folder, _, filenames in os.walk(runs_folder):
+        if RUN_REPORT_FILENAME in filenames:
+            try:
+                with open(os.path.join(folder, RUN_REPORT_FILENAME), "r") as fh:
+                    reports.append((folder, json.load(fh)))
+            except (OSError, ValueError):
+                continue
+    return reports
+
+
+def aggregate_reports(reports: list):
+    """
+    Description
+    -----------
+        Aggregate run reports per model: the run count, the number of failed
+        runs, and the REPORT_PERCENTILES and max of every phase timing, the
+        copy throughput, and the peak cpu and memory usage.
+
+    Parameters
+    ----------
+        reports: list
+            (run folder, report dict) as returned by find_run_reports().
+
+    Returns
+    -------
+        dict of {model name: {"runs": int, "failed": int, "metrics": {metric:
+        {"count", "p50", "p90", "p99", "max"}}}}.
+    """
+
+    values = {}
+    models = {}
+    for folder, report in reports:
+        run = report.get("run", {})
+        model_name = run.get("model_name") or "unknown"
+        model = models.setdefault(model_name, {"runs": 0, "failed": 0, "metrics": {}})
+        model["runs"] += 1
+        if run.get("exit_code") not in (None, 0):
+            model["failed"] += 1
+
+        metrics = values.setdefault(model_name, {})
+        for name, seconds in report.get("phases", {}).items():
+            metrics.setdefault(f"{name}_seconds", []).append(seconds)
+        if "harvest" in report:
+            metrics.setdefault("copy_mb_per_second", []).append(
+                report["harvest"].get("mb_per_second", 0.0)
+            )
+        stats = report.get("container_stats", {})
+        for key in ("cpu_percent_max", "memory_bytes_max"):
+            if stats.get(key) is not None:
+                metrics.setdefault(key, []).append(stats[key])
+
+    for model_name, metrics in values.items():
+        for metric, metric_values in sorted(metrics.items()):
+            summary = {"count": len(metric_values)}
+            for q in REPORT_PERCENTILES:
+                summary[f"p{q}"] = round(percentile(metric_values, q), 3)
+            summary["max"] = max(metric_values)
+            models[model_name]["metrics"][metric] = summary
+    return models
@@ -0,0 +1,89 @@
+"""
+  Compiled parameter substitution for model directives and config files.
+"""
+
+from dojocli.exceptions import TemplateError
+
+
+class ParameterTemplate(object):
+    """
+    Description
+    -----------
+        A directive or config file template compiled once from its content and
+        the parameter spans annotated in dojo, then rendered for any number of
+        parameter sets. Rendering is a single linear join of the literal text
+        between spans and the parameter values, instead of rebuilding the
+        whole string once per parameter.
+
+    Parameters
+    ----------
+        content: str
+            The template text.
+        parameters: list
+            Parameter annotations with "start" and "end" character offsets into
+            content, as returned by /dojo/directive and /dojo/config.
+
+    Raises
+    ------
+        TemplateError if a span is outside the content, or two spans overlap.
+    """
+
+    def __init__(self, content: str, parameters: list):
+        spans = sorted(parameters, key=lambda param: (param["start"], param["end"]))
+
+        self.literals = []
+        self.names = []
+        self.defaults = []
+        position = 0
+        for param in spans:
+            name = param["annotation"]["name"]
+            start, end = param["start"], param["end"]
+            if start < 0 or end < start or end > len(content):
+                raise TemplateError(
+                    f'Parameter "{name}" span {start}:{end} is outside the template of length {len(content)}.'
+                )
+            if start < position:
+                raise TemplateError(
+                    f'Parameter "{name}" span {start}:{end} overlaps "{self.names[-1]}" ending at {position}.'
+                )
+
+            self.literals.append(content[position:start])
+            self.names.append(name)
+            self.defaults.append(param["annotation"]["default_value"])
+            position = end
+        self.literals.append(content[position:])
+
+        self.parameter_names = frozenset(self.names)
+
+    def render(self, values: dict, strict: bool = False):
+        """
+        Description
+        -----------
+            Substitute parameter values into the template. Parameters missing
+            from values fall back to their default value.
+
+        Parameters
+        ----------
+            values: dict
+                Parameter values keyed by parameter name.
+            strict: bool = False
+                Raise TemplateError if values has names that are not
+                parameters of this template.
+
+        Returns
+        -------
+            The rendered text.
+        """
+
+        if strict:
+            unknown = set(values) - self.parameter_names
+            if len(unknown) > 0:
+                raise TemplateError(
+                    f"Unknown parameter(s): {', '.join(sorted(unknown))}."
+                )
+
+        parts = [self.literals[0]]
+        for name, default, literal in zip(self.names, self.defaults, self.literals[1:]):
+            parts.append(str(values[name] if name in values else default))
+            parts.append(literal)
+        return "".join(parts)
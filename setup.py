@@ -39,6 +39,7 @@ setup(
     },
     #setup_requires=["numpy>=1.20.1"],  # This is not working as expected
     install_requires=install_requirements,
+    extras_require={"zstd": ["zstandard>=0.15"]},
     license="MIT license",
     long_description=readme + "\n\n" + history,
     long_description_content_type="text/markdown",
@@ -0,0 +1,159 @@
+"""
+  Round trips of the output bundles through the standard readers.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import tarfile
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+from dojocli.bundle import BUNDLE_MANIFEST_FILENAME, OutputBundle, crc32_combine
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def make_files(count: int = 24, seed: int = 7):
+    """
+    Description
+    -----------
+        {name: content} of files of varied sizes: empty, shorter and longer
+        than a tar block, a multiple of it, and over the bundle buffer size.
+    """
+
+    rng = random.Random(seed)
+    sizes = [0, 1, 511, 512, 513, 10_000, 1024 * 1024 + 3] + [rng.randrange(0, 200_000) for _ in range(count)]
+    files = {}
+    for index, size in enumerate(sizes):
+        # Half random, half repetitive, so the deflate streams hold both
+        # stored and compressed blocks.
+        content = rng.randbytes(size // 2) + bytes([index % 256]) * (size - size // 2)
+        files[f"output/file-{index:03d}.bin"] = content
+    return files
+
+
+class BundleRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = self.tempdir.name
+        self.files = make_files()
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def write_bundle(self, bundle_format: str, workers: int = 4):
+        bundle = OutputBundle(
+            os.path.join(self.root, f"outputs.{bundle_format}"), bundle_format, self.root
+        )
+
+        def add(item):
+            name, content = item
+            member = tarfile.TarInfo(os.path.basename(name))
+            member.size = len(content)
+            member.mode = 0o644
+            member.mtime = 0
+            return bundle.add_file(os.path.join(self.root, name), member, io.BytesIO(content))
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            digests = list(executor.map(add, self.files.items()))
+        for (name, content), digest in zip(self.files.items(), digests):
+            self.assertEqual(digest, hashlib.sha256(content).hexdigest(), name)
+        return bundle, bundle.close()
+
+    def check_members(self, members: dict, manifest: dict):
+        self.assertEqual(
+            {name: content for name, content in members.items() if name != BUNDLE_MANIFEST_FILENAME},
+            self.files,
+        )
+        self.assertEqual(json.loads(members[BUNDLE_MANIFEST_FILENAME])["files"], manifest["files"])
+        self.assertEqual(
+            {f["path"]: f["sha256"] for f in manifest["files"]},
+            {name: hashlib.sha256(content).hexdigest() for name, content in self.files.items()},
+        )
+
+    def test_crc32_combine(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            first = rng.randbytes(rng.randrange(0, 5000))
+            second = rng.randbytes(rng.randrange(0, 5000))
+            self.assertEqual(
+                crc32_combine(zlib.crc32(first), zlib.crc32(second), len(second)),
+                zlib.crc32(first + second),
+            )
+
+    def test_tar_gz_parallel(self):
+        bundle, manifest = self.write_bundle("tar.gz", workers=4)
+
+        # One gzip member whose trailer checks the crc and size of the tar.
+        with gzip.open(bundle.path, "rb") as fh:
+            tar_bytes = fh.read()
+        self.assertEqual(len(tar_bytes) % tarfile.RECORDSIZE, 0)
+
+        with tarfile.open(bundle.path, "r:gz") as tar:
+            members = {member.name: tar.extractfile(member).read() for member in tar}
+        self.check_members(members, manifest)
+
+        # The stream mode reader of e.g. "tar xz" from a pipe.
+        with open(bundle.path, "rb") as fh:
+            with tarfile.open(fileobj=fh, mode="r|gz") as tar:
+                streamed = {member.name: tar.extractfile(member).read() for member in tar}
+        self.assertEqual(streamed, members)
+
+    def test_zip(self):
+        bundle, manifest = self.write_bundle("zip")
+        with zipfile.ZipFile(bundle.path) as archive:
+            self.assertIsNone(archive.testzip())
+            members = {name: archive.read(name) for name in archive.namelist()}
+        self.check_members(members, manifest)
+
+    def test_zip64(self):
+        # Lower the zip64 threshold rather than write 4 GB files.
+        with mock.patch("zipfile.ZIP64_LIMIT", 1000):
+            bundle, manifest = self.write_bundle("zip")
+        with zipfile.ZipFile(bundle.path) as archive:
+            self.assertIsNone(archive.testzip())
+            large = [info for info in archive.infolist() if info.file_size > 1000]
+            self.assertTrue(len(large) > 0)
+            for info in large:
+                # The zip64 extra field, header id 0x0001.
+                self.assertEqual(info.extra[:2], b"\x01\x00", info.filename)
+            members = {name: archive.read(name) for name in archive.namelist()}
+        self.check_members(members, manifest)
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_tar_zst(self):
+        bundle, manifest = self.write_bundle("tar.zst")
+        with open(bundle.path, "rb") as fh:
+            reader = zstandard.ZstdDecompressor().stream_reader(fh)
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                members = {member.name: tar.extractfile(member).read() for member in tar}
+        self.check_members(members, manifest)
+
+    def test_add_local_file(self):
+        path = os.path.join(self.root, "output", "local.csv")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "wb") as fh:
+            fh.write(b"a,b\n1,2\n")
+        self.files = {"output/local.csv": b"a,b\n1,2\n"}
+
+        bundle = OutputBundle(os.path.join(self.root, "outputs.tar.gz"), "tar.gz", self.root)
+        bundle.add_local_file(path)
+        manifest = bundle.close()
+        with tarfile.open(bundle.path, "r:gz") as tar:
+            members = {member.name: tar.extractfile(member).read() for member in tar}
+        self.check_members(members, manifest)
+
+
+if __name__ == "__main__":
+    unittest.main()